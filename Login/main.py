@@ -4,21 +4,37 @@ Login system with dashboard for accessing multiple tools
 """
 
 from fastapi import FastAPI, Request, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 import uvicorn
+import logging
 import os
 import sys
 
 # Add parent directory to path for importing apps
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Metriche, logging e tracing condivisi con l'app SEO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "apps", "seo_content_agent"))
+
+from seo_agent.utils.metrics import CONTENT_TYPE, REGISTRY, http_metrics_middleware
+from seo_agent.utils.logs import configure_logging
+from seo_agent.utils.tracing import configure_tracing, current_traceparent, tracing_middleware
+
+configure_logging("login")
+configure_tracing("login")
+logger = logging.getLogger("login")
 
 app = FastAPI(title="Stratego Swiss Knife")
+app.middleware("http")(http_metrics_middleware())
+app.middleware("http")(tracing_middleware())
 
 # Session middleware for authentication
-app.add_middleware(SessionMiddleware, secret_key="stratego-swiss-knife-secret-2024")
+# Le app sullo stesso host (es. SEO Content Agent) leggono l'utente dallo stesso
+# cookie: STRATEGO_SESSION_SECRET deve essere uguale in tutte
+SESSION_SECRET = os.getenv("STRATEGO_SESSION_SECRET", "stratego-swiss-knife-secret-2024")
+app.add_middleware(SessionMiddleware, secret_key=SESSION_SECRET)
 
 # Templates
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
@@ -84,8 +100,10 @@ async def login(request: Request, username: str = Form(...), password: str = For
     """Process login"""
     if username in VALID_CREDENTIALS and VALID_CREDENTIALS[username] == password:
         request.session["user"] = username
+        logger.info("🔐 Login riuscito", extra={"username": username})
         return RedirectResponse(url="/dashboard", status_code=302)
     
+    logger.warning("🔐 Login fallito", extra={"username": username})
     return templates.TemplateResponse("login.html", {
         "request": request, 
         "error": "Credenziali non valide"
@@ -122,11 +140,15 @@ async def seo_app_redirect(request: Request):
     user = get_current_user(request)
     if not user:
         return RedirectResponse(url="/", status_code=302)
-    # L'app SEO gira sulla porta 8001
+    # L'app SEO gira sulla porta 8001; il traceparent lega la pagina dell'iframe a questa richiesta
+    app_url = "http://localhost:8001"
+    traceparent = current_traceparent()
+    if traceparent:
+        app_url += f"?traceparent={traceparent}"
     return templates.TemplateResponse("app_frame.html", {
         "request": request,
         "user": user,
-        "app_url": "http://localhost:8001",
+        "app_url": app_url,
         "app_name": "SEO Content Agent"
     })
 
@@ -171,6 +193,12 @@ async def update_version(
     raise HTTPException(status_code=404, detail="App non trovata")
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Durata delle richieste HTTP per route nel formato di Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 # ==================== MAIN ====================
 
 if __name__ == "__main__":
@@ -12,7 +12,8 @@ from dotenv import load_dotenv
 load_dotenv()
 sys.path.insert(0, str(Path(__file__).parent))
 
-from seo_agent.agent import SEOContentAgent, CategoryInput
+from seo_agent.agent import CategoryInput
+from seo_agent.registry import get_agent
 from seo_agent.utils.csv_loader import load_seozoom_csv
 
 # Configurazione pagina
@@ -542,7 +543,8 @@ with col_right:
             
             with st.spinner("Generazione in corso..."):
                 try:
-                    agent = SEOContentAgent(
+                    # Agente condiviso dal registry: nessun nuovo client a ogni click
+                    agent = get_agent(
                         api_key=api_key,
                         model=model
                     )
@@ -2,6 +2,10 @@
 """
 Script principale per eseguire il SEO Content Agent
 Genera contenuti SEO per pagine di categoria e-commerce
+
+Uso:
+    python main.py                       # esempio con una categoria
+    python main.py batch manifest.csv    # generazione in blocco (vedi seo_agent/batch.py)
 """
 
 import os
@@ -11,7 +15,8 @@ from pathlib import Path
 # Aggiungi il path del progetto
 sys.path.insert(0, str(Path(__file__).parent))
 
-from seo_agent.agent import SEOContentAgent, CategoryInput
+from seo_agent.agent import CategoryInput
+from seo_agent.registry import get_agent
 
 
 def main():
@@ -56,7 +61,7 @@ def main():
     
     try:
         # Crea l'agente
-        agent = SEOContentAgent(
+        agent = get_agent(
             api_key=api_key,
             model="gpt-4o-mini"  # Puoi cambiare con "gpt-4o" per risultati migliori
         )
@@ -91,4 +96,13 @@ def main():
 
 
 if __name__ == "__main__":
+    import logging
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from seo_agent.batch import main as batch_main
+        
+        logging.basicConfig(level=logging.INFO)
+        sys.exit(batch_main(sys.argv[2:]))
+    # I messaggi di avanzamento dell'agente passano dal logging
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     main()
@@ -4,17 +4,60 @@ Utilizza Datapizza AI per analizzare keyword e generare testi ottimizzati
 """
 
 import os
-import re
+import asyncio
+import logging
 from pathlib import Path
-from dataclasses import dataclass, field
-from typing import List
+from dataclasses import dataclass, field, replace
+from typing import AsyncIterator, Callable, List, Optional, Tuple
 
 from datapizza.agents import Agent
 from datapizza.clients.openai import OpenAIClient
 
-from .prompts.system_prompt import SYSTEM_PROMPT, build_user_prompt
-from .utils.csv_loader import load_seozoom_csv
-from .utils.serp_scraper import scrape_serp, format_serp_for_prompt
+from .prompts.system_prompt import (
+    SYSTEM_PROMPT,
+    SECTION_SYSTEM_PROMPT,
+    FIELD_FIX_SYSTEM_PROMPT,
+    build_user_prompt,
+    build_outline_prompt,
+    build_section_prompt,
+    build_field_fix_prompt
+)
+from .utils.csv_loader import KeywordData, load_seozoom_csv
+from .utils.serp_scraper import scrape_serp_async, format_serp_for_prompt
+from .utils.concurrency import run_blocking
+from .utils.pipeline import Pipeline
+from .utils.deadline import MIN_STAGE_SECONDS, Deadline, DeadlineExceeded
+from .utils.serp_cache import SerpCache, default_serp_cache
+from .utils.llm_cache import LLMCache, default_cache
+from .utils.usage import TokenUsage, usage_from_response
+from .utils.metrics import stage_timer
+from .utils.markdown_parser import MarkdownOutputParser, parse_markdown
+from .utils.hedging import HedgePolicy, default_hedge_policy, hedged_call, hedged_stream
+from .utils.resilience import ProviderUnavailable, Resilience, default_resilience, estimate_tokens
+from .utils.usage_ledger import set_usage_context
+from .utils.scoring import PENALTIES, rank_candidates, score_content, validate_content
+from .utils.sections import field_text, patch_field
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+# Campi correggibili con una chiamata mirata (oltre ai singoli H2, "h2-N")
+REPAIRABLE_FIELDS = ("meta_title", "meta_description", "h1", "intro", "faq")
+SINGLE_LINE_FIELDS = ("meta_title", "meta_description", "h1")
+
+
+def _clean_fix(field_name: str, text: str) -> str:
+    """Ripulisce la risposta di una correzione: code fence, etichette, virgolette"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = "\n".join(line for line in text.split("\n") if not line.startswith("```")).strip()
+    if field_name not in SINGLE_LINE_FIELDS:
+        return text
+    line = next((l for l in text.split("\n") if l.strip()), "")
+    for label in ("Meta Title:", "Meta Description:", "H1:"):
+        line = line.replace(f"**{label}**", "").replace(label, "")
+    return line.strip().lstrip("#").strip().strip('*"«»“”').strip()
 
 
 @dataclass
@@ -24,6 +67,7 @@ class CategoryInput:
     site_products: List[str] = field(default_factory=list)
     parent_url: str = ""  # URL categoria padre per internal linking
     parent_name: str = ""  # Nome categoria padre
+    products_url: str = ""  # Pagina categoria da cui estrarre i prodotti durante la generazione
 
 
 @dataclass
@@ -37,6 +81,77 @@ class SEOOutput:
     faq: List[dict] = field(default_factory=list)
     seo_keywords: List[str] = field(default_factory=list)
     serp_data: List[dict] = field(default_factory=list)
+    cache_hit: bool = False  # True se la risposta del modello viene dalla cache
+    usage: TokenUsage = field(default_factory=TokenUsage)  # Token consumati (zero se da cache)
+    quality: dict = field(default_factory=dict)  # Punteggio del candidato scelto (modalità candidati)
+    timings: dict = field(default_factory=dict)  # Tempi per fase e percorso critico (Pipeline.report)
+    degradations: List[dict] = field(default_factory=list)  # Fasi degradate per rispettare la deadline
+
+
+@dataclass
+class PageOutline:
+    """Schema della pagina prodotto dalla prima chiamata in modalità parallela"""
+    meta_title: str = ""
+    meta_description: str = ""
+    h1: str = ""
+    h2: List[str] = field(default_factory=list)
+    faq: List[str] = field(default_factory=list)
+    seo_keywords: str = ""
+    
+    def as_text(self) -> str:
+        return "\n".join([f"H1: {self.h1}"] + [f"H2: {h2}" for h2 in self.h2])
+
+
+def parse_outline(text: str) -> PageOutline:
+    """
+    Legge lo schema "Voce: valore" restituito dal modello.
+    Accetta anche intestazioni Markdown (# / ##) e domande in grassetto.
+    """
+    outline = PageOutline()
+    for raw in text.split("\n"):
+        line = raw.strip().replace("**", "")
+        label, _, value = line.partition(":")
+        label = label.strip().lstrip("-* ").lower()
+        value = value.strip()
+        if label == "meta title":
+            outline.meta_title = value
+        elif label == "meta description":
+            outline.meta_description = value
+        elif label == "h1" or (line.startswith("# ") and not outline.h1):
+            outline.h1 = value if label == "h1" else line[2:].strip()
+        elif label == "h2" or line.startswith("## "):
+            h2 = value if label == "h2" else line[3:].strip()
+            if h2 and "Domande Frequenti" not in h2 and "FAQ" not in h2:
+                outline.h2.append(h2)
+        elif label == "faq" and value:
+            outline.faq.append(value)
+        elif raw.strip().startswith("**") and line.endswith("?"):
+            outline.faq.append(line)
+        elif label == "seo keywords":
+            outline.seo_keywords = value
+    return outline
+
+
+def assemble_markdown(outline: PageOutline, intro: str, bodies: List[str], faq_text: str) -> str:
+    """Compone le parti generate in parallelo nel formato Markdown del system prompt"""
+    parts = [
+        f"**Meta Title:** {outline.meta_title}",
+        f"**Meta Description:** {outline.meta_description}",
+        "",
+        "---",
+        "",
+        f"# {outline.h1}",
+        "",
+        intro.strip(),
+        ""
+    ]
+    for h2, body in zip(outline.h2, bodies):
+        parts += [f"## {h2}", "", body.strip(), ""]
+    if faq_text.strip():
+        parts += ["---", "", "## Domande Frequenti", "", faq_text.strip(), ""]
+    if outline.seo_keywords:
+        parts += ["---", "", f"**SEO Keywords:** {outline.seo_keywords}"]
+    return "\n".join(parts) + "\n"
 
 
 class SEOContentAgent:
@@ -54,9 +169,25 @@ class SEOContentAgent:
     def __init__(
         self,
         api_key: str = None,
-        model: str = "gpt-4o-mini"
+        model: str = "gpt-4o-mini",
+        system_prompt: str = SYSTEM_PROMPT,
+        cache: Optional[LLMCache] = None,
+        hedge: Optional[HedgePolicy] = None,
+        resilience: Optional[Resilience] = None,
+        serp_cache: Optional[SerpCache] = None
     ):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.model = model
+        self.system_prompt = system_prompt
+        # Cache delle risposte (opzionale, abilitata con SEO_AGENT_LLM_CACHE=1)
+        self.cache = cache or default_cache()
+        # Richieste di riserva sulle chiamate lente (opzionale, SEO_AGENT_HEDGE=1)
+        self.hedge = hedge or default_hedge_policy()
+        self._hedge_client = None
+        # Retry, rate limit condiviso e circuit breaker su ogni chiamata al modello
+        self.resilience = resilience or default_resilience()
+        # Risultati SERP su disco, usati anche come ripiego se la ricerca non risponde
+        self.serp_cache = serp_cache or default_serp_cache()
         
         if not self.api_key:
             raise ValueError(
@@ -66,21 +197,27 @@ class SEOContentAgent:
         
         self.client = OpenAIClient(
             api_key=self.api_key,
-            model=model
+            model=model,
+            # I retry sono gestiti da utils.resilience (backoff condiviso, circuit breaker)
+            max_retries=0
         )
         
         self.agent = Agent(
             name="seo_content_strategist",
             client=self.client,
-            system_prompt=SYSTEM_PROMPT
+            system_prompt=self.system_prompt
         )
     
     def generate_category_content(
         self,
-        csv_path: str,
+        csv_path: Optional[str],
         category_input: CategoryInput,
         scrape_serp_results: bool = True,
-        serp_keywords: List[str] = None
+        serp_keywords: List[str] = None,
+        keywords: List[KeywordData] = None,
+        on_stage: Callable[[str], None] = None,
+        use_cache: bool = True,
+        deadline: Optional[Deadline] = None
     ) -> SEOOutput:
         """
         Genera contenuto SEO per una pagina di categoria.
@@ -90,63 +227,832 @@ class SEOContentAgent:
             category_input: Dati della categoria
             scrape_serp_results: Se True, esegue scraping SERP automatico
             serp_keywords: Lista di keyword per lo scraping SERP (opzionale)
+            keywords: Keyword già caricate; se fornite il CSV non viene riletto
+            on_stage: Callback invocata all'inizio di ogni fase
+                (csv, serp, products, llm, parse) per il tracciamento del progresso
+            use_cache: Se False ignora la cache LLM e rigenera (aggiornandola)
+            deadline: Budget di latenza; qui limita solo le fasi di raccolta dati,
+                che degradano invece di fallire (dettagli in output.degradations)
             
         Returns:
             SEOOutput con il contenuto generato
-        """
-        # Carica keyword dal CSV
-        keywords = load_seozoom_csv(csv_path)
-        queries = [kw.keyword for kw in keywords]
         
-        # Scraping SERP automatico
-        serp_data = []
-        if scrape_serp_results:
-            # Usa le keyword selezionate dall'utente, altrimenti la keyword principale
-            keywords_to_scrape = serp_keywords if serp_keywords else [category_input.keyword]
-            print(f"🔍 Scraping SERP per {len(keywords_to_scrape)} keyword...")
-            
-            for kw in keywords_to_scrape[:5]:  # Max 5 keyword per evitare rate limiting
-                print(f"  → Scraping: {kw}")
-                results = scrape_serp(kw, num_results=10)  # Aumentato a 10 per keyword
-                formatted = format_serp_for_prompt(results)
-                
-                # Log dei risultati trovati
-                for r in formatted:
-                    print(f"     📄 {r.get('title', '')[:50]}...")
-                    print(f"        URL: {r.get('url', '')[:60]}")
-                
-                serp_data.extend(formatted)
-            
-            # Rimuovi duplicati basati su URL
-            seen_urls = set()
-            unique_serp = []
-            for item in serp_data:
-                if item.get('url') not in seen_urls:
-                    seen_urls.add(item.get('url'))
-                    unique_serp.append(item)
-            serp_data = unique_serp[:20]  # Aumentato a 20 risultati totali
-            print(f"✅ Trovati {len(serp_data)} risultati SERP unici (su {len(seen_urls)} totali)")
+        Le fasi di raccolta dati (CSV, SERP, prodotti) girano in parallelo in
+        un event loop dedicato: da codice asincrono usare agenerate_category_content.
+        """
+        deadline = deadline or Deadline(None)
+        set_usage_context(category=category_input.keyword)
+        pipeline = self._input_pipeline(
+            csv_path, category_input, scrape_serp_results, serp_keywords, keywords, deadline, on_stage
+        )
+        data = registry.run(pipeline.run())
+        queries = data["csv"]
+        serp_data = data.get("serp", [])
+        category_input = data.get("products", category_input)
         
         # Costruisci il prompt utente
-        user_prompt = build_user_prompt(
-            keyword=category_input.keyword,
-            site_products=category_input.site_products,
-            queries=queries,
-            serp_data=serp_data,
-            parent_url=category_input.parent_url,
-            parent_name=category_input.parent_name
-        )
+        user_prompt = self._build_prompt(category_input, queries, serp_data)
         
         # Esegui l'agente
-        print("🤖 Generazione contenuto SEO...")
-        response = self.agent.run(user_prompt)
+        with pipeline.timed("llm", deps=tuple(data)):
+            logger.info("🤖 Generazione contenuto SEO...")
+            text, usage, cache_hit = self._run_model(user_prompt, use_cache)
         
         # Parsing output
-        return self._parse_markdown_output(
-            content=response.text,
-            keywords=queries[:15],
-            serp_data=serp_data
+        with pipeline.timed("parse", deps=("llm",)):
+            output = self._parse_markdown_output(
+                content=text,
+                keywords=queries[:15],
+                serp_data=serp_data
+            )
+        output.cache_hit = cache_hit
+        output.usage = usage
+        output.timings = pipeline.report()
+        output.degradations = list(deadline.degradations)
+        return output
+    
+    async def agenerate_category_content(
+        self,
+        csv_path: Optional[str],
+        category_input: CategoryInput,
+        scrape_serp_results: bool = True,
+        serp_keywords: List[str] = None,
+        keywords: List[KeywordData] = None,
+        on_stage: Callable[[str], None] = None,
+        use_cache: bool = True,
+        parallel: bool = False,
+        candidates: int = 1,
+        repair: bool = False,
+        deadline: Optional[Deadline] = None
+    ) -> SEOOutput:
+        """
+        Versione asincrona di generate_category_content.
+        
+        Parsing CSV e parsing dell'output girano nel pool di thread condiviso
+        e la chiamata al modello usa il client asincrono: l'event loop non
+        viene mai bloccato. Le fasi di raccolta dati (keyword dal CSV, ricerche
+        SERP e, se category_input.products_url, scraping dei prodotti) sono
+        indipendenti e partono insieme: tempi per fase e percorso critico
+        sono in output.timings.
+        
+        Con parallel=True una prima chiamata breve produce lo schema (meta,
+        H1, H2, domande FAQ) e i testi delle sezioni vengono generati in
+        parallelo: la latenza dipende dalla sezione più lunga, non dalla pagina.
+        
+        Con candidates > 1 (solo chiamata singola) vengono generati più
+        candidati in un'unica richiesta e restituito il migliore secondo le
+        regole del system prompt (dettagli in output.quality).
+        
+        Con repair=True i campi che violano le regole (meta title troppo lungo,
+        link mancante nell'intro, ...) vengono riscritti con chiamate brevi
+        e mirate e reinseriti nel contenuto, senza rigenerare la pagina.
+        
+        Con una deadline SERP e scraping dei prodotti hanno una quota del
+        budget e degradano se la sforano (output.degradations), la correzione
+        dei campi viene saltata se il tempo non basta e la generazione usa il
+        tempo rimanente, oltre il quale solleva DeadlineExceeded.
+        """
+        deadline = deadline or Deadline(None)
+        set_usage_context(category=category_input.keyword)
+        pipeline = self._input_pipeline(
+            csv_path, category_input, scrape_serp_results, serp_keywords, keywords, deadline, on_stage
+        )
+        data = await pipeline.run()
+        queries = data["csv"]
+        serp_data = data.get("serp", [])
+        category_input = data.get("products", category_input)
+        
+        user_prompt = self._build_prompt(category_input, queries, serp_data)
+        
+        quality = {}
+        with pipeline.timed("llm", deps=tuple(data)):
+            if parallel:
+                text, usage, cache_hit = await deadline.run("llm", self._agenerate_parallel(
+                    category_input, queries, serp_data, use_cache
+                ))
+            elif candidates > 1:
+                text, usage, cache_hit, quality = await deadline.run("llm", self._agenerate_candidates(
+                    user_prompt, candidates, category_input, queries, use_cache
+                ))
+            else:
+                logger.info("🤖 Generazione contenuto SEO...")
+                text, usage, cache_hit = await deadline.run("llm", self._arun_model(user_prompt, use_cache))
+        
+        last = "llm"
+        if repair:
+            with pipeline.timed("repair", deps=(last,)):
+                text, repair_usage, repair_quality = await self._arepair_within(
+                    text, category_input, queries, use_cache, deadline
+                )
+            usage = usage + repair_usage
+            quality = dict(quality, **repair_quality)
+            last = "repair"
+        
+        with pipeline.timed("parse", deps=(last,)):
+            output = await run_blocking(
+                self._parse_markdown_output,
+                content=text,
+                keywords=queries[:15],
+                serp_data=serp_data
+            )
+        output.cache_hit = cache_hit
+        output.usage = usage
+        output.quality = quality
+        output.timings = pipeline.report()
+        output.degradations = list(deadline.degradations)
+        return output
+    
+    async def astream_category_content(
+        self,
+        csv_path: Optional[str],
+        category_input: CategoryInput,
+        scrape_serp_results: bool = True,
+        serp_keywords: List[str] = None,
+        keywords: List[KeywordData] = None,
+        use_cache: bool = True,
+        parallel: bool = False,
+        candidates: int = 1,
+        repair: bool = False,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Genera il contenuto in streaming.
+        
+        Con parallel=True le sezioni sono generate in parallelo e il testo
+        composto arriva in un unico evento "token"; lo stesso con
+        candidates > 1, dove arriva solo il candidato migliore.
+        
+        Yields:
+            Eventi dict con chiave "event":
+            - "stage": inizio di una fase (csv, serp, products, llm, repair, parse);
+              le fasi di raccolta dati partono insieme
+            - "token": frammento di testo appena prodotto dal modello
+            - "meta_title", "meta_description", "h1", "h2", "faq": campo completato
+            - "done": SEOOutput finale in "output"
+        """
+        deadline = deadline or Deadline(None)
+        set_usage_context(category=category_input.keyword)
+        pipeline = self._input_pipeline(
+            csv_path, category_input, scrape_serp_results, serp_keywords, keywords, deadline
         )
+        for stage in self.INPUT_STAGES:
+            if stage in pipeline:
+                yield {"event": "stage", "stage": stage}
+        data = await pipeline.run()
+        queries = data["csv"]
+        serp_data = data.get("serp", [])
+        category_input = data.get("products", category_input)
+        
+        user_prompt = self._build_prompt(category_input, queries, serp_data)
+        
+        yield {"event": "stage", "stage": "llm"}
+        with pipeline.timed("llm", deps=tuple(data)):
+            tracker = MarkdownOutputParser()
+            chunks = []
+            single = not parallel and candidates <= 1
+            cache_key = self._cache_key(user_prompt) if single else None
+            cached = await run_blocking(self.cache.get, cache_key) if cache_key and use_cache else None
+            usage = TokenUsage()
+            cache_hit = cached is not None
+            quality = {}
+            
+            if cached or not single:
+                if cached:
+                    logger.info("⚡ Risposta dalla cache LLM")
+                    text = cached.text
+                elif parallel:
+                    text, usage, cache_hit = await deadline.run("llm", self._agenerate_parallel(
+                        category_input, queries, serp_data, use_cache
+                    ))
+                else:
+                    text, usage, cache_hit, quality = await deadline.run("llm", self._agenerate_candidates(
+                        user_prompt, candidates, category_input, queries, use_cache
+                    ))
+                chunks.append(text)
+                yield {"event": "token", "text": text}
+                for field_name, value in tracker.feed(text):
+                    yield {"event": field_name, "value": value}
+            else:
+                logger.info("🤖 Generazione contenuto SEO (streaming)...")
+                last_chunk = None
+                async for chunk in deadline.stream("llm", self._astream_model(user_prompt)):
+                    last_chunk = chunk
+                    delta = chunk.delta or ""
+                    if not delta:
+                        continue
+                    chunks.append(delta)
+                    yield {"event": "token", "text": delta}
+                    for field_name, value in tracker.feed(delta):
+                        yield {"event": field_name, "value": value}
+                usage = usage_from_response(last_chunk)
+                if cache_key:
+                    await run_blocking(self.cache.put, cache_key, "".join(chunks), usage)
+            for field_name, value in tracker.close():
+                yield {"event": field_name, "value": value}
+        
+        text = "".join(chunks)
+        repaired = False
+        last = "llm"
+        if repair:
+            yield {"event": "stage", "stage": "repair"}
+            with pipeline.timed("repair", deps=(last,)):
+                text, repair_usage, repair_quality = await self._arepair_within(
+                    text, category_input, queries, use_cache, deadline
+                )
+            usage = usage + repair_usage
+            quality = dict(quality, **repair_quality)
+            repaired = bool(repair_quality.get("repaired"))
+            last = "repair"
+        
+        yield {"event": "stage", "stage": "parse"}
+        with pipeline.timed("parse", deps=(last,)):
+            if repaired:
+                output = await run_blocking(
+                    self._parse_markdown_output, content=text, keywords=queries[:15], serp_data=serp_data
+                )
+            else:
+                # Il parser ha già consumato lo stream: nessuna seconda passata sul testo
+                output = self._build_output(tracker, text, queries[:15], serp_data)
+        output.cache_hit = cache_hit
+        output.usage = usage
+        output.quality = quality
+        output.timings = pipeline.report()
+        output.degradations = list(deadline.degradations)
+        yield {"event": "done", "output": output}
+    
+    def _cache_key(self, user_prompt: str) -> Optional[str]:
+        """Chiave della cache LLM per il prompt, o None se la cache è disabilitata"""
+        if self.cache is None:
+            return None
+        return LLMCache.make_key(self.model, self.system_prompt, user_prompt)
+    
+    def _run_model(self, user_prompt: str, use_cache: bool = True) -> Tuple[str, TokenUsage, bool]:
+        """
+        Chiamata al modello con cache opzionale.
+        
+        Returns:
+            (testo generato, token consumati, True se servito dalla cache)
+        """
+        cache_key = self._cache_key(user_prompt)
+        if cache_key and use_cache:
+            cached = self.cache.get(cache_key)
+            if cached:
+                logger.info("⚡ Risposta dalla cache LLM")
+                return cached.text, TokenUsage(), True
+        
+        response = self.resilience.call_blocking(
+            lambda: self.agent.run(user_prompt),
+            estimate_tokens(self.system_prompt, user_prompt),
+            model=self.model
+        )
+        usage = usage_from_response(response)
+        if cache_key:
+            self.cache.put(cache_key, response.text, usage)
+        return response.text, usage, False
+    
+    async def _arun_model(self, user_prompt: str, use_cache: bool = True) -> Tuple[str, TokenUsage, bool]:
+        """Versione asincrona di _run_model"""
+        cache_key = self._cache_key(user_prompt)
+        if cache_key and use_cache:
+            cached = await run_blocking(self.cache.get, cache_key)
+            if cached:
+                logger.info("⚡ Risposta dalla cache LLM")
+                return cached.text, TokenUsage(), True
+        
+        estimate = estimate_tokens(self.system_prompt, user_prompt)
+        primary = lambda: self.resilience.call(
+            lambda: self.agent.a_run(user_prompt), estimate, model=self.model
+        )
+        if self.hedge is None:
+            response = await primary()
+        else:
+            response, _ = await hedged_call(
+                primary,
+                lambda: self.resilience.call(
+                    lambda: self._backup_client().a_invoke(user_prompt, system_prompt=self.system_prompt),
+                    estimate,
+                    model=self._backup_model()
+                ),
+                self.hedge,
+                f"{self.model}:run"
+            )
+        usage = usage_from_response(response)
+        if cache_key:
+            await run_blocking(self.cache.put, cache_key, response.text, usage)
+        return response.text, usage, False
+    
+    def _backup_model(self) -> str:
+        """Modello delle richieste di riserva (modello di hedging o lo stesso modello)"""
+        return self.hedge.hedge_model or self.model
+    
+    def _backup_client(self) -> OpenAIClient:
+        """Client delle richieste di riserva"""
+        if self._hedge_client is None:
+            self._hedge_client = OpenAIClient(
+                api_key=self.api_key,
+                model=self._backup_model(),
+                max_retries=0
+            )
+        return self._hedge_client
+    
+    def _astream_model(self, user_prompt: str):
+        """Stream della risposta, con hedging sul primo token se abilitato"""
+        estimate = estimate_tokens(self.system_prompt, user_prompt)
+        primary = lambda: self.resilience.stream(
+            lambda: self.client.a_stream_invoke(user_prompt, system_prompt=self.system_prompt),
+            estimate,
+            model=self.model
+        )
+        if self.hedge is None:
+            return primary()
+        return hedged_stream(
+            primary,
+            lambda: self.resilience.stream(
+                lambda: self._backup_client().a_stream_invoke(user_prompt, system_prompt=self.system_prompt),
+                estimate,
+                model=self._backup_model()
+            ),
+            self.hedge,
+            f"{self.model}:ttft"
+        )
+    
+    async def _ainvoke(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        use_cache: bool = True
+    ) -> Tuple[str, TokenUsage, bool]:
+        """Singola chiamata al client con system prompt esplicito e cache opzionale"""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = LLMCache.make_key(self.model, system_prompt, user_prompt)
+            if use_cache:
+                cached = await run_blocking(self.cache.get, cache_key)
+                if cached:
+                    return cached.text, TokenUsage(), True
+        
+        estimate = estimate_tokens(system_prompt, user_prompt)
+        primary = lambda: self.resilience.call(
+            lambda: self.client.a_invoke(user_prompt, system_prompt=system_prompt), estimate,
+            model=self.model
+        )
+        if self.hedge is None:
+            response = await primary()
+        else:
+            response, _ = await hedged_call(
+                primary,
+                lambda: self.resilience.call(
+                    lambda: self._backup_client().a_invoke(user_prompt, system_prompt=system_prompt),
+                    estimate,
+                    model=self._backup_model()
+                ),
+                self.hedge,
+                f"{self.model}:invoke"
+            )
+        usage = usage_from_response(response)
+        if cache_key:
+            await run_blocking(self.cache.put, cache_key, response.text, usage)
+        return response.text, usage, False
+    
+    async def _agenerate_candidates(
+        self,
+        user_prompt: str,
+        n: int,
+        category_input: CategoryInput,
+        queries: List[str],
+        use_cache: bool = True
+    ) -> Tuple[str, TokenUsage, bool, dict]:
+        """
+        Genera n candidati per lo stesso prompt e sceglie il migliore con lo
+        scoring locale: un solo round-trip al posto di più rigenerazioni.
+        
+        Returns:
+            (candidato migliore, token totali, True se dalla cache, qualità)
+        """
+        def rank(texts: List[str]):
+            return rank_candidates(
+                texts,
+                keyword=category_input.keyword,
+                products=category_input.site_products,
+                queries=queries[:10],
+                parent_url=category_input.parent_url
+            )
+        
+        cache_key = None
+        if self.cache is not None:
+            cache_key = LLMCache.make_key(self.model, self.system_prompt, user_prompt, candidates=n)
+            cached = await run_blocking(self.cache.get, cache_key) if use_cache else None
+            if cached:
+                logger.info("⚡ Risposta dalla cache LLM")
+                _, scores = await run_blocking(rank, [cached.text])
+                return cached.text, TokenUsage(), True, {
+                    "score": scores[0].score,
+                    "violations": scores[0].violations,
+                    "candidates": n
+                }
+        
+        logger.info(f"🎯 Generazione di {n} candidati...")
+        try:
+            texts, usage = await self._acomplete_n(user_prompt, n)
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            # Modello o client senza supporto al parametro n: chiamate in parallelo
+            logger.warning(f"⚠️ Parametro n non disponibile ({e}), {n} chiamate in parallelo")
+            estimate = estimate_tokens(self.system_prompt, user_prompt)
+            responses = await asyncio.gather(*(
+                self.resilience.call(
+                    lambda: self.client.a_invoke(user_prompt, system_prompt=self.system_prompt), estimate,
+                    model=self.model
+                )
+                for _ in range(n)
+            ))
+            texts = [response.text for response in responses]
+            usage = TokenUsage()
+            for response in responses:
+                usage = usage + usage_from_response(response)
+        
+        best, scores = await run_blocking(rank, texts)
+        logger.info(
+            f"🏆 Candidato {best + 1}/{len(texts)}: punteggio {scores[best].score}",
+            extra={"scores": [score.score for score in scores]}
+        )
+        if cache_key:
+            await run_blocking(self.cache.put, cache_key, texts[best], usage)
+        return texts[best], usage, False, {
+            "score": scores[best].score,
+            "violations": scores[best].violations,
+            "candidates": len(texts),
+            "scores": [score.score for score in scores]
+        }
+    
+    async def _arepair(
+        self,
+        text: str,
+        category_input: CategoryInput,
+        queries: List[str],
+        use_cache: bool = True
+    ) -> Tuple[str, TokenUsage, dict]:
+        """
+        Corregge i singoli campi che violano le regole del system prompt.
+        
+        Ogni campo non valido viene riscritto con una chiamata breve (solo il
+        campo e le sue regole), tutte in parallelo; la correzione è tenuta
+        solo se riduce le penalità del validatore.
+        
+        Returns:
+            (contenuto corretto, token delle correzioni, qualità con i campi corretti)
+        """
+        def penalty(content: str) -> Tuple[int, list]:
+            violations = validate_content(
+                content,
+                category_input.keyword,
+                category_input.site_products,
+                category_input.parent_url
+            )
+            return sum(PENALTIES[v.rule] for v in violations), violations
+        
+        current_penalty, violations = await run_blocking(penalty, text)
+        problems = {}
+        for v in violations:
+            if v.field in REPAIRABLE_FIELDS or v.field.startswith("h2-"):
+                problems.setdefault(v.field, []).append(v.message)
+        
+        usage = TokenUsage()
+        repaired = []
+        if problems:
+            logger.info(f"🩹 Correzione mirata di: {', '.join(problems)}")
+            results = await asyncio.gather(*(
+                self._ainvoke(
+                    FIELD_FIX_SYSTEM_PROMPT,
+                    build_field_fix_prompt(
+                        field=field_name,
+                        current=field_text(text, field_name),
+                        problems=messages,
+                        keyword=category_input.keyword,
+                        site_products=category_input.site_products,
+                        parent_url=category_input.parent_url,
+                        parent_name=category_input.parent_name
+                    ),
+                    use_cache
+                )
+                for field_name, messages in problems.items()
+            ))
+            for field_name, (fix, fix_usage, _) in zip(problems, results):
+                usage = usage + fix_usage
+                fix = _clean_fix(field_name, fix)
+                patched = patch_field(text, field_name, fix) if fix else None
+                if patched is None:
+                    continue
+                patched_penalty, _ = await run_blocking(penalty, patched)
+                if patched_penalty < current_penalty:
+                    text, current_penalty = patched, patched_penalty
+                    repaired.append(field_name)
+            logger.info(f"✅ Campi corretti: {', '.join(repaired) or 'nessuno'}")
+        
+        score = await run_blocking(
+            score_content,
+            text,
+            category_input.keyword,
+            category_input.site_products,
+            queries[:10],
+            category_input.parent_url
+        )
+        return text, usage, {"score": score.score, "violations": score.violations, "repaired": repaired}
+    
+    async def _arepair_within(
+        self,
+        text: str,
+        category_input: CategoryInput,
+        queries: List[str],
+        use_cache: bool,
+        deadline: Deadline
+    ) -> Tuple[str, TokenUsage, dict]:
+        """_arepair entro la deadline: se il tempo non basta il contenuto resta com'è"""
+        if not deadline.allows_repair():
+            deadline.degrade("repair", "skipped", "tempo insufficiente")
+            return text, TokenUsage(), {}
+        try:
+            return await deadline.run("repair", self._arepair(text, category_input, queries, use_cache))
+        except DeadlineExceeded:
+            deadline.degrade("repair", "skipped", "correzione interrotta alla scadenza")
+            return text, TokenUsage(), {}
+    
+    async def _acomplete_n(self, user_prompt: str, n: int) -> Tuple[List[str], TokenUsage]:
+        """
+        n completamenti in una sola chiamata Chat Completions (parametro n):
+        il prompt viene inviato e fatturato una volta sola.
+        """
+        client = registry.get_async_openai(self.api_key)
+        response = await self.resilience.call(
+            lambda: client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                n=n
+            ),
+            estimate_tokens(self.system_prompt, user_prompt, completion=2000 * n),
+            model=self.model
+        )
+        texts = [choice.message.content or "" for choice in response.choices]
+        if not any(texts):
+            raise ValueError("nessun candidato nella risposta")
+        return texts, usage_from_response(response)
+    
+    async def _agenerate_parallel(
+        self,
+        category_input: CategoryInput,
+        queries: List[str],
+        serp_data: List[dict],
+        use_cache: bool = True
+    ) -> Tuple[str, TokenUsage, bool]:
+        """
+        Generazione in due fasi: schema, poi intro, testi H2 e FAQ in parallelo.
+        Se lo schema non è utilizzabile ripiega sulla chiamata singola.
+        
+        Returns:
+            (Markdown composto, token totali, True se tutto servito dalla cache)
+        """
+        logger.info("🧩 Generazione schema della pagina...")
+        outline_text, usage, cache_hit = await self._ainvoke(
+            self.system_prompt,
+            build_outline_prompt(
+                keyword=category_input.keyword,
+                site_products=category_input.site_products,
+                queries=queries,
+                serp_data=serp_data
+            ),
+            use_cache
+        )
+        outline = parse_outline(outline_text)
+        if not outline.h1 or not outline.h2:
+            logger.warning("⚠️ Schema non valido, generazione in chiamata singola")
+            user_prompt = self._build_prompt(category_input, queries, serp_data)
+            text, single_usage, single_hit = await self._arun_model(user_prompt, use_cache)
+            return text, usage + single_usage, cache_hit and single_hit
+        
+        def section(task: str) -> str:
+            return build_section_prompt(
+                keyword=category_input.keyword,
+                site_products=category_input.site_products,
+                queries=queries,
+                outline=outline.as_text(),
+                task=task
+            )
+        
+        link = ""
+        if category_input.parent_url and category_input.parent_name:
+            link = (
+                " Inserisci nel testo questo link alla categoria padre: "
+                f'<a href="{category_input.parent_url}">{category_input.parent_name}</a>'
+            )
+        tasks = [f"Scrivi l'introduzione della pagina (60-80 parole), senza call to action.{link}"]
+        tasks += [
+            f'Scrivi il testo della sezione H2 "{h2}" (max 130 parole, eventuali '
+            "sottotitoli come H3 ###), citando prodotti reali dalla lista."
+            for h2 in outline.h2
+        ]
+        if outline.faq:
+            questions = "\n".join(f"- {q}" for q in outline.faq)
+            tasks.append(
+                "Rispondi a queste domande, max 40 parole ciascuna, nel formato "
+                f"**Domanda**\nRisposta (una riga vuota tra le domande):\n{questions}"
+            )
+        
+        logger.info(f"⚡ Generazione di {len(tasks)} sezioni in parallelo...")
+        results = await asyncio.gather(*(
+            self._ainvoke(SECTION_SYSTEM_PROMPT, section(task), use_cache) for task in tasks
+        ))
+        for _, section_usage, section_hit in results:
+            usage = usage + section_usage
+            cache_hit = cache_hit and section_hit
+        
+        texts = [text for text, _, _ in results]
+        faq_text = texts[len(outline.h2) + 1] if outline.faq else ""
+        return assemble_markdown(outline, texts[0], texts[1:len(outline.h2) + 1], faq_text), usage, cache_hit
+    
+    # Fasi di raccolta dati, indipendenti tra loro
+    INPUT_STAGES = ("csv", "serp", "products")
+    
+    def _input_pipeline(
+        self,
+        csv_path: Optional[str],
+        category_input: CategoryInput,
+        scrape_serp_results: bool,
+        serp_keywords: Optional[List[str]],
+        keywords: Optional[List[KeywordData]],
+        deadline: Deadline,
+        on_stage: Callable[[str], None] = None
+    ) -> Pipeline:
+        """
+        Pipeline delle fasi di raccolta dati: query dal CSV ("csv"), ricerche
+        SERP ("serp") e prodotti della pagina categoria ("products", solo se
+        category_input.products_url), tutte senza dipendenze. SERP e prodotti
+        rispettano la loro quota della deadline, degradando se la sforano.
+        """
+        pipeline = Pipeline(on_stage)
+        pipeline.add("csv", lambda: self._aload_queries(csv_path, keywords))
+        if scrape_serp_results:
+            pipeline.add("serp", lambda: self._afetch_serp(category_input, serp_keywords, deadline))
+        if category_input.products_url:
+            pipeline.add("products", lambda: self._ascrape_products(category_input, deadline))
+        return pipeline
+    
+    async def _ascrape_products(self, category_input: CategoryInput, deadline: Deadline) -> CategoryInput:
+        """
+        Input con i prodotti estratti da products_url aggiunti a quelli forniti
+        (senza duplicati). Se lo scraping fallisce o non risponde entro la
+        quota della deadline si usano i prodotti forniti.
+        """
+        from .utils.product_scraper import scrape_products_async
+        
+        budget = deadline.stage_budget("products")
+        if budget is not None and budget < MIN_STAGE_SECONDS:
+            deadline.degrade("products", "skipped", "budget esaurito")
+            return category_input
+        try:
+            result = await asyncio.wait_for(scrape_products_async(category_input.products_url), timeout=budget)
+        except asyncio.TimeoutError:
+            deadline.degrade("products", "skipped", f"nessuna risposta entro {budget:.0f}s")
+            return category_input
+        if not result.get("success"):
+            deadline.degrade("products", "skipped", result.get("error", ""))
+            return category_input
+        products = list(dict.fromkeys(category_input.site_products + result.get("products", [])))
+        logger.info(f"📦 Prodotti dalla pagina categoria: {len(products)}")
+        return replace(category_input, site_products=products)
+    
+    async def _aload_queries(
+        self,
+        csv_path: Optional[str],
+        keywords: Optional[List[KeywordData]]
+    ) -> List[str]:
+        """Query target dal CSV (parsing nel pool di thread) o dalle keyword fornite"""
+        if keywords is None:
+            keywords = await run_blocking(load_seozoom_csv, csv_path)
+        return [kw.keyword for kw in keywords]
+    
+    async def _afetch_serp(
+        self,
+        category_input: CategoryInput,
+        serp_keywords: Optional[List[str]],
+        deadline: Deadline = None
+    ) -> List[dict]:
+        """
+        Ricerche SERP in parallelo per le keyword selezionate.
+        
+        Le ricerche hanno a disposizione la quota "serp" della deadline. Per
+        le keyword senza risposta in tempo (o senza risultati) si usano i dati
+        in cache scaduti se presenti, altrimenti la keyword viene scartata:
+        nel peggiore dei casi si prosegue senza dati competitor.
+        """
+        deadline = deadline or Deadline(None)
+        keywords_to_scrape = self._serp_keywords(category_input, serp_keywords)
+        fresh = await run_blocking(self._cached_serp, keywords_to_scrape, False)
+        results = {kw: cached for kw, (cached, _) in fresh.items()}
+        to_fetch = [kw for kw in keywords_to_scrape if kw not in results]
+        budget = deadline.stage_budget("serp")
+        
+        if to_fetch and (budget is None or budget >= MIN_STAGE_SECONDS):
+            logger.info(f"🔍 Scraping SERP per {len(to_fetch)} keyword...", extra={"keywords": to_fetch})
+            tasks = {
+                kw: asyncio.ensure_future(scrape_serp_async(kw, num_results=10, timeout=budget))
+                for kw in to_fetch
+            }
+            try:
+                done, _ = await asyncio.wait(tasks.values(), timeout=budget)
+            except asyncio.CancelledError:
+                # Generazione annullata (es. client disconnesso): asyncio.wait non
+                # cancella i task, le ricerche ancora in coda non devono partire
+                for task in tasks.values():
+                    task.cancel()
+                raise
+            for kw, task in tasks.items():
+                if task in done and task.exception() is None and task.result():
+                    results[kw] = task.result()
+                    if self.serp_cache:
+                        await run_blocking(self.serp_cache.put, kw, results[kw])
+                else:
+                    # Il thread della ricerca termina da solo con il timeout del client
+                    task.cancel()
+        
+        missing = [kw for kw in to_fetch if kw not in results]
+        stale = await run_blocking(self._cached_serp, missing, True) if missing else {}
+        for kw, (cached, age) in stale.items():
+            results[kw] = cached
+            deadline.degrade("serp", "stale", f"{kw} (dati di {age / 3600:.0f}h fa)")
+        
+        dropped = [kw for kw in missing if kw not in stale]
+        if dropped and len(dropped) == len(keywords_to_scrape):
+            deadline.degrade("serp", "skipped", "nessun dato competitor")
+        elif dropped:
+            deadline.degrade("serp", "partial", f"keyword senza dati: {', '.join(dropped)}")
+        return self._merge_serp_results([results.get(kw, []) for kw in keywords_to_scrape])
+    
+    def _cached_serp(self, keywords: List[str], stale: bool) -> dict:
+        """Risultati in cache per keyword: {keyword: (risultati, età)} per le sole presenti"""
+        if self.serp_cache is None:
+            return {}
+        found = {}
+        for kw in keywords:
+            cached = self.serp_cache.get(kw, stale=stale)
+            if cached:
+                found[kw] = cached
+        return found
+    
+    @staticmethod
+    def _serp_keywords(
+        category_input: CategoryInput,
+        serp_keywords: List[str] = None
+    ) -> List[str]:
+        """Keyword da cercare in SERP: quelle selezionate dall'utente, altrimenti la principale"""
+        keywords_to_scrape = serp_keywords if serp_keywords else [category_input.keyword]
+        return keywords_to_scrape[:5]  # Max 5 keyword per evitare rate limiting
+    
+    @staticmethod
+    def _merge_serp_results(results_per_keyword: List[list]) -> List[dict]:
+        """Formatta i risultati SERP di più keyword e rimuove i duplicati per URL"""
+        serp_data = []
+        for results in results_per_keyword:
+            formatted = format_serp_for_prompt(results)
+            
+            # Log dei risultati trovati
+            for r in formatted:
+                logger.debug(f"     📄 {r.get('title', '')[:50]}... ({r.get('url', '')[:60]})")
+            
+            serp_data.extend(formatted)
+        
+        # Rimuovi duplicati basati su URL
+        seen_urls = set()
+        unique_serp = []
+        for item in serp_data:
+            if item.get('url') not in seen_urls:
+                seen_urls.add(item.get('url'))
+                unique_serp.append(item)
+        serp_data = unique_serp[:20]  # Aumentato a 20 risultati totali
+        logger.info(f"✅ Trovati {len(serp_data)} risultati SERP unici (su {len(seen_urls)} totali)")
+        return serp_data
+    
+    @staticmethod
+    def _build_prompt(
+        category_input: CategoryInput,
+        queries: List[str],
+        serp_data: List[dict]
+    ) -> str:
+        """Costruisce il prompt utente a partire dai dati raccolti"""
+        with stage_timer("prompt_build") as stage:
+            prompt = build_user_prompt(
+                keyword=category_input.keyword,
+                site_products=category_input.site_products,
+                queries=queries,
+                serp_data=serp_data,
+                parent_url=category_input.parent_url,
+                parent_name=category_input.parent_name
+            )
+            stage.bytes = len(prompt.encode("utf-8"))
+        return prompt
     
     def _parse_markdown_output(
         self,
@@ -154,57 +1060,29 @@ class SEOContentAgent:
         keywords: List[str],
         serp_data: List[dict]
     ) -> SEOOutput:
-        """Estrae i componenti dall'output Markdown"""
-        
-        meta_title = ""
-        meta_description = ""
-        h1 = ""
-        sections = []
-        faq = []
-        seo_keywords = []
-        
-        lines = content.split("\n")
-        
-        for line in lines:
-            # Meta Title
-            if "Meta Title:" in line:
-                meta_title = line.replace("**Meta Title:**", "").replace("Meta Title:", "").strip()
-            # Meta Description
-            elif "Meta Description:" in line:
-                meta_description = line.replace("**Meta Description:**", "").replace("Meta Description:", "").strip()
-            # H1
-            elif line.startswith("# ") and not h1:
-                h1 = line[2:].strip()
-            # SEO Keywords
-            elif "SEO Keywords:" in line:
-                kw_text = line.replace("**SEO Keywords:**", "").replace("SEO Keywords:", "").strip()
-                seo_keywords = [k.strip() for k in kw_text.split(",")]
-        
-        # Estrai sezioni H2
-        h2_pattern = re.compile(r'^## (.+)$', re.MULTILINE)
-        h2_matches = h2_pattern.findall(content)
-        for h2 in h2_matches:
-            if "Domande Frequenti" not in h2 and "FAQ" not in h2:
-                sections.append({"h2": h2})
-        
-        # Estrai FAQ
-        faq_section = content.split("Domande Frequenti")[-1] if "Domande Frequenti" in content else ""
-        if faq_section:
-            q_pattern = re.compile(r'\*\*(.+?)\*\*\s*\n(.+?)(?=\n\*\*|\n---|\Z)', re.DOTALL)
-            for match in q_pattern.finditer(faq_section):
-                faq.append({
-                    "question": match.group(1).strip(),
-                    "answer": match.group(2).strip()
-                })
-        
+        """Estrae i componenti dall'output Markdown in una sola passata"""
+        with stage_timer("output_parse") as stage:
+            output = self._build_output(parse_markdown(content), content, keywords, serp_data)
+            stage.bytes = len(content.encode("utf-8"))
+            stage.rows = len(output.sections) + len(output.faq)
+        return output
+    
+    @staticmethod
+    def _build_output(
+        parser: MarkdownOutputParser,
+        content: str,
+        keywords: List[str],
+        serp_data: List[dict]
+    ) -> SEOOutput:
+        """SEOOutput dai campi raccolti dal parser (già chiuso)"""
         return SEOOutput(
             content=content,
-            meta_title=meta_title,
-            meta_description=meta_description,
-            h1=h1,
-            sections=sections,
-            faq=faq,
-            seo_keywords=seo_keywords if seo_keywords else keywords[:10],
+            meta_title=parser.meta_title,
+            meta_description=parser.meta_description,
+            h1=parser.h1,
+            sections=parser.sections,
+            faq=parser.faq,
+            seo_keywords=parser.seo_keywords if parser.seo_keywords else keywords[:10],
             serp_data=serp_data
         )
     
@@ -220,7 +1098,7 @@ class SEOContentAgent:
         with open(path, 'w', encoding='utf-8') as f:
             f.write(output.content)
         
-        print(f"✅ Contenuto salvato in: {output_path}")
+        logger.info(f"✅ Contenuto salvato in: {output_path}")
 
 
 def create_agent(
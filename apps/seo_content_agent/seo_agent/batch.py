@@ -0,0 +1,341 @@
+"""
+Batch - Generazione in blocco di molte pagine categoria da un manifest
+
+Il manifest (CSV o JSONL) elenca una categoria per riga con le colonne:
+    keyword, site_products, parent_url, parent_name, serp_keywords, csv_path,
+    products_url, id
+Solo keyword è obbligatoria; products_url è la pagina categoria da cui
+estrarre i prodotti in parallelo con CSV e SERP. In CSV le liste (site_products, serp_keywords)
+sono separate da "|", in JSONL possono essere liste vere.
+
+Le generazioni girano in parallelo sotto il rate limiter RPM/TPM condiviso
+delle chiamate al modello (--rpm/--tpm ne impostano i limiti). Ogni output
+viene scritto in modo atomico (<id>.md e poi <id>.json); un elemento con il
+suo .json già presente è considerato completato, quindi rilanciare lo stesso
+comando dopo un'interruzione riprende dagli elementi mancanti.
+
+Uso da CLI:
+    python -m seo_agent.batch manifest.csv --csv data/esempio_seozoom.csv \\
+        --output-dir output/batch --concurrency 8 --rpm 500 --tpm 200000
+"""
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import logging
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .agent import CategoryInput, SEOContentAgent, SEOOutput
+from .registry import registry
+from .utils.csv_loader import KeywordData, load_seozoom_csv
+from .utils.concurrency import run_blocking
+from .utils.resilience import configure_rate_limits
+from .utils.usage_ledger import default_ledger, set_usage_context
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchItem:
+    """Una categoria da generare"""
+    id: str
+    keyword: str
+    site_products: List[str] = field(default_factory=list)
+    parent_url: str = ""
+    parent_name: str = ""
+    serp_keywords: List[str] = field(default_factory=list)
+    csv_path: str = ""  # CSV SEOZoom specifico (altrimenti quello di default)
+    products_url: str = ""  # Pagina categoria da cui estrarre i prodotti
+
+
+def _slugify(text: str) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+    return slug[:80] or "item"
+
+
+def _as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value).split("|") if v.strip()]
+
+
+def load_manifest(path: str) -> List[BatchItem]:
+    """
+    Legge un manifest CSV o JSONL.
+
+    Raises:
+        ValueError: se manca una keyword o due righe hanno lo stesso id
+    """
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    items = []
+    seen = set()
+    for n, row in enumerate(rows, start=1):
+        row = {k.strip().lower(): v for k, v in row.items() if k}
+        keyword = str(row.get("keyword") or "").strip()
+        if not keyword:
+            raise ValueError(f"Riga {n} del manifest senza keyword")
+
+        item_id = _slugify(str(row.get("id") or keyword))
+        if item_id in seen:
+            raise ValueError(
+                f"Id duplicato nel manifest: '{item_id}' (riga {n}). "
+                "Aggiungi una colonna id univoca."
+            )
+        seen.add(item_id)
+
+        items.append(BatchItem(
+            id=item_id,
+            keyword=keyword,
+            site_products=_as_list(row.get("site_products")),
+            parent_url=str(row.get("parent_url") or "").strip(),
+            parent_name=str(row.get("parent_name") or "").strip(),
+            serp_keywords=_as_list(row.get("serp_keywords")),
+            csv_path=str(row.get("csv_path") or "").strip(),
+            products_url=str(row.get("products_url") or "").strip()
+        ))
+    return items
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+class BatchRunner:
+    """
+    Esegue un manifest con concorrenza limitata.
+
+    Il rate limit RPM/TPM è quello di default_resilience(): ogni chiamata
+    al modello (anche riparazioni e sezioni parallele) prenota lì la sua
+    stima e la corregge con l'usage reale.
+    """
+
+    def __init__(
+        self,
+        agent: SEOContentAgent,
+        output_dir: str,
+        default_csv: str = "",
+        concurrency: int = 4,
+        scrape_serp_results: bool = True,
+        use_cache: bool = True,
+        parallel: bool = False,
+        candidates: int = 1,
+        repair: bool = False
+    ):
+        self.agent = agent
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.default_csv = default_csv
+        self.concurrency = concurrency
+        self.scrape_serp_results = scrape_serp_results
+        self.use_cache = use_cache
+        self.parallel = parallel
+        self.candidates = candidates
+        self.repair = repair
+        self._keywords: Dict[str, List[KeywordData]] = {}
+
+    def is_done(self, item: BatchItem) -> bool:
+        return (self.output_dir / f"{item.id}.json").exists()
+
+    async def _load_keywords(self, csv_path: str) -> List[KeywordData]:
+        """Keyword SEOZoom, lette una sola volta per file"""
+        if not csv_path:
+            return []
+        if csv_path not in self._keywords:
+            self._keywords[csv_path] = await run_blocking(load_seozoom_csv, csv_path)
+        return self._keywords[csv_path]
+
+    def _save(self, item: BatchItem, output: SEOOutput, elapsed: float) -> None:
+        """Scrive prima il Markdown e poi i metadati: il .json segna il completamento"""
+        _write_atomic(self.output_dir / f"{item.id}.md", output.content)
+        meta = {
+            "id": item.id,
+            "keyword": item.keyword,
+            "meta_title": output.meta_title,
+            "meta_description": output.meta_description,
+            "h1": output.h1,
+            "sections": output.sections,
+            "faq": output.faq,
+            "seo_keywords": output.seo_keywords,
+            "cache_hit": output.cache_hit,
+            "usage": asdict(output.usage),
+            "quality": output.quality,
+            "timings": output.timings,
+            "elapsed_s": round(elapsed, 2),
+            "generated_at": time.time()
+        }
+        _write_atomic(
+            self.output_dir / f"{item.id}.json",
+            json.dumps(meta, ensure_ascii=False, indent=2)
+        )
+
+    async def _agent_within_budget(self) -> SEOContentAgent:
+        """Agente del batch, o quello con il modello economico se il budget di oggi è finito"""
+        ledger = default_ledger()
+        if ledger is None:
+            return self.agent
+        model = await run_blocking(ledger.enforce, self.agent.model)
+        if model == self.agent.model:
+            return self.agent
+        return registry.get_agent(
+            api_key=self.agent.api_key, model=model, system_prompt=self.agent.system_prompt
+        )
+
+    async def _process(self, item: BatchItem) -> Dict[str, Any]:
+        # Con budget superato e azione reject l'elemento fallisce e sarà ritentato al prossimo avvio
+        agent = await self._agent_within_budget()
+        keywords = await self._load_keywords(item.csv_path or self.default_csv)
+
+        start = time.perf_counter()
+        output = await agent.agenerate_category_content(
+            csv_path=None,
+            category_input=CategoryInput(
+                keyword=item.keyword,
+                site_products=item.site_products,
+                parent_url=item.parent_url,
+                parent_name=item.parent_name,
+                products_url=item.products_url
+            ),
+            scrape_serp_results=self.scrape_serp_results,
+            serp_keywords=item.serp_keywords or None,
+            keywords=keywords,
+            use_cache=self.use_cache,
+            parallel=self.parallel,
+            candidates=self.candidates,
+            repair=self.repair
+        )
+        elapsed = time.perf_counter() - start
+
+        await run_blocking(self._save, item, output, elapsed)
+        return {
+            "elapsed_s": elapsed,
+            "tokens": output.usage.total_tokens,
+            "prompt_tokens": output.usage.prompt_tokens,
+            "cached_tokens": output.usage.cached_tokens
+        }
+
+    async def run(self, items: List[BatchItem]) -> Dict[str, Any]:
+        """
+        Genera tutti gli elementi non ancora completati.
+
+        Returns:
+            Riepilogo con completati, saltati, falliti e throughput
+        """
+        pending = [item for item in items if not self.is_done(item)]
+        skipped = len(items) - len(pending)
+        if skipped:
+            logger.info(f"⏭️ {skipped} elementi già completati, ripresa da {len(pending)}")
+
+        # I worker ereditano il contesto: i consumi vanno sotto l'app batch
+        set_usage_context("batch")
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+
+        completed = []
+        failed = {}
+        start = time.perf_counter()
+
+        async def worker() -> None:
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    completed.append(await self._process(item))
+                    logger.info(f"✅ {item.id} ({len(completed)}/{len(pending)})")
+                except Exception as e:
+                    # Non viene marcato come completato: sarà ritentato al prossimo avvio
+                    logger.error(f"❌ {item.id}: {e}")
+                    failed[item.id] = str(e)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency))))
+
+        elapsed = time.perf_counter() - start
+        tokens = sum(r["tokens"] for r in completed)
+        prompt_tokens = sum(r["prompt_tokens"] for r in completed)
+        cached_tokens = sum(r["cached_tokens"] for r in completed)
+        summary = {
+            "total": len(items),
+            "completed": len(completed),
+            "skipped": skipped,
+            "failed": failed,
+            "elapsed_s": round(elapsed, 2),
+            "items_per_min": round(len(completed) / elapsed * 60, 2) if elapsed else 0.0,
+            "tokens_per_min": round(tokens / elapsed * 60) if elapsed else 0,
+            "cached_tokens": cached_tokens,
+            "prompt_cache_hit_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "avg_item_s": round(sum(r["elapsed_s"] for r in completed) / len(completed), 2) if completed else 0.0
+        }
+        _write_atomic(
+            self.output_dir / "_batch_summary.json",
+            json.dumps(summary, ensure_ascii=False, indent=2)
+        )
+        return summary
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generazione in blocco di pagine categoria da un manifest CSV/JSONL"
+    )
+    parser.add_argument("manifest", help="Manifest CSV o JSONL")
+    parser.add_argument("--output-dir", default="output/batch")
+    parser.add_argument("--csv", default="", help="CSV SEOZoom di default per tutti gli elementi")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--concurrency", type=int, default=4, help="Generazioni simultanee")
+    parser.add_argument("--rpm", type=float, default=0, help="Richieste al minuto (0 = SEO_AGENT_LLM_RPM)")
+    parser.add_argument("--tpm", type=float, default=0, help="Token al minuto (0 = SEO_AGENT_LLM_TPM)")
+    parser.add_argument("--no-serp", action="store_true", help="Salta lo scraping SERP")
+    parser.add_argument("--no-cache", action="store_true", help="Ignora la cache LLM")
+    parser.add_argument("--parallel", action="store_true", help="Genera le sezioni in parallelo")
+    parser.add_argument("--candidates", type=int, default=1,
+                        help="Candidati per pagina, viene salvato il migliore")
+    parser.add_argument("--repair", action="store_true",
+                        help="Corregge con chiamate mirate i campi fuori regola")
+    args = parser.parse_args(argv)
+
+    items = load_manifest(args.manifest)
+    configure_rate_limits(rpm=args.rpm, tpm=args.tpm)
+    runner = BatchRunner(
+        agent=registry.get_agent(model=args.model),
+        output_dir=args.output_dir,
+        default_csv=args.csv,
+        concurrency=args.concurrency,
+        scrape_serp_results=not args.no_serp,
+        use_cache=not args.no_cache,
+        parallel=args.parallel,
+        candidates=args.candidates,
+        repair=args.repair
+    )
+    summary = registry.run(runner.run(items))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    sys.exit(main())
@@ -2,7 +2,14 @@
 System prompt per l'agente SEO Content Strategist - E-commerce Generico
 """
 
-SYSTEM_PROMPT = """
+from functools import lru_cache
+
+from ..utils.product_summary import (
+    BASE, COLOR, MATERIAL, STYLE, SUMMARY_MIN_PRODUCTS, ProductSummary, summarize_products
+)
+
+# Ruolo e regole di stile, comuni a tutte le chiamate di generazione
+STYLE_RULES = """
 ### RUOLO
 Sei un Senior SEO Content Strategist e Copywriter specializzato in E-commerce B2B e B2C.
 Il tuo compito è trasformare dati grezzi (liste di keyword e nomi prodotto) in pagine di categoria ricche, tecniche e orientate alla conversione.
@@ -43,7 +50,9 @@ NON INVENTARE MAI caratteristiche tecniche specifiche (materiali, percentuali, t
 - ✅ Scrivi in modo generico: "materiali tecnici di qualità", "tessuti resistenti"
 - ✅ Descrivi i benefici generali: "comfort", "libertà di movimento", "vestibilità"
 - ✅ Usa i pattern visibili NEI NOMI dei prodotti (colori, stili come "Bicolore", "Annodato")
+"""
 
+SYSTEM_PROMPT = STYLE_RULES + """
 ### STRUTTURA DEL CONTENUTO RICHIESTO
 
 Genera il contenuto seguendo ESATTAMENTE questa struttura:
@@ -120,6 +129,147 @@ Analizza i titoli dei competitor forniti per:
 """
 
 
+SECTION_SYSTEM_PROMPT = STYLE_RULES + """
+### COMPITO
+Stai scrivendo UNA parte di una pagina categoria già impostata: ti vengono
+forniti lo schema della pagina (H1 e titoli H2) e la parte da scrivere.
+- Scrivi SOLO la parte richiesta, in Markdown, senza ripetere il titolo
+- Non anticipare gli argomenti degli altri H2 dello schema
+- Nessun commento o testo prima e dopo il contenuto richiesto
+"""
+
+
+# Prompt minimo per la correzione di un singolo campo: nessun contesto SERP
+# o keyword, solo le regole del campo da correggere
+FIELD_FIX_SYSTEM_PROMPT = """Sei un SEO copywriter per e-commerce. Correggi UN SOLO campo di una pagina categoria.
+- Restituisci SOLO il testo corretto del campo, senza etichette, virgolette o commenti
+- Mantieni lingua, significato e keyword del testo originale
+- Non usare: "Scopri", "Esplora", "benvenuto", "ecco a voi", "la nostra gamma", "Vasta gamma", "Varietà di", "Lista di", "Selezione di"
+- Non fare riferimento a sconti e promo
+- Come carattere separatore usa sempre il trattino "-"
+- Non inventare caratteristiche tecniche, brand o modelli
+"""
+
+
+# ==================== PROMPT UTENTE ====================
+#
+# I prompt sono composti da blocchi dal più stabile al più variabile:
+# istruzioni fisse, query SEOZoom (uguali per tutte le categorie
+# dello stesso CSV), prodotti, SERP e infine i dati della singola richiesta
+# (keyword, link padre). Il prefisso comune più lungo possibile permette al
+# provider di riusare la cache del prompt (token "cached" nell'usage).
+# Le parti fisse sono costanti del modulo e i blocchi di query e prodotti
+# sono memorizzati: a ogni richiesta si concatenano solo stringhe già pronte.
+
+USER_INSTRUCTIONS = """## ISTRUZIONI
+Genera il contenuto SEO completo per la categoria indicata nella RICHIESTA in fondo,
+seguendo la struttura richiesta nel system prompt.
+Assicurati di:
+1. Usare la keyword principale nel Meta Title e H1
+2. Inserire il link alla categoria parent nel primo paragrafo (se fornito)
+3. **CITARE ALMENO 3-5 PRODOTTI REALI** dalla lista fornita
+4. Creare H2 che rispondano ai cluster identificati dalle query
+5. Includere 2 FAQ pertinenti basate sulle query
+6. Fornire il SEO Summary finale con le keyword utilizzate
+
+"""
+
+OUTLINE_INSTRUCTIONS = """## ISTRUZIONI
+Prepara lo SCHEMA della pagina categoria indicata nella RICHIESTA in fondo.
+NON scrivere ancora i testi. Restituisci SOLO queste righe, una voce per riga:
+Meta Title: [max 60 caratteri]
+Meta Description: [max 155 caratteri con CTA]
+H1: [titolo con la keyword principale]
+H2: [titolo prima sezione basata sui cluster keyword]
+H2: [titolo seconda sezione]
+H2: [titolo terza sezione]
+FAQ: [domanda 1 derivata dalle query utenti]
+FAQ: [domanda 2 derivata dalle query utenti]
+SEO Keywords: [keyword principali separate da virgola]
+
+"""
+
+
+@lru_cache(maxsize=256)
+def _queries_block(queries: tuple) -> str:
+    queries_text = "\n".join(f"- {q}" for q in queries) if queries else "Nessuna query fornita"
+    return f"""## QUERY DI RICERCA TARGET
+{queries_text}
+
+"""
+
+
+_PATTERN_LABELS = [(BASE, "Base comune"), (COLOR, "Colori"), (MATERIAL, "Materiali"), (STYLE, "Stili")]
+
+
+def _summary_text(summary: ProductSummary) -> str:
+    """Nomi rappresentativi e pattern con le occorrenze su tutti i prodotti"""
+    lines = [f"{summary.total} prodotti in pagina. Nomi reali da citare:"]
+    lines += [f"- {p}" for p in summary.representatives]
+    lines.append(f"Pattern ricorrenti nei nomi di tutti i {summary.total} prodotti (occorrenze):")
+    for kind, label in _PATTERN_LABELS:
+        items = [f"{p.text} ({p.count})" for p in summary.patterns if p.kind == kind]
+        if items:
+            lines.append(f"- {label}: " + ", ".join(items))
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=1024)
+def _products_block(site_products: tuple) -> str:
+    if len(site_products) >= SUMMARY_MIN_PRODUCTS:
+        # Catalogo lungo: nomi rappresentativi + pattern invece dell'elenco completo
+        products_text = _summary_text(summarize_products(list(site_products)))
+    elif site_products:
+        products_text = "\n".join(f"- {p}" for p in site_products)
+    else:
+        products_text = "Nessun prodotto fornito"
+    return f"""## ⚠️ FONTE DI VERITÀ - PRODOTTI IN PAGINA (OBBLIGATORIO CITARLI)
+I seguenti prodotti DEVONO essere menzionati nel testo (almeno 3-5 di essi):
+{products_text}
+
+"""
+
+
+def _serp_block(keyword: str, serp_data: list) -> str:
+    if serp_data:
+        serp_lines = []
+        for i, item in enumerate(serp_data[:10], 1):
+            if isinstance(item, dict):
+                title = item.get('title', '')
+                url = item.get('url', '')
+                desc = item.get('description', '')[:100] + "..." if item.get('description', '') else ""
+                serp_lines.append(f"{i}. **{title}**\n   URL: {url}\n   {desc}")
+            else:
+                serp_lines.append(f"{i}. {item}")
+        serp_text = "\n".join(serp_lines)
+    else:
+        serp_text = "Nessun dato SERP disponibile"
+    return f"""## ANALISI SERP - PRIMI RISULTATI GOOGLE PER "{keyword}"
+{serp_text}
+
+"""
+
+
+def _context(site_products: list, queries: list) -> str:
+    """Blocchi query e prodotti, comuni a tutti i prompt (dal più stabile)"""
+    return _queries_block(tuple(queries or ())) + _products_block(tuple(site_products or ()))
+
+
+def _request_block(keyword: str, parent_url: str = "", parent_name: str = "") -> str:
+    """Dati della singola richiesta, sempre in coda al prompt"""
+    link = ""
+    if parent_url and parent_name:
+        link = f"""
+## LINK INTERNO OBBLIGATORIO
+Inserisci nel primo paragrafo questo link:
+`<a href="{parent_url}">{parent_name}</a>`
+"""
+    return f"""---
+## RICHIESTA
+Categoria: **{keyword}**
+{link}"""
+
+
 def build_user_prompt(
     keyword: str,
     site_products: list,
@@ -142,57 +292,104 @@ def build_user_prompt(
     Returns:
         Il prompt utente formattato
     """
-    # Formatta prodotti
-    products_text = "\n".join(f"- {p}" for p in site_products) if site_products else "Nessun prodotto fornito"
-    
-    # Formatta query
-    queries_text = "\n".join(f"- {q}" for q in queries) if queries else "Nessuna query fornita"
-    
-    # Formatta dati SERP
-    if serp_data:
-        serp_lines = []
-        for i, item in enumerate(serp_data[:10], 1):
-            if isinstance(item, dict):
-                title = item.get('title', '')
-                url = item.get('url', '')
-                desc = item.get('description', '')[:100] + "..." if item.get('description', '') else ""
-                serp_lines.append(f"{i}. **{title}**\n   URL: {url}\n   {desc}")
-            else:
-                serp_lines.append(f"{i}. {item}")
-        serp_text = "\n".join(serp_lines)
-    else:
-        serp_text = "Nessun dato SERP disponibile"
-    
-    # Link interno
-    internal_link = ""
-    if parent_url and parent_name:
-        internal_link = f"""
-## LINK INTERNO OBBLIGATORIO
-Inserisci nel primo paragrafo questo link:
-`<a href="{parent_url}">{parent_name}</a>`
-"""
-    
-    return f"""## RICHIESTA
-Genera il contenuto SEO completo per la categoria: **{keyword}**
-{internal_link}
-## ⚠️ FONTE DI VERITÀ - PRODOTTI IN PAGINA (OBBLIGATORIO CITARLI)
-I seguenti prodotti DEVONO essere menzionati nel testo (almeno 3-5 di essi):
-{products_text}
+    return "".join((
+        USER_INSTRUCTIONS,
+        _context(site_products, queries),
+        _serp_block(keyword, serp_data),
+        _request_block(keyword, parent_url, parent_name)
+    ))
 
-## QUERY DI RICERCA TARGET
-{queries_text}
 
-## ANALISI SERP - PRIMI RISULTATI GOOGLE PER "{keyword}"
-{serp_text}
+def build_outline_prompt(
+    keyword: str,
+    site_products: list,
+    queries: list,
+    serp_data: list
+) -> str:
+    """
+    Prompt della fase di schema (generazione parallela): solo meta data,
+    titoli e domande FAQ, una voce per riga.
+    """
+    return "".join((
+        OUTLINE_INSTRUCTIONS,
+        _context(site_products, queries),
+        _serp_block(keyword, serp_data),
+        _request_block(keyword)
+    ))
+
+
+def build_section_prompt(
+    keyword: str,
+    site_products: list,
+    queries: list,
+    outline: str,
+    task: str
+) -> str:
+    """
+    Prompt per una singola parte della pagina (intro, testo di un H2, FAQ),
+    con lo schema completo come contesto per evitare sovrapposizioni.
+    Le sezioni della stessa pagina condividono tutto tranne il compito finale.
+    """
+    return "".join((
+        _context(site_products, queries),
+        f"""## PAGINA CATEGORIA: **{keyword}**
+
+## SCHEMA DELLA PAGINA
+{outline}
 
 ---
-Genera ora il contenuto completo seguendo la struttura richiesta nel system prompt.
-Assicurati di:
-1. Usare la keyword principale nel Meta Title e H1
-2. Inserire il link alla categoria parent nel primo paragrafo (se fornito)
-3. **CITARE ALMENO 3-5 PRODOTTI REALI** dalla lista fornita sopra
-4. Creare H2 che rispondano ai cluster identificati dalle query
-5. Includere 2 FAQ pertinenti basate sulle query
-6. Fornire il SEO Summary finale con le keyword utilizzate
+{task}
+"""
+    ))
+
+
+def _field_rules(field: str, keyword: str, parent_url: str, parent_name: str) -> str:
+    if field == "meta_title":
+        return f'Meta Title: max 60 caratteri, deve iniziare con "{keyword}".'
+    if field == "meta_description":
+        return "Meta Description: max 155 caratteri, con una call to action finale."
+    if field == "h1":
+        return f'H1: ottimizzato con la keyword principale "{keyword}", senza "#".'
+    if field == "intro":
+        link = f' Deve contenere il link HTML <a href="{parent_url}">{parent_name or keyword}</a>.' \
+            if parent_url else ""
+        return f"Introduzione: 60-80 parole, nessuna call to action.{link}"
+    if field == "faq":
+        return (
+            "Sezione FAQ: mantieni l'intestazione e le domande nel formato **Domanda** "
+            "seguito dalla risposta; ogni risposta al massimo 40 parole."
+        )
+    return "Sezione H2: mantieni l'intestazione ## e la formattazione Markdown."
+
+
+def build_field_fix_prompt(
+    field: str,
+    current: str,
+    problems: list,
+    keyword: str,
+    site_products: list,
+    parent_url: str = "",
+    parent_name: str = ""
+) -> str:
+    """
+    Prompt per riscrivere un solo campo (meta_title, meta_description, h1,
+    intro, faq, h2-N) che non rispetta le regole: contiene solo il campo,
+    i problemi rilevati e le regole del campo.
+    """
+    problems_text = "\n".join(f"- {p}" for p in problems)
+    products = ""
+    if field not in ("meta_title", "meta_description", "h1") and site_products:
+        products = "\n## PRODOTTI IN PAGINA\n" + "\n".join(f"- {p}" for p in site_products[:10]) + "\n"
+    return f"""## CATEGORIA: **{keyword}**
+
+## CAMPO DA CORREGGERE
+{current or "(mancante)"}
+
+## PROBLEMI RILEVATI
+{problems_text}
+
+## REGOLE DEL CAMPO
+{_field_rules(field, keyword, parent_url, parent_name)}
+{products}---
+Restituisci solo il campo corretto.
 """
-
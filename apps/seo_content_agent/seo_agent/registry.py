@@ -0,0 +1,310 @@
+"""
+Client Registry - Client LLM e agenti "caldi" condivisi nel processo
+
+Evita di ricreare a ogni richiesta client OpenAI, agenti datapizza e relativi
+pool di connessioni (con nuovo handshake TLS). Le istanze sono indicizzate per
+(modello, API key, hash del system prompt), riutilizzate in modo thread-safe
+ed eliminate dopo troppi errori consecutivi o se inattive troppo a lungo.
+
+Usato da backend FastAPI, app Streamlit e CLI:
+    from seo_agent.registry import registry
+    agent = registry.get_agent(api_key=api_key, model="gpt-4o-mini")
+"""
+
+import os
+import time
+import hashlib
+import asyncio
+import weakref
+import threading
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, TypeVar
+
+from .prompts.system_prompt import SYSTEM_PROMPT
+from .utils.deadline import DeadlineExceeded
+from .utils.resilience import ProviderUnavailable
+from .utils.usage_ledger import BudgetExceeded
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Limiti dei pool HTTP keep-alive dei client OpenAI
+MAX_CONNECTIONS = int(os.getenv("SEO_AGENT_HTTP_MAX_CONNECTIONS", "50"))
+MAX_KEEPALIVE = int(os.getenv("SEO_AGENT_HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("SEO_AGENT_HTTP_KEEPALIVE_EXPIRY", "120"))
+
+# Esiti che non dicono nulla sulla salute del client (ValueError copre anche
+# risposte non parsabili e conflitti di idempotenza)
+_NOT_CLIENT_FAULTS = (ProviderUnavailable, DeadlineExceeded, BudgetExceeded, ValueError)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    created_at: float
+    last_used: float
+    failures: int = 0
+
+
+class ClientRegistry:
+    """
+    Registro thread-safe di client e agenti riutilizzabili.
+
+    Le chiavi contengono solo l'hash dell'API key, mai la chiave in chiaro.
+    """
+
+    def __init__(self, max_failures: int = 3, max_idle: float = 1800):
+        self.max_failures = max_failures
+        self.max_idle = max_idle
+        self._entries: Dict[Tuple, _Entry] = {}
+        self._keys_by_id: Dict[int, Tuple] = {}
+        self._closing: Set[asyncio.Future] = set()
+        self._lock = threading.RLock()
+
+    # ==================== ACCESSO ====================
+
+    def _get_or_create(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(value=factory(), created_at=now, last_used=now)
+                self._entries[key] = entry
+                self._keys_by_id[id(entry.value)] = key
+                logger.info(f"🔌 Nuovo client nel registry: {key[0]} ({key[1]})")
+            entry.last_used = now
+            return entry.value
+
+    @staticmethod
+    def _api_key(api_key: Optional[str]) -> str:
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "API key non trovata. Imposta OPENAI_API_KEY "
+                "o passa api_key al registry."
+            )
+        return api_key
+
+    def get_agent(
+        self,
+        api_key: str = None,
+        model: str = "gpt-4o-mini",
+        system_prompt: str = SYSTEM_PROMPT
+    ):
+        """SEOContentAgent condiviso per (modello, API key, system prompt)"""
+        from .agent import SEOContentAgent
+
+        api_key = self._api_key(api_key)
+        key = ("agent", model, _digest(api_key), _digest(system_prompt))
+        return self._get_or_create(
+            key,
+            lambda: SEOContentAgent(api_key=api_key, model=model, system_prompt=system_prompt)
+        )
+
+    def get_openai(self, api_key: str = None):
+        """Client OpenAI sincrono con pool di connessioni keep-alive"""
+        import httpx
+        from openai import OpenAI
+
+        api_key = self._api_key(api_key)
+        key = ("openai", "sync", _digest(api_key))
+        return self._get_or_create(key, lambda: OpenAI(
+            api_key=api_key,
+            # I retry sono gestiti da utils.resilience (backoff condiviso, circuit breaker)
+            max_retries=0,
+            http_client=httpx.Client(limits=self._limits())
+        ))
+
+    def get_async_openai(self, api_key: str = None):
+        """
+        Client AsyncOpenAI con pool keep-alive.
+        Il pool asincrono è legato all'event loop: c'è un client per loop,
+        indicizzato da un riferimento debole al loop (un loop nuovo non
+        riceve mai il client di uno chiuso). I client di un loop si chiudono
+        con aclose_loop_clients o, per asyncio.run, usando registry.run.
+        """
+        import httpx
+        from openai import AsyncOpenAI
+
+        api_key = self._api_key(api_key)
+        loop_ref = weakref.ref(asyncio.get_running_loop())
+        key = ("openai", "async", _digest(api_key), loop_ref)
+        return self._get_or_create(key, lambda: AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=self._limits())
+        ))
+
+    @staticmethod
+    def _limits():
+        import httpx
+
+        return httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+
+    # ==================== SALUTE ====================
+
+    def report_success(self, value: Any) -> None:
+        with self._lock:
+            key = self._keys_by_id.get(id(value))
+            if key in self._entries:
+                self._entries[key].failures = 0
+
+    def report_failure(self, value: Any) -> None:
+        """Registra un errore; oltre max_failures consecutivi l'istanza viene scartata"""
+        with self._lock:
+            key = self._keys_by_id.get(id(value))
+            entry = self._entries.get(key)
+            if entry is None or entry.value is not value:
+                return
+            entry.failures += 1
+            if entry.failures >= self.max_failures:
+                logger.warning(f"⚠️ Client {key[0]} ({key[1]}) rimosso dopo {entry.failures} errori")
+                self._remove(key)
+
+    @contextmanager
+    def track(self, value: Any):
+        """
+        Context manager che aggiorna la salute dell'istanza in base all'esito:
+
+            with registry.track(agent):
+                await agent.agenerate_category_content(...)
+        """
+        try:
+            yield value
+        except _NOT_CLIENT_FAULTS:
+            # Quota, provider degradato, scadenza, budget o richiesta non valida:
+            # il client in sé è sano, contano solo gli errori di trasporto e del client
+            raise
+        except Exception:
+            self.report_failure(value)
+            raise
+        else:
+            self.report_success(value)
+
+    def _remove(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._keys_by_id.pop(id(entry.value), None)
+        close = getattr(entry.value, "close", None)
+        if not callable(close):
+            return
+        if asyncio.iscoroutinefunction(close):
+            self._close_async(close, _loop_of(key))
+            return
+        try:
+            close()
+        except Exception:
+            pass
+
+    def _close_async(self, close: Callable[[], Awaitable[Any]], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """
+        Chiude un client asincrono nel suo loop, se è ancora attivo; con il
+        loop già chiuso il pool è rilasciato dal garbage collector.
+        """
+        if loop is None or loop.is_closed() or not loop.is_running():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            future = loop.create_task(close())
+        else:
+            future = asyncio.run_coroutine_threadsafe(close(), loop)
+        self._closing.add(future)
+        future.add_done_callback(self._closing.discard)
+
+    def _evict_idle(self, now: float) -> None:
+        for key in [
+            k for k, e in self._entries.items()
+            if now - e.last_used > self.max_idle or _loop_closed(k)
+        ]:
+            self._remove(key)
+
+    async def aclose_loop_clients(self) -> None:
+        """Chiude i client asincroni dell'event loop corrente (prima che il loop termini)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            keys = [key for key in self._entries if _loop_of(key) is loop]
+            clients = [self._entries[key].value for key in keys]
+            for key in keys:
+                entry = self._entries.pop(key)
+                self._keys_by_id.pop(id(entry.value), None)
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Chiusura del client non riuscita: {e}")
+
+    def run(self, main: Awaitable[T]) -> T:
+        """asyncio.run che alla fine chiude i client asincroni creati nel loop"""
+        async def run_and_close() -> T:
+            try:
+                return await main
+            finally:
+                await self.aclose_loop_clients()
+        return asyncio.run(run_and_close())
+
+    def clear(self) -> None:
+        """Rimuove tutte le istanze (es. allo shutdown)"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Istanze attive con età, inattività ed errori consecutivi"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "entries": [
+                    {
+                        "kind": key[0],
+                        "name": key[1],
+                        "age_s": round(now - entry.created_at, 1),
+                        "idle_s": round(now - entry.last_used, 1),
+                        "failures": entry.failures
+                    }
+                    for key, entry in self._entries.items()
+                ]
+            }
+
+
+def _loop_of(key: Tuple) -> Optional[asyncio.AbstractEventLoop]:
+    """Event loop di un client asincrono (None se chiave di un client sincrono o loop eliminato)"""
+    ref = key[-1]
+    return ref() if isinstance(ref, weakref.ref) else None
+
+
+def _loop_closed(key: Tuple) -> bool:
+    """Client asincrono di un event loop chiuso o eliminato: non più utilizzabile"""
+    ref = key[-1]
+    if not isinstance(ref, weakref.ref):
+        return False
+    loop = ref()
+    return loop is None or loop.is_closed()
+
+
+# Registry condiviso dal processo
+registry = ClientRegistry()
+
+
+def get_agent(
+    api_key: str = None,
+    model: str = "gpt-4o-mini",
+    system_prompt: str = SYSTEM_PROMPT
+):
+    """Scorciatoia per registry.get_agent"""
+    return registry.get_agent(api_key=api_key, model=model, system_prompt=system_prompt)
@@ -4,6 +4,7 @@ Utils module for SEO Agent
 from .csv_loader import (
     KeywordData,
     load_seozoom_csv,
+    parse_seozoom_csv,
     get_top_keywords,
     get_keyword_clusters,
     format_keywords_for_prompt
@@ -12,6 +13,7 @@ from .csv_loader import (
 __all__ = [
     "KeywordData",
     "load_seozoom_csv",
+    "parse_seozoom_csv",
     "get_top_keywords",
     "get_keyword_clusters",
     "format_keywords_for_prompt"
@@ -0,0 +1,291 @@
+"""
+Bulk Product Scraper - Scraping di molte pagine categoria su più domini
+
+Pianifica le richieste con una policy "educata" per dominio (concorrenza
+massima e ritardo minimo tra richieste), rispetta robots.txt (in cache per
+host) e restituisce i risultati man mano che ogni URL viene completato.
+
+Uso da CLI:
+    python -m seo_agent.utils.bulk_scraper urls.txt > risultati.ndjson
+"""
+
+import json
+import sys
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from .product_scraper import HEADERS, scrape_products
+from .scheduler import scheduled_blocking
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DomainPolicy:
+    """Policy di cortesia applicata a ogni dominio"""
+    max_concurrency: int = 2  # Richieste simultanee massime per dominio
+    delay: float = 1.0  # Secondi minimi tra due richieste allo stesso dominio
+
+
+class RobotsCache:
+    """
+    Cache thread-safe dei robots.txt, una sola richiesta per host.
+
+    Se robots.txt non è raggiungibile le richieste sono consentite;
+    se risponde 401/403 l'host è considerato interamente bloccato.
+    """
+
+    def __init__(self, user_agent: str = HEADERS['User-Agent'], timeout: float = 10):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self._parsers: Dict[str, Optional[RobotFileParser]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _host_lock(self, host: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(host, threading.Lock())
+
+    def _fetch(self, scheme: str, host: str) -> Optional[RobotFileParser]:
+        robots_url = f"{scheme}://{host}/robots.txt"
+        parser = RobotFileParser(robots_url)
+        try:
+            response = requests.get(robots_url, headers=HEADERS, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"⚠️ robots.txt non raggiungibile per {host}: {e}")
+            return None
+
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        return parser
+
+    def get(self, url: str) -> Optional[RobotFileParser]:
+        """Restituisce il parser robots.txt per l'host dell'URL (scaricandolo una volta)"""
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        with self._host_lock(host):
+            if host not in self._parsers:
+                self._parsers[host] = self._fetch(parsed.scheme, host)
+            return self._parsers[host]
+
+    def can_fetch(self, url: str) -> bool:
+        parser = self.get(url)
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, host: str) -> Optional[float]:
+        """Crawl-delay dichiarato dall'host, solo se robots.txt è già in cache"""
+        parser = self._parsers.get(host)
+        if parser is None:
+            return None
+        delay = parser.crawl_delay(self.user_agent)
+        return float(delay) if delay is not None else None
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class BulkScraper:
+    """
+    Scheduler per lo scraping di liste di URL su più domini.
+
+    Ogni dominio ha la propria coda: le richieste partono solo se il dominio
+    ha slot liberi e il ritardo minimo è trascorso, così un dominio lento non
+    blocca gli altri. Con owner (utente e priorità, es. current_owner()
+    della richiesta HTTP) ogni richiesta occupa anche uno slot dello
+    scheduler equo, come gli altri scraping; senza (CLI) non c'è coda.
+    """
+
+    def __init__(
+        self,
+        policy: DomainPolicy = None,
+        max_workers: int = 8,
+        respect_robots: bool = True,
+        max_products: int = 50,
+        owner: Optional[Tuple[str, str]] = None
+    ):
+        self.policy = policy or DomainPolicy()
+        self.owner = owner
+        self.max_workers = max_workers
+        self.respect_robots = respect_robots
+        self.max_products = max_products
+        self.robots = RobotsCache()
+
+    def _scrape_one(self, url: str, domain: str) -> Dict:
+        if self.owner is None:
+            return self._fetch(url, domain)
+        with scheduled_blocking("bulk_products", self.owner):
+            return self._fetch(url, domain)
+
+    def _fetch(self, url: str, domain: str) -> Dict:
+        start = time.monotonic()
+        if self.respect_robots and not self.robots.can_fetch(url):
+            result = {
+                "success": False,
+                "blocked": True,
+                "error": "Bloccato da robots.txt",
+                "products": [],
+                "url": url
+            }
+        else:
+            result = scrape_products(url, max_products=self.max_products)
+        result["domain"] = domain
+        result["latency_ms"] = round((time.monotonic() - start) * 1000, 1)
+        return result
+
+    def _domain_delay(self, domain: str) -> float:
+        crawl_delay = self.robots.crawl_delay(domain) if self.respect_robots else None
+        return max(self.policy.delay, crawl_delay or 0.0)
+
+    def run(self, urls: Iterable[str]) -> Iterator[Dict]:
+        """
+        Esegue lo scraping e restituisce un evento per URL appena completato,
+        seguito da un evento finale con le statistiche.
+
+        Yields:
+            {"type": "result", ...} per ogni URL, poi {"type": "stats", ...}
+        """
+        queues: Dict[str, deque] = {}
+        for url in urls:
+            domain = urlparse(url).netloc.lower()
+            queues.setdefault(domain, deque()).append(url)
+
+        total = sum(len(q) for q in queues.values())
+        in_flight = {domain: 0 for domain in queues}
+        next_allowed = {domain: 0.0 for domain in queues}
+        latencies: Dict[str, List[float]] = {domain: [] for domain in queues}
+        counts = {"succeeded": 0, "failed": 0, "blocked": 0}
+        futures = {}
+        start = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while futures or any(queues.values()):
+                now = time.monotonic()
+
+                # Avvia le richieste consentite dalla policy di ogni dominio
+                for domain, queue in queues.items():
+                    while (
+                        queue
+                        and len(futures) < self.max_workers
+                        and in_flight[domain] < self.policy.max_concurrency
+                        and next_allowed[domain] <= now
+                    ):
+                        url = queue.popleft()
+                        future = executor.submit(self._scrape_one, url, domain)
+                        futures[future] = domain
+                        in_flight[domain] += 1
+                        next_allowed[domain] = now + self._domain_delay(domain)
+
+                # Attendi un completamento o il prossimo slot disponibile; con il
+                # pool pieno solo un completamento può avviare nuove richieste
+                waiting = [
+                    next_allowed[d] for d, q in queues.items()
+                    if q and in_flight[d] < self.policy.max_concurrency
+                ] if len(futures) < self.max_workers else []
+                timeout = max(0.0, min(waiting) - now) if waiting else None
+                if not futures:
+                    time.sleep(timeout or 0)
+                    continue
+
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    domain = futures.pop(future)
+                    in_flight[domain] -= 1
+                    result = future.result()
+                    latencies[domain].append(result["latency_ms"])
+                    if result.get("blocked"):
+                        counts["blocked"] += 1
+                    elif result.get("success"):
+                        counts["succeeded"] += 1
+                    else:
+                        counts["failed"] += 1
+                    yield {"type": "result", **result}
+
+        elapsed = time.monotonic() - start
+        yield {
+            "type": "stats",
+            "total_urls": total,
+            **counts,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_urls_per_s": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+            "domains": {
+                domain: {
+                    "requests": len(values),
+                    "avg_ms": round(sum(values) / len(values), 1) if values else 0.0,
+                    "p50_ms": _percentile(values, 50),
+                    "p95_ms": _percentile(values, 95),
+                    "max_ms": max(values) if values else 0.0
+                }
+                for domain, values in latencies.items()
+            }
+        }
+
+
+def parse_url_list(text: str) -> List[str]:
+    """
+    Estrae gli URL validi (http/https) da un testo, uno per riga o separati
+    da virgola. I duplicati vengono rimossi mantenendo l'ordine.
+    """
+    urls = []
+    seen = set()
+    for raw in text.replace(',', '\n').split('\n'):
+        url = raw.strip()
+        if url.startswith(('http://', 'https://')) and url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Scraping prodotti in blocco, output NDJSON su stdout"
+    )
+    parser.add_argument("input", help="File con un URL per riga ('-' per stdin)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Richieste simultanee per dominio")
+    parser.add_argument("--delay", type=float, default=1.0, help="Secondi tra richieste allo stesso dominio")
+    parser.add_argument("--workers", type=int, default=8, help="Richieste simultanee totali")
+    parser.add_argument("--max-products", type=int, default=50)
+    parser.add_argument("--ignore-robots", action="store_true", help="Non rispettare robots.txt")
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            text = f.read()
+
+    scraper = BulkScraper(
+        policy=DomainPolicy(max_concurrency=args.concurrency, delay=args.delay),
+        max_workers=args.workers,
+        respect_robots=not args.ignore_robots,
+        max_products=args.max_products
+    )
+
+    for event in scraper.run(parse_url_list(text)):
+        sys.stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    sys.exit(main())
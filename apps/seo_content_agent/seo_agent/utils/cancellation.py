@@ -0,0 +1,106 @@
+"""
+Cancellation - Conteggio delle generazioni annullate e dei token risparmiati
+
+Quando il client chiude la pagina (o avvia una nuova generazione) o un job
+viene annullato, la generazione in corso viene cancellata: ricerche SERP,
+scraping dei prodotti e stream del modello si interrompono. Qui si registra
+in che fase è avvenuto l'annullamento e una stima dei token non spesi.
+"""
+
+import threading
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stima dei token di una generazione (prompt con keyword/SERP/prodotti e risposta)
+PROMPT_TOKENS = 3000
+COMPLETION_TOKENS = 2000
+
+# Fasi precedenti la chiamata al modello: annullando qui non si spende nulla
+INPUT_STAGES = ("", "csv", "serp", "products")
+
+# Origine dell'annullamento
+DISCONNECT = "disconnect"
+JOB = "job"
+
+
+@dataclass
+class GenerationProgress:
+    """Fase corrente di una generazione e caratteri già ricevuti dal modello"""
+    stage: str = ""
+    completion_chars: int = 0
+    calls: int = 1  # chiamate al modello previste (es. candidati)
+    prompt_tokens: int = PROMPT_TOKENS
+    completion_tokens: int = COMPLETION_TOKENS
+
+    def enter(self, stage: str) -> None:
+        """Callback on_stage della pipeline"""
+        self.stage = stage
+
+    def update(self, event: str, data: Dict[str, Any]) -> None:
+        """Aggiorna dall'evento di uno stream di generazione ("stage", "token", ...)"""
+        if event == "stage":
+            self.enter(data.get("stage") or self.stage)
+        elif event == "token":
+            self.completion_chars += len(data.get("text") or "")
+
+    def saved_tokens(self) -> int:
+        """
+        Token non spesi annullando ora: tutta la chiamata prima del modello,
+        la parte di risposta non ancora generata durante lo stream, nulla dopo.
+        """
+        if self.stage in INPUT_STAGES:
+            return (self.prompt_tokens + self.completion_tokens) * self.calls
+        if self.stage == "llm":
+            # ~4 caratteri per token
+            return max(0, self.completion_tokens * self.calls - self.completion_chars // 4)
+        return 0
+
+
+class CancellationStats:
+    """Annullamenti per origine e per fase, con i token risparmiati stimati"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources: Counter = Counter()
+        self._stages: Counter = Counter()
+        self._saved_tokens = 0
+
+    def record(self, source: str, progress: Optional[GenerationProgress] = None) -> int:
+        """Registra un annullamento e restituisce i token risparmiati stimati"""
+        progress = progress or GenerationProgress()
+        saved = progress.saved_tokens()
+        with self._lock:
+            self._sources[source] += 1
+            self._stages[progress.stage or "queued"] += 1
+            self._saved_tokens += saved
+        logger.info(
+            f"🛑 Generazione annullata ({source}, fase {progress.stage or 'queued'}): "
+            f"~{saved} token risparmiati"
+        )
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cancelled": sum(self._sources.values()),
+                "by_source": dict(self._sources),
+                "by_stage": dict(self._stages),
+                "estimated_saved_tokens": self._saved_tokens
+            }
+
+
+_default_stats: Optional[CancellationStats] = None
+_default_lock = threading.Lock()
+
+
+def default_cancellation_stats() -> CancellationStats:
+    """Contatori condivisi dal processo"""
+    global _default_stats
+    with _default_lock:
+        if _default_stats is None:
+            _default_stats = CancellationStats()
+        return _default_stats
@@ -0,0 +1,108 @@
+"""
+Executor condiviso per il lavoro bloccante
+
+Le funzioni sincrone (parsing CSV/HTML, client senza versione async) vengono
+eseguite in un pool di thread limitato, così non bloccano l'event loop.
+Le chiamate di rete sincrone (ricerche DuckDuckGo) hanno un pool separato e
+più piccolo: una raffica di ricerche lente non affama upload e scritture.
+"""
+
+import os
+import asyncio
+import threading
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Numero massimo di thread per il lavoro bloccante (configurabile via env)
+MAX_BLOCKING_WORKERS = int(os.getenv("SEO_AGENT_BLOCKING_WORKERS", "8"))
+# Thread per le chiamate di rete sincrone: meno di MAX_BLOCKING_WORKERS
+MAX_NETWORK_WORKERS = int(os.getenv("SEO_AGENT_NETWORK_WORKERS", "4"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_network_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Restituisce il pool di thread condiviso, creandolo alla prima chiamata"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_BLOCKING_WORKERS,
+                thread_name_prefix="seo-agent-blocking"
+            )
+        return _executor
+
+
+def get_network_executor() -> ThreadPoolExecutor:
+    """Restituisce il pool dedicato alle chiamate di rete sincrone"""
+    global _network_executor
+    with _executor_lock:
+        if _network_executor is None:
+            _network_executor = ThreadPoolExecutor(
+                max_workers=MAX_NETWORK_WORKERS,
+                thread_name_prefix="seo-agent-network"
+            )
+        return _network_executor
+
+
+async def run_blocking(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Esegue una funzione bloccante nel pool condiviso e ne attende il risultato.
+
+    Args:
+        func: Funzione sincrona da eseguire
+        *args, **kwargs: Argomenti passati alla funzione
+
+    Returns:
+        Il valore restituito da func
+    
+    func gira nel contesto di chi la chiama: utente, app e span corrente
+    (context variable) restano visibili anche nel thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), partial(context.run, func, *args, **kwargs))
+
+
+async def run_network(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Come run_blocking, ma nel pool dedicato alle chiamate di rete.
+
+    Da usare per client sincroni che restano in attesa della rete (secondi,
+    non millisecondi): il pool condiviso resta libero per il lavoro CPU e I/O locale.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_network_executor(), partial(context.run, func, *args, **kwargs)
+    )
+
+
+def _reset_after_fork() -> None:
+    # Un processo figlio (fork) eredita il pool ma non i suoi thread: ne crea uno nuovo
+    global _executor, _network_executor, _executor_lock
+    _executor = None
+    _network_executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def shutdown_executor() -> None:
+    """Chiude i pool di thread (da chiamare allo shutdown dell'applicazione)"""
+    global _executor, _network_executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _network_executor is not None:
+            _network_executor.shutdown(wait=False)
+            _network_executor = None
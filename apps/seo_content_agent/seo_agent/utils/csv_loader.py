@@ -8,6 +8,8 @@ from pathlib import Path
 from dataclasses import dataclass
 from typing import List, Optional
 
+from .metrics import stage_timer
+
 
 @dataclass
 class KeywordData:
@@ -49,7 +51,6 @@ def load_seozoom_csv(file_path: str) -> List[KeywordData]:
     Returns:
         Lista di KeywordData con tutte le keyword
     """
-    keywords = []
     path = Path(file_path)
     
     if not path.exists():
@@ -59,6 +60,29 @@ def load_seozoom_csv(file_path: str) -> List[KeywordData]:
     with open(path, 'r', encoding='utf-8-sig') as f:
         content = f.read()
     
+    return parse_seozoom_csv(content)
+
+
+def parse_seozoom_csv(content: str) -> List[KeywordData]:
+    """
+    Esegue il parsing del contenuto di un CSV SEOZoom già letto in memoria
+    
+    Args:
+        content: Testo del file CSV (senza BOM)
+        
+    Returns:
+        Lista di KeywordData con tutte le keyword
+    """
+    with stage_timer("csv_parse") as stage:
+        keywords = _parse_rows(content)
+        stage.bytes = len(content.encode("utf-8"))
+        stage.rows = len(keywords)
+    return keywords
+
+
+def _parse_rows(content: str) -> List[KeywordData]:
+    keywords = []
+    
     # Fix per header SEOZoom con newline nelle colonne quotate
     # Es: "_t(""CPC\nMedio"")" diventa "_t(""CPC Medio"")"
     lines = content.split('\n')
@@ -227,6 +251,13 @@ def get_keyword_clusters(
     Returns:
         Dizionario con cluster di keyword
     """
+    with stage_timer("cluster_analysis") as stage:
+        clusters = _cluster_keywords(keywords)
+        stage.rows = sum(1 for members in clusters.values() if members)
+    return clusters
+
+
+def _cluster_keywords(keywords: List[KeywordData]) -> dict:
     clusters = {
         'principale': [],
         'prezzi': [],
@@ -0,0 +1,122 @@
+"""
+Deadline - Budget di latenza per richiesta e degradazione controllata
+
+Ogni generazione riceve un budget complessivo (secondi) suddiviso tra le
+fasi. Le fasi di raccolta dati che sforano la loro quota non fanno fallire
+la richiesta ma degradano (meno keyword SERP, dati SERP in cache scaduti,
+nessun dato competitor, prodotti solo quelli forniti); la chiamata al modello
+usa il tempo rimanente. Le degradazioni applicate vengono riportate
+nell'output.
+
+Il budget di default si configura con SEO_AGENT_REQUEST_BUDGET (secondi).
+"""
+
+import os
+import math
+import time
+import asyncio
+import threading
+import logging
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_BUDGET = float(os.getenv("SEO_AGENT_REQUEST_BUDGET", "180"))
+
+# Quota massima del budget per ciascuna fase di raccolta dati (girano in parallelo)
+STAGE_SHARES = {
+    "serp": 0.15,
+    "products": 0.15
+}
+# Quota da lasciare libera per la chiamata al modello e per la correzione dei campi
+LLM_RESERVE = 0.5
+REPAIR_SHARE = 0.15
+# Sotto questa soglia una fase opzionale non viene nemmeno avviata
+MIN_STAGE_SECONDS = 1.0
+
+
+class DeadlineExceeded(Exception):
+    """Budget della richiesta esaurito in una fase non degradabile (es. il modello)"""
+
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Tempo massimo della richiesta ({budget:.0f}s) superato nella fase {stage}")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    """
+    Scadenza assoluta di una richiesta e registro delle degradazioni.
+
+    Il tempo è misurato con l'orologio monotono dal momento della creazione:
+    per i job in coda va creata quando il job parte, non quando viene accodato.
+    Con budget None non c'è scadenza (le degradazioni restano registrate,
+    es. dati SERP scaduti usati perché la ricerca non ha dato risultati).
+    """
+
+    def __init__(self, budget: Optional[float] = DEFAULT_BUDGET):
+        self.budget = budget
+        self._end = time.monotonic() + budget if budget is not None else math.inf
+        self._lock = threading.Lock()
+        self.degradations: List[Dict[str, str]] = []
+
+    @property
+    def unlimited(self) -> bool:
+        return self.budget is None
+
+    def remaining(self) -> float:
+        return max(0.0, self._end - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def _timeout(self) -> Optional[float]:
+        return None if self.unlimited else self.remaining()
+
+    def stage_budget(self, stage: str) -> Optional[float]:
+        """
+        Secondi concessi a una fase di raccolta dati (None: nessun limite):
+        la sua quota del budget, senza intaccare la riserva per il modello.
+        """
+        if self.unlimited:
+            return None
+        share = STAGE_SHARES.get(stage, 0.1) * self.budget
+        return max(0.0, min(share, self.remaining() - LLM_RESERVE * self.budget))
+
+    def allows_repair(self) -> bool:
+        return self.unlimited or self.remaining() >= REPAIR_SHARE * self.budget
+
+    def degrade(self, stage: str, action: str, detail: str = "") -> None:
+        """Registra una degradazione applicata (es. serp/stale/"costumi donna")"""
+        with self._lock:
+            self.degradations.append({"stage": stage, "action": action, "detail": detail})
+        logger.warning(f"⏳ Degradazione {stage}: {action}{' - ' + detail if detail else ''}")
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Attende awaitable entro il tempo rimanente, altrimenti DeadlineExceeded"""
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self._timeout())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage, self.budget) from None
+
+    async def stream(self, stage: str, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Inoltra lo stream finché ogni frammento arriva entro il tempo rimanente"""
+        try:
+            while True:
+                try:
+                    chunk = await self.run(stage, stream.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+def new_deadline(budget: Optional[float] = None) -> Deadline:
+    """Deadline con il budget richiesto (se positivo) o quello di default"""
+    return Deadline(budget if budget and budget > 0 else DEFAULT_BUDGET)
@@ -0,0 +1,252 @@
+"""
+Hedging - Richieste "di riserva" per contenere la latenza di coda delle chiamate LLM
+
+Se la richiesta principale non risponde (o non produce il primo token, in
+streaming) entro una soglia calcolata sul percentile delle latenze recenti,
+parte una seconda richiesta, eventualmente verso un modello più veloce.
+Vince la prima risposta, l'altra viene cancellata.
+
+Si abilita con SEO_AGENT_HEDGE=1; SEO_AGENT_HEDGE_MODEL sceglie il modello
+di riserva (default: lo stesso della richiesta principale).
+"""
+
+import os
+import time
+import asyncio
+import threading
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class HedgePolicy:
+    """
+    Soglia di hedging e statistiche, condivise dal processo.
+
+    Le latenze sono raccolte per chiave (es. "gpt-4o:run", "gpt-4o:ttft"):
+    la soglia è il percentile configurato delle ultime window osservazioni,
+    limitato tra min_delay e max_delay. Finché i campioni sono meno di
+    min_samples si usa default_delay.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_delay: float = 2.0,
+        max_delay: float = 60.0,
+        default_delay: float = 20.0,
+        min_samples: int = 20,
+        window: int = 200,
+        hedge_model: Optional[str] = None
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.hedge_model = hedge_model
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._fired = 0
+        self._hedge_wins = 0
+        self._saved = 0.0
+
+    # ==================== LATENZE ====================
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, key: str) -> float:
+        """Secondi da attendere prima di lanciare la richiesta di riserva"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(self.percentile / 100 * len(samples)))
+        return min(self.max_delay, max(self.min_delay, samples[index]))
+
+    def _expected_beyond(self, key: str, elapsed: float) -> float:
+        """Latenza attesa di una richiesta che ha già superato elapsed secondi"""
+        with self._lock:
+            slower = [s for s in self._samples.get(key, ()) if s > elapsed]
+        return sum(slower) / len(slower) if slower else elapsed
+
+    # ==================== STATISTICHE ====================
+
+    def _count(self, fired: bool = False, hedge_won: bool = False, saved: float = 0.0) -> None:
+        with self._lock:
+            self._requests += 1
+            self._fired += fired
+            self._hedge_wins += hedge_won
+            self._saved += saved
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedge lanciati, vinti e stima dei secondi risparmiati"""
+        with self._lock:
+            stats = {
+                "requests": self._requests,
+                "hedges_fired": self._fired,
+                "hedge_wins": self._hedge_wins,
+                "hedge_rate": round(self._fired / self._requests, 3) if self._requests else 0.0,
+                "estimated_saved_s": round(self._saved, 2)
+            }
+            keys = list(self._samples)
+        stats["delays_s"] = {key: round(self.delay(key), 2) for key in keys}
+        return stats
+
+
+async def _cancel(task: Optional[asyncio.Future]) -> None:
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+
+
+async def hedged_call(
+    primary: Callable[[], Awaitable[T]],
+    backup: Callable[[], Awaitable[T]],
+    policy: HedgePolicy,
+    key: str
+) -> Tuple[T, bool]:
+    """
+    Esegue primary; se non termina entro la soglia lancia anche backup.
+
+    Un errore della principale prima della soglia viene propagato (i retry
+    non sono compito dell'hedging); dopo la soglia si attende l'altra.
+
+    Returns:
+        (risultato, True se ha vinto la richiesta di riserva)
+    """
+    start = time.monotonic()
+    primary_task = asyncio.ensure_future(primary())
+    backup_task = None
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=policy.delay(key))
+        if done:
+            result = primary_task.result()
+            policy.record(key, time.monotonic() - start)
+            policy._count()
+            return result, False
+
+        logger.info(f"🏁 Hedge su {key} dopo {time.monotonic() - start:.1f}s")
+        backup_task = asyncio.ensure_future(backup())
+        pending = {primary_task, backup_task}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                elapsed = time.monotonic() - start
+                hedge_won = task is backup_task
+                saved = policy._expected_beyond(key, elapsed) - elapsed if hedge_won else 0.0
+                if not hedge_won:
+                    policy.record(key, elapsed)
+                policy._count(fired=True, hedge_won=hedge_won, saved=saved)
+                return task.result(), hedge_won
+        policy._count(fired=True)
+        raise error
+    finally:
+        await _cancel(primary_task)
+        await _cancel(backup_task)
+
+
+async def hedged_stream(
+    primary: Callable[[], AsyncIterator[T]],
+    backup: Callable[[], AsyncIterator[T]],
+    policy: HedgePolicy,
+    key: str
+) -> AsyncIterator[T]:
+    """
+    Versione streaming: la soglia si applica al primo frammento (TTFT).
+    Lo stream che produce per primo un frammento prosegue, l'altro viene chiuso.
+    """
+    start = time.monotonic()
+    streams = {"primary": primary()}
+    firsts = {"primary": asyncio.ensure_future(streams["primary"].__anext__())}
+    winner = None
+    try:
+        done, _ = await asyncio.wait({firsts["primary"]}, timeout=policy.delay(key))
+        if done:
+            exc = firsts["primary"].exception()
+            if exc is not None and not isinstance(exc, StopAsyncIteration):
+                raise exc
+            winner = "primary"
+        else:
+            logger.info(f"🏁 Hedge streaming su {key} dopo {time.monotonic() - start:.1f}s")
+            streams["backup"] = backup()
+            firsts["backup"] = asyncio.ensure_future(streams["backup"].__anext__())
+            pending = set(firsts.values())
+            error = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for name, task in firsts.items():
+                    if task not in done:
+                        continue
+                    exc = task.exception()
+                    if exc is None or isinstance(exc, StopAsyncIteration):
+                        winner = name
+                        break
+                    error = error or exc
+            if winner is None:
+                policy._count(fired=True)
+                raise error
+
+        elapsed = time.monotonic() - start
+        hedge_won = winner == "backup"
+        if hedge_won:
+            policy._count(fired=True, hedge_won=True, saved=policy._expected_beyond(key, elapsed) - elapsed)
+        else:
+            policy.record(key, elapsed)
+            policy._count(fired="backup" in streams)
+
+        # Chiude subito lo stream perdente
+        for name in list(firsts):
+            if name != winner:
+                await _cancel(firsts[name])
+                await streams.pop(name).aclose()
+
+        first = firsts[winner]
+        if isinstance(first.exception(), StopAsyncIteration):
+            return
+        yield first.result()
+        async for chunk in streams[winner]:
+            yield chunk
+    finally:
+        for name, task in firsts.items():
+            await _cancel(task)
+        for stream in streams.values():
+            await stream.aclose()
+
+
+_default_policy: Optional[HedgePolicy] = None
+_default_lock = threading.Lock()
+
+
+def default_hedge_policy() -> Optional[HedgePolicy]:
+    """
+    Policy condivisa dal processo, o None se l'hedging è disabilitato.
+    Si abilita con SEO_AGENT_HEDGE=1.
+    """
+    global _default_policy
+    if os.getenv("SEO_AGENT_HEDGE", "0") not in ("1", "true", "yes"):
+        return None
+    with _default_lock:
+        if _default_policy is None:
+            _default_policy = HedgePolicy(
+                percentile=float(os.getenv("SEO_AGENT_HEDGE_PERCENTILE", "95")),
+                min_delay=float(os.getenv("SEO_AGENT_HEDGE_MIN_DELAY", "2")),
+                default_delay=float(os.getenv("SEO_AGENT_HEDGE_DEFAULT_DELAY", "20")),
+                hedge_model=os.getenv("SEO_AGENT_HEDGE_MODEL") or None
+            )
+        return _default_policy
@@ -0,0 +1,236 @@
+"""
+Idempotency - Deduplica delle richieste di generazione
+
+Doppi clic e retry del browser avviano ciascuno una pipeline completa
+(SERP, scraping, chiamata al modello). Ogni richiesta ha una chiave di
+idempotenza, esplicita (header Idempotency-Key) o derivata dal contenuto:
+i duplicati che arrivano mentre l'originale è in corso si agganciano alla
+stessa esecuzione (ricevendo anche gli eventi già emessi, se in stream),
+quelli che arrivano dopo ricevono il risultato salvato entro la finestra
+SEO_AGENT_IDEMPOTENCY_WINDOW (secondi, default 600; 0: solo aggancio alle
+esecuzioni in corso). Ogni richiesta può indicare una finestra diversa, es.
+0 per le chiavi derivate dal contenuto.
+
+L'esecuzione condivisa viene cancellata solo quando tutti i client
+agganciati se ne sono andati. Le esecuzioni fallite non vengono salvate:
+un retry riparte da zero.
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+import threading
+import logging
+from collections import Counter, OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Ruolo di una richiesta rispetto all'esecuzione con la stessa chiave
+ORIGINAL = "original"
+ATTACHED = "attached"
+REPLAYED = "replayed"
+
+
+class IdempotencyConflict(ValueError):
+    """Chiave di idempotenza già usata per una richiesta con contenuto diverso"""
+
+
+def request_key(scope: str, payload: Dict[str, Any], explicit: str = "") -> Tuple[str, str]:
+    """
+    Chiave di idempotenza e impronta del contenuto di una richiesta.
+    Senza chiave esplicita la chiave è l'impronta stessa: richieste identiche
+    sullo stesso endpoint (scope) sono duplicati.
+    """
+    data = json.dumps([scope, payload], sort_keys=True, ensure_ascii=False, default=str)
+    fingerprint = hashlib.sha256(data.encode("utf-8")).hexdigest()
+    return (f"{scope}:{explicit}" if explicit else fingerprint), fingerprint
+
+
+class _Execution:
+    """Esecuzione condivisa: elementi prodotti finora e client agganciati"""
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.items: List[Any] = []
+        self.done = False
+        self.failed = False
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self.task: Optional[asyncio.Future] = None
+        self.expires = math.inf
+        self.window: Optional[float] = None
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class IdempotencyStore:
+    """
+    Esecuzioni in corso e risultati recenti per chiave di idempotenza.
+
+    Vive nell'event loop dell'applicazione web (non è thread-safe) ed è
+    locale al processo: con più worker i duplicati vengono deduplicati
+    solo se arrivano allo stesso processo.
+    """
+
+    def __init__(self, window: float = 600, max_entries: int = 256):
+        self.window = window
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Execution]" = OrderedDict()
+        self._counts: Counter = Counter()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e.done and e.expires <= now]:
+            del self._entries[key]
+        stored = [k for k, e in self._entries.items() if e.done]
+        for key in stored[:max(0, len(stored) - self.max_entries)]:
+            del self._entries[key]
+
+    def _lookup(self, key: str, fingerprint: str) -> Optional[_Execution]:
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None and entry.fingerprint != fingerprint:
+            raise IdempotencyConflict("Chiave di idempotenza già usata per una richiesta diversa")
+        return entry
+
+    def _discard(self, key: str, entry: _Execution) -> None:
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def role(self, key: str, fingerprint: str) -> str:
+        """Ruolo che avrebbe ora una richiesta con questa chiave (ORIGINAL, ATTACHED, REPLAYED)"""
+        entry = self._lookup(key, fingerprint)
+        if entry is None:
+            return ORIGINAL
+        return REPLAYED if entry.done else ATTACHED
+
+    async def _produce(
+        self,
+        key: str,
+        entry: _Execution,
+        factory: Callable[[], AsyncIterator[T]],
+        failed: Optional[Callable[[T], bool]]
+    ) -> None:
+        try:
+            async for item in factory():
+                entry.items.append(item)
+                entry.failed = entry.failed or bool(failed and failed(item))
+                entry.notify()
+        except BaseException as e:
+            # L'errore arriva ai client agganciati; la cancellazione va propagata
+            entry.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            entry.done = True
+            window = self.window if entry.window is None else entry.window
+            if entry.error is not None or entry.failed or window <= 0:
+                self._discard(key, entry)
+            else:
+                entry.expires = time.monotonic() + window
+                self._entries.move_to_end(key)
+            entry.notify()
+
+    async def stream(
+        self,
+        key: str,
+        fingerprint: str,
+        factory: Callable[[], AsyncIterator[T]],
+        failed: Optional[Callable[[T], bool]] = None,
+        window: Optional[float] = None
+    ) -> AsyncIterator[T]:
+        """
+        Elementi dell'esecuzione con questa chiave, dal primo: factory viene
+        invocata solo se non ce n'è una in corso o salvata. Un'esecuzione con
+        un elemento per cui failed(item) è vero non viene salvata; window
+        (default: quella dello store) è la durata del risultato salvato.
+
+        Raises:
+            IdempotencyConflict: chiave esplicita riusata con contenuto diverso
+        """
+        entry = self._lookup(key, fingerprint)
+        if entry is None:
+            entry = _Execution(fingerprint)
+            entry.window = window
+            self._entries[key] = entry
+            entry.task = asyncio.ensure_future(self._produce(key, entry, factory, failed))
+            self._counts[ORIGINAL] += 1
+        else:
+            self._counts[REPLAYED if entry.done else ATTACHED] += 1
+            logger.info(f"♻️ Richiesta duplicata {'servita dal risultato salvato' if entry.done else 'agganciata'}")
+
+        entry.waiters += 1
+        index = 0
+        try:
+            while True:
+                while index < len(entry.items):
+                    yield entry.items[index]
+                    index += 1
+                if entry.done:
+                    if entry.error is not None:
+                        raise entry.error
+                    return
+                await entry.changed.wait()
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.done:
+                # Nessun client in attesa: l'esecuzione condivisa non serve più
+                self._discard(key, entry)
+                entry.task.cancel()
+
+    async def call(
+        self,
+        key: str,
+        fingerprint: str,
+        factory: Callable[[], Awaitable[T]],
+        window: Optional[float] = None
+    ) -> T:
+        """Come stream, per un'esecuzione con un solo risultato"""
+        async def single():
+            yield await factory()
+
+        events = self.stream(key, fingerprint, single, window=window)
+        try:
+            return await events.__anext__()
+        finally:
+            await events.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Richieste originali, agganciate e servite dal risultato salvato"""
+        self._expire()
+        requests = sum(self._counts.values())
+        deduplicated = self._counts[ATTACHED] + self._counts[REPLAYED]
+        return {
+            "requests": requests,
+            "original": self._counts[ORIGINAL],
+            "attached": self._counts[ATTACHED],
+            "replayed": self._counts[REPLAYED],
+            "dedup_rate": round(deduplicated / requests, 3) if requests else 0.0,
+            "in_flight": sum(1 for e in self._entries.values() if not e.done),
+            "stored": sum(1 for e in self._entries.values() if e.done),
+            "window_s": self.window
+        }
+
+
+_default_store: Optional[IdempotencyStore] = None
+_default_lock = threading.Lock()
+
+
+def default_idempotency_store() -> IdempotencyStore:
+    """Store condiviso dal processo, configurato da SEO_AGENT_IDEMPOTENCY_WINDOW"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = IdempotencyStore(
+                window=float(os.getenv("SEO_AGENT_IDEMPOTENCY_WINDOW", "600"))
+            )
+        return _default_store
@@ -0,0 +1,344 @@
+"""
+Job Queue - Coda locale di job in background con stato persistente su SQLite
+
+I job vengono inviati e ricevono subito un ID; un pool di worker asyncio a
+concorrenza limitata li esegue. Stato, fase corrente e risultato sono salvati
+su SQLite, quindi sono consultabili da qualsiasi processo e sopravvivono ai
+riavvii. I job rimasti "running" oltre il lease vengono rimessi in coda.
+Un job può essere annullato da qualsiasi processo: se è in esecuzione, il
+worker se ne accorge al polling successivo e cancella l'handler.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import tempfile
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS_DB = Path(
+    os.getenv("SEO_AGENT_JOBS_DB", Path(tempfile.gettempdir()) / "seo_agent_jobs.sqlite3")
+)
+
+# Stati possibili di un job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Handler di un job: riceve i parametri e una callback di progresso (nome fase)
+JobHandler = Callable[[Dict[str, Any], Callable[[str], None]], Awaitable[Dict[str, Any]]]
+# Callback di annullamento di un job in esecuzione: parametri e ultima fase raggiunta
+CancelHook = Callable[[Dict[str, Any], Optional[str]], None]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    stages TEXT NOT NULL DEFAULT '{}',
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Coda di job persistente con pool di worker a concorrenza limitata.
+
+    I metodi di accesso allo stato sono sincroni (SQLite locale, pochi ms);
+    il pool di worker gira nell'event loop dell'applicazione.
+    """
+
+    def __init__(
+        self,
+        db_path: Path = DEFAULT_JOBS_DB,
+        concurrency: int = 2,
+        lease: float = 600,
+        retention: float = 7 * 24 * 3600,
+        poll_interval: float = 1.0,
+        on_cancel: CancelHook = None
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.concurrency = concurrency
+        self.lease = lease
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.on_cancel = on_cancel
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    # ==================== STATO ====================
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """Registra l'handler per un tipo di job"""
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        """Mette in coda un job e restituisce il suo ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params, ensure_ascii=False), now, now)
+            )
+        # submit gira anche nei thread di run_blocking: asyncio.Event va impostato dal suo loop
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._wakeup.set)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Restituisce lo stato di un job (con il risultato se completato)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "stages": json.loads(row["stages"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+
+    def status(self, job_id: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Annulla un job in coda o in esecuzione (quelli conclusi restano invariati).
+
+        Returns:
+            Stato del job prima della richiesta, None se non esiste
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is not None and row["status"] in (QUEUED, RUNNING):
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                        (CANCELLED, time.time(), job_id)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return row["status"] if row else None
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Prende in carico il job in coda più vecchio (atomico tra processi)"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, now, row["id"])
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _set_stage(self, job_id: str, stage: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, stages = json_set(stages, '$.' || ?, ?), "
+                "updated_at = ? WHERE id = ?",
+                (stage, stage, now, now, job_id)
+            )
+
+    def _finish(self, job_id: str, result: Dict[str, Any] = None, error: str = None) -> None:
+        # Solo se ancora in esecuzione: un job annullato nel frattempo resta annullato
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (
+                    FAILED if error else DONE,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                    RUNNING
+                )
+            )
+
+    def _requeue(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), job_id, RUNNING)
+            )
+
+    def recover(self) -> int:
+        """
+        Rimette in coda i job "running" fermi oltre il lease (processo caduto)
+        ed elimina i job conclusi più vecchi della retention.
+
+        Returns:
+            Numero di job rimessi in coda
+        """
+        now = time.time()
+        with self._connect() as conn:
+            requeued = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, now, RUNNING, now - self.lease)
+            ).rowcount
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?",
+                (DONE, FAILED, CANCELLED, now - self.retention)
+            )
+        if requeued:
+            logger.info(f"♻️ Rimessi in coda {requeued} job interrotti")
+        return requeued
+
+    # ==================== WORKER POOL ====================
+
+    async def _run_job(self, row: sqlite3.Row) -> None:
+        job_id = row["id"]
+        handler = self._handlers.get(row["kind"])
+        if handler is None:
+            await run_blocking(self._finish, job_id, error=f"Tipo di job sconosciuto: {row['kind']}")
+            return
+
+        params = json.loads(row["params"])
+        reached = {"stage": row["stage"]}
+        writes = {"last": None}
+
+        def progress(stage: str) -> None:
+            # Chiamata dall'event loop: la scrittura va nel pool, in ordine di fase
+            reached["stage"] = stage
+            writes["last"] = asyncio.ensure_future(self._write_stage(job_id, stage, writes["last"]))
+
+        work = asyncio.ensure_future(handler(params, progress))
+        watcher = asyncio.ensure_future(self._watch_cancel(job_id, work))
+        try:
+            try:
+                result = await work
+            finally:
+                if writes["last"] is not None:
+                    await asyncio.wait([writes["last"]])
+        except asyncio.CancelledError:
+            cancelled = (
+                watcher.done() and not watcher.cancelled()
+                and watcher.exception() is None and watcher.result()
+            )
+            if not cancelled:
+                # Shutdown: il job torna in coda per il prossimo avvio
+                await run_blocking(self._requeue, job_id)
+                raise
+            logger.info(f"🛑 Job {job_id} annullato durante la fase {reached['stage']}")
+            if self.on_cancel is not None:
+                self.on_cancel(params, reached["stage"])
+        except Exception as e:
+            logger.exception(f"❌ Job {job_id} fallito")
+            await run_blocking(self._finish, job_id, error=str(e))
+        else:
+            await run_blocking(self._finish, job_id, result=result)
+        finally:
+            watcher.cancel()
+
+    async def _write_stage(self, job_id: str, stage: str, previous: Optional[asyncio.Future]) -> None:
+        """Salva la fase dopo quella precedente; un errore non interrompe il job"""
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await run_blocking(self._set_stage, job_id, stage)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Fase {stage} del job {job_id} non salvata: {e}")
+
+    async def _watch_cancel(self, job_id: str, work: asyncio.Future) -> bool:
+        """Cancella l'handler quando il job viene annullato (anche da un altro processo)"""
+        while not work.done():
+            await asyncio.sleep(self.poll_interval)
+            if await run_blocking(self.status, job_id) == CANCELLED:
+                work.cancel()
+                return True
+        return False
+
+    async def _worker(self) -> None:
+        while True:
+            row = await run_blocking(self._claim)
+            if row is None:
+                # Nessun job: attendi un submit locale o il prossimo polling
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(row)
+
+    async def start(self) -> None:
+        """Avvia il pool di worker nell'event loop corrente"""
+        if self._workers:
+            return
+        await run_blocking(self.recover)
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        logger.info(f"🚀 Job queue avviata con {self.concurrency} worker")
+
+    async def stop(self) -> None:
+        """
+        Ferma il pool: i job in esecuzione vengono interrotti e rimessi subito
+        in coda, pronti per il prossimo avvio (solo un processo caduto senza
+        stop lascia i job "running" fino alla scadenza del lease).
+        """
+        self._loop = None
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
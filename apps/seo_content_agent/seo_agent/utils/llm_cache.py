@@ -0,0 +1,200 @@
+"""
+LLM Cache - Cache su disco delle risposte del modello, indicizzata per contenuto
+
+La chiave è l'hash di modello, system prompt, prompt utente e parametri di
+campionamento: input identici restituiscono la risposta salvata senza
+chiamare il modello. La cache è opzionale (SEO_AGENT_LLM_CACHE=1) e limitata
+per dimensione totale ed età delle voci.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .metrics import record_cache
+from .usage import TokenUsage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(
+    os.getenv("SEO_AGENT_LLM_CACHE_DIR", Path(tempfile.gettempdir()) / "seo_agent_llm_cache")
+)
+
+
+@dataclass
+class CachedResponse:
+    """Risposta del modello salvata in cache"""
+    text: str
+    usage: TokenUsage
+    created_at: float
+
+
+class LLMCache:
+    """
+    Cache content-addressed delle risposte LLM.
+
+    Ogni voce è un file JSON (scrittura atomica) in una sottocartella per
+    prefisso dell'hash. L'eviction rimuove prima le voci scadute, poi le
+    meno usate di recente finché la dimensione rientra nel limite.
+    """
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_CACHE_DIR,
+        max_bytes: int = 200 * 1024 * 1024,
+        max_age: float = 7 * 24 * 3600,
+        evict_interval: float = 60
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._saved = TokenUsage()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str, **params: Any) -> str:
+        """Hash SHA-256 degli input che determinano la risposta"""
+        payload = json.dumps(
+            {
+                "model": model,
+                "system": system_prompt,
+                "user": user_prompt,
+                "params": params
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Restituisce la risposta in cache o None (voce assente o scaduta)"""
+        path = self._path(key)
+        try:
+            if path.stat().st_mtime + self.max_age < time.time():
+                path.unlink(missing_ok=True)
+                raise FileNotFoundError
+            data = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)  # Aggiorna il "last used" per l'eviction LRU
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self._misses += 1
+            record_cache("llm", "miss")
+            return None
+
+        usage = TokenUsage(**data.get("usage", {}))
+        with self._lock:
+            self._hits += 1
+            self._saved = self._saved + usage
+        record_cache("llm", "hit")
+        return CachedResponse(text=data["text"], usage=usage, created_at=data.get("created_at", 0.0))
+
+    def put(self, key: str, text: str, usage: TokenUsage = None) -> None:
+        """Salva una risposta in cache (scrittura atomica)"""
+        usage = usage or TokenUsage()
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = {
+            "text": text,
+            "usage": {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cached_tokens": usage.cached_tokens
+            },
+            "created_at": time.time()
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self, force: bool = False) -> int:
+        """
+        Applica i limiti di età e dimensione.
+        Eseguita al massimo una volta ogni evict_interval secondi.
+
+        Returns:
+            Numero di voci rimosse
+        """
+        now = time.time()
+        if not force and now - self._last_evict < self.evict_interval:
+            return 0
+        self._last_evict = now
+
+        entries = []
+        removed = 0
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime + self.max_age < now:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"🧹 Cache LLM: rimosse {removed} voci")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate e token risparmiati dall'avvio del processo"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "saved_prompt_tokens": self._saved.prompt_tokens,
+                "saved_completion_tokens": self._saved.completion_tokens,
+                "saved_tokens": self._saved.total_tokens
+            }
+
+
+_default_cache: Optional[LLMCache] = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> Optional[LLMCache]:
+    """
+    Cache condivisa dal processo, o None se disabilitata.
+    Si abilita con SEO_AGENT_LLM_CACHE=1.
+    """
+    global _default_cache
+    if os.getenv("SEO_AGENT_LLM_CACHE", "0") not in ("1", "true", "yes"):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache(
+                max_bytes=int(float(os.getenv("SEO_AGENT_LLM_CACHE_MAX_MB", "200")) * 1024 * 1024),
+                max_age=float(os.getenv("SEO_AGENT_LLM_CACHE_MAX_AGE_H", "168")) * 3600
+            )
+        return _default_cache
@@ -0,0 +1,129 @@
+"""
+Logs - Logging strutturato e non bloccante per le app web
+
+configure_logging installa sul logger root un QueueHandler: chi logga (anche
+dall'event loop) mette solo il record in una coda, mentre un thread dedicato
+(QueueListener) lo formatta e lo scrive su stderr. Ogni record è una riga
+JSON con servizio, livello, logger, messaggio, utente e app della richiesta
+corrente (dalle context variable dello scheduler e del registro consumi),
+trace e span correnti (tracing.py) e i campi passati con extra={...}.
+
+Configurazione: SEO_AGENT_LOG_FORMAT (json o text, default json),
+SEO_AGENT_LOG_LEVEL (default INFO).
+"""
+
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .scheduler import current_owner
+from .tracing import current_span_context
+from .usage_ledger import usage_context
+
+# Attributi standard di LogRecord: tutto il resto arriva da extra={...}
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+_CONTEXT = ("service", "user", "app", "category", "trace_id", "span_id")
+
+
+class _ContextFilter(logging.Filter):
+    """
+    Aggiunge al record servizio, utente, app, categoria e span corrente
+    (per collegare i log alle tracce). Gira nel thread di chi logga, dove
+    le context variable della richiesta sono visibili.
+    """
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.service = self.service
+        record.user, _ = current_owner()
+        record.app, record.category = usage_context()
+        span = current_span_context()
+        record.trace_id = span.trace_id if span else ""
+        record.span_id = span.span_id if span else ""
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una riga JSON per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key in _CONTEXT:
+            value = getattr(record, key, "")
+            if value:
+                entry[key] = value
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key not in _CONTEXT and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    Come QueueHandler, ma lascia la formattazione al thread di scrittura:
+    qui si risolvono solo messaggio e traceback (argomenti ed eccezione
+    possono cambiare o non essere serializzabili dopo l'accodamento).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging(service: str, level: Optional[str] = None) -> None:
+    """
+    Logging del processo per il servizio indicato (es. "seo_agent", "login").
+    Le chiamate successive alla prima non hanno effetto.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(sys.stderr)
+        if os.getenv("SEO_AGENT_LOG_FORMAT", "json").lower() == "text":
+            output.setFormatter(logging.Formatter(
+                "%(asctime)s %(levelname)s [%(service)s] %(name)s: %(message)s"
+            ))
+        else:
+            output.setFormatter(JsonFormatter())
+
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        handler = _RecordQueueHandler(records)
+        handler.addFilter(_ContextFilter(service))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel((level or os.getenv("SEO_AGENT_LOG_LEVEL", "INFO")).upper())
+
+        _listener = QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
@@ -0,0 +1,197 @@
+"""
+Markdown Parser - Parser incrementale dell'output Markdown generato
+
+Una sola passata, riga per riga, con una piccola macchina a stati (corpo /
+FAQ): il testo può arrivare a frammenti durante lo streaming e ogni campo
+(meta title, meta description, H1, H2, FAQ, SEO keywords) viene emesso
+appena la sua riga, o la sua sezione per le FAQ, è completa.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+# Stati del parser
+BODY = "body"
+FAQ = "faq"
+
+FieldEvent = Tuple[str, object]
+
+# Marcatore di elenco puntato o numerato a inizio riga ("- ", "1. ", "2) ")
+_LIST_MARKER = re.compile(r"^(?:[-*+]|\d+[.)])\s+")
+
+
+def _heading(line: str) -> Tuple[int, str]:
+    """Livello e testo di un titolo Markdown ("### Testo" -> 3), (0, "") se non lo è"""
+    text = line.lstrip("#")
+    level = len(line) - len(text)
+    if not level or (text and not text.startswith(" ")):
+        return 0, ""
+    return level, text.strip()
+
+
+def _bold_line(line: str) -> Optional[str]:
+    """Testo di una riga interamente in grassetto, anche in un elenco ("1. **Testo**")"""
+    text = _LIST_MARKER.sub("", line.strip())
+    if len(text) > 4 and text.startswith("**") and text.endswith("**"):
+        return text[2:-2].strip()
+    return None
+
+
+def _is_faq_title(text: str) -> bool:
+    return "Domande Frequenti" in text or "FAQ" in text
+
+
+def _field_value(line: str, label: str) -> str:
+    """Valore di una riga "**Label:** valore" o "Label: valore" """
+    return line.replace(f"**{label}**", "").replace(label, "").strip()
+
+
+class MarkdownOutputParser:
+    """
+    Parser a stati dell'output nel formato del system prompt.
+
+        parser = MarkdownOutputParser()
+        for chunk in stream:
+            for field, value in parser.feed(chunk):
+                ...
+        parser.close()
+        parser.meta_title, parser.sections, parser.faq, ...
+
+    Dopo close() gli attributi contengono il risultato completo; feed() e
+    close() restituiscono i campi completati da quel frammento.
+
+    La sezione FAQ inizia da un titolo di qualsiasi livello o da
+    un'etichetta in grassetto con "Domande Frequenti" o "FAQ"; le domande
+    sono righe in grassetto (anche in un elenco numerato) o sottotitoli.
+    """
+
+    def __init__(self):
+        self.meta_title = ""
+        self.meta_description = ""
+        self.h1 = ""
+        self.sections: List[dict] = []
+        self.faq: List[dict] = []
+        self.seo_keywords: List[str] = []
+        self._state = BODY
+        self._buffer = ""
+        self._question = None
+        self._answer: List[str] = []
+        # Livello del titolo della sezione FAQ: un titolo di livello uguale o superiore la chiude
+        self._faq_level = 2
+
+    def feed(self, chunk: str) -> List[FieldEvent]:
+        """Aggiunge un frammento di testo e restituisce i campi completati"""
+        self._buffer += chunk
+        if "\n" not in chunk:
+            return []
+        *lines, self._buffer = self._buffer.split("\n")
+        events: List[FieldEvent] = []
+        handle = self._line
+        for line in lines:
+            # Righe di solo testo (la maggioranza): nessun campo da estrarre
+            if self._state == BODY and ":" not in line and not line.startswith(("#", "**")):
+                continue
+            handle(line, events)
+        return events
+
+    def close(self) -> List[FieldEvent]:
+        """Chiude il testo (ultima riga senza a capo, FAQ aperte) e restituisce gli ultimi campi"""
+        events: List[FieldEvent] = []
+        if self._buffer:
+            self._line(self._buffer, events)
+            self._buffer = ""
+        if self._state == FAQ:
+            self._close_faq(events)
+        return events
+
+    # ==================== STATI ====================
+
+    def _line(self, line: str, events: List[FieldEvent]) -> None:
+        if line.endswith("\r"):
+            line = line[:-1]
+        if self._state == FAQ and self._faq_line(line, events):
+            return
+
+        level, title = _heading(line)
+        if level:
+            if level > 1 and _is_faq_title(title):
+                self._open_faq(level)
+            elif level == 2:
+                self.sections.append({"h2": title})
+                events.append(("h2", title))
+            elif level == 1 and not self.h1:
+                self.h1 = title
+                events.append(("h1", self.h1))
+            return
+
+        # Sezione FAQ introdotta da un'etichetta in grassetto invece che da un titolo
+        label = _bold_line(line)
+        if label is not None and _is_faq_title(label) and ":" not in label.rstrip(":"):
+            self._open_faq(2)
+            return
+
+        if ":" not in line:
+            return
+        if "Meta Title:" in line:
+            self.meta_title = _field_value(line, "Meta Title:")
+            events.append(("meta_title", self.meta_title))
+        elif "Meta Description:" in line:
+            self.meta_description = _field_value(line, "Meta Description:")
+            events.append(("meta_description", self.meta_description))
+        elif "SEO Keywords:" in line:
+            text = _field_value(line, "SEO Keywords:")
+            self.seo_keywords = [k.strip() for k in text.split(",") if k.strip()]
+            events.append(("seo_keywords", self.seo_keywords))
+
+    def _faq_line(self, line: str, events: List[FieldEvent]) -> bool:
+        """
+        Gestisce una riga nella sezione FAQ.
+
+        Returns:
+            True se la riga è stata consumata, False se chiude le FAQ e va
+            interpretata come riga del corpo
+        """
+        stripped = line.strip()
+        if "SEO Keywords:" in stripped:
+            self._close_faq(events)
+            return False
+        if stripped == "---":
+            self._close_faq(events)
+            return True
+        level, title = _heading(line)
+        if level and level <= self._faq_level:
+            self._close_faq(events)
+            return False
+        # Domanda: riga interamente in grassetto (anche numerata) o sottotitolo
+        question = title if level else _bold_line(line)
+        if question:
+            self._end_answer()
+            self._question = question
+            return True
+        if self._question is not None and (stripped or self._answer):
+            self._answer.append(line)
+        return True
+
+    def _open_faq(self, level: int) -> None:
+        self._state = FAQ
+        self._faq_level = level
+
+    def _end_answer(self) -> None:
+        answer = "\n".join(self._answer).strip()
+        if self._question and answer:
+            self.faq.append({"question": self._question, "answer": answer})
+        self._question = None
+        self._answer = []
+
+    def _close_faq(self, events: List[FieldEvent]) -> None:
+        self._end_answer()
+        self._state = BODY
+        events.append(("faq", list(self.faq)))
+
+
+def parse_markdown(content: str) -> MarkdownOutputParser:
+    """Parsing di un testo completo in una sola passata"""
+    parser = MarkdownOutputParser()
+    parser.feed(content)
+    parser.close()
+    return parser
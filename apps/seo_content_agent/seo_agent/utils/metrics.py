@@ -0,0 +1,282 @@
+"""
+Metrics - Metriche per fase in formato Prometheus
+
+Ogni fase della generazione (parsing CSV, analisi dei cluster, ogni ricerca
+SERP, scraping dei prodotti, costruzione del prompt, chiamata al modello,
+parsing dell'output) registra durata (istogramma per fase ed esito), byte
+e righe elaborati; le cache registrano hit e miss. Le app web aggiungono la
+durata delle richieste HTTP per route e servono tutto su /metrics nel
+formato testuale di Prometheus.
+
+Le metriche sono locali al processo e non richiedono dipendenze: con più
+worker Prometheus raccoglie ogni processo separatamente.
+"""
+
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .tracing import INTERNAL, start_span
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Secondi: dalle letture in cache (ms) alle generazioni complete (minuti)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Esiti di una fase
+OK = "ok"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: etichette attese {self.labels}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _series(self, key: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contatore monotono per combinazione di etichette"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Un contatore non può diminuire")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._series(key)} {_format(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """Istogramma a bucket cumulativi (con somma e conteggio) per combinazione di etichette"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), ()))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format(bound)}"'
+                lines.append(f"{self.name}_bucket{self._series(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._series(key)} {_format(total)}")
+            lines.append(f"{self.name}_count{self._series(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metriche di un processo, renderizzate insieme per /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labels != metric.labels:
+                    raise ValueError(f"Metrica già registrata con un altro tipo o altre etichette: {metric.name}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Tutte le metriche nel formato testuale di Prometheus"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "seo_agent_stage_duration_seconds", "Durata delle fasi della generazione", ("stage", "outcome")
+)
+STAGE_BYTES = REGISTRY.counter(
+    "seo_agent_stage_bytes_total", "Byte elaborati dalle fasi (CSV, pagine, prompt, risposte)", ("stage",)
+)
+STAGE_ROWS = REGISTRY.counter(
+    "seo_agent_stage_rows_total", "Elementi prodotti dalle fasi (keyword, risultati, prodotti)", ("stage",)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "seo_agent_cache_lookups_total", "Letture delle cache per esito", ("cache", "outcome")
+)
+MODEL_TOKENS = REGISTRY.counter(
+    "seo_agent_model_tokens_total", "Token delle chiamate al modello", ("model", "type")
+)
+MODEL_ERRORS = REGISTRY.counter(
+    "seo_agent_model_errors_total", "Errori delle chiamate al modello per codice HTTP", ("status",)
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Durata delle richieste HTTP (per gli stream fino all'invio degli header)",
+    ("method", "route", "status")
+)
+
+
+class Stage:
+    """Fase in corso: byte, righe ed esito da registrare alla fine"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bytes = 0
+        self.rows = 0
+        self.outcome = OK
+
+
+@contextmanager
+def stage_timer(
+    name: str,
+    kind: int = INTERNAL,
+    attributes: Optional[Dict[str, Any]] = None
+) -> Iterator[Stage]:
+    """
+    Misura la fase nel blocco, che è anche uno span della traccia corrente
+    (kind CLIENT per le chiamate a servizi esterni). L'esito è error o
+    cancelled se il blocco solleva un'eccezione; il codice che gestisce da
+    sé gli errori può impostare stage.outcome. Funziona sia in codice
+    sincrono che asincrono.
+    """
+    stage = Stage(name)
+    start = time.perf_counter()
+    with start_span(name, kind, attributes) as span:
+        try:
+            yield stage
+        except asyncio.CancelledError:
+            stage.outcome = CANCELLED
+            raise
+        except BaseException:
+            stage.outcome = ERROR
+            raise
+        finally:
+            record_stage(stage, time.perf_counter() - start)
+            span.set_attribute("bytes", stage.bytes)
+            span.set_attribute("rows", stage.rows)
+            span.set_attribute("outcome", stage.outcome)
+
+
+def record_stage(stage: Stage, seconds: float) -> None:
+    """Registra una fase misurata altrove (es. durata di uno stream del modello)"""
+    STAGE_SECONDS.observe(seconds, stage=stage.name, outcome=stage.outcome)
+    if stage.bytes:
+        STAGE_BYTES.inc(stage.bytes, stage=stage.name)
+    if stage.rows:
+        STAGE_ROWS.inc(stage.rows, stage=stage.name)
+
+
+def record_cache(cache: str, outcome: str) -> None:
+    """Esito di una lettura in cache (hit, miss, stale, ...)"""
+    CACHE_LOOKUPS.inc(cache=cache, outcome=outcome)
+
+
+def http_metrics_middleware():
+    """
+    Middleware HTTP (app.middleware("http")) che misura ogni richiesta per
+    metodo, route (il modello del percorso, es. /api/jobs/{job_id}, per non
+    creare una serie per ogni ID) e codice di risposta.
+    """
+    async def middleware(request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_SECONDS.observe(
+                time.perf_counter() - start, method=request.method, route=path, status=str(status)
+            )
+    return middleware
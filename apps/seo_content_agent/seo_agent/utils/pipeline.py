@@ -0,0 +1,162 @@
+"""
+Pipeline - Esecuzione a grafo (DAG) delle fasi di generazione
+
+Ogni fase dichiara le fasi da cui dipende e parte appena queste sono
+terminate: i lavori indipendenti (parsing CSV, ricerche SERP, scraping dei
+prodotti) girano in parallelo e la latenza totale diventa quella del
+percorso critico invece della somma delle fasi. Per ogni fase si registrano
+inizio e durata, e la fase è uno span della traccia corrente.
+"""
+
+import time
+import asyncio
+import inspect
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .tracing import start_span
+
+
+@dataclass
+class StageTiming:
+    """Inizio (secondi dall'avvio della pipeline) e durata di una fase"""
+    start: float
+    duration: float
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+@dataclass
+class _Stage:
+    name: str
+    func: Callable[..., Any]
+    deps: Tuple[str, ...]
+
+
+class Pipeline:
+    """
+    Grafo di fasi asincrone.
+
+    func riceve i risultati delle dipendenze come argomenti con il nome
+    della fase (es. deps=("csv", "serp") -> func(csv=..., serp=...)) e può
+    restituire un valore o un awaitable. Il lavoro bloccante va passato da
+    run_blocking: le funzioni sincrone girano direttamente nell'event loop.
+
+    Le dipendenze devono essere aggiunte prima delle fasi che le usano,
+    quindi il grafo non può contenere cicli.
+    """
+
+    def __init__(self, on_stage: Callable[[str], None] = None):
+        self.on_stage = on_stage
+        self.timings: Dict[str, StageTiming] = {}
+        self._stages: Dict[str, _Stage] = {}
+        self._deps: Dict[str, Tuple[str, ...]] = {}
+        self._results: Dict[str, Any] = {}
+        self._started: Optional[float] = None
+
+    def add(self, name: str, func: Callable[..., Any], deps: Tuple[str, ...] = ()) -> "Pipeline":
+        if name in self._deps:
+            raise ValueError(f"Fase duplicata: {name}")
+        missing = [d for d in deps if d not in self._deps]
+        if missing:
+            raise ValueError(f"Fase {name}: dipendenze non definite {missing}")
+        self._stages[name] = _Stage(name, func, tuple(deps))
+        self._deps[name] = tuple(deps)
+        return self
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._deps
+
+    def _elapsed(self) -> float:
+        if self._started is None:
+            self._started = time.perf_counter()
+        return time.perf_counter() - self._started
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Esegue le fasi non ancora eseguite e restituisce i risultati di tutte
+        le fasi per nome (si può richiamare dopo aver aggiunto nuove fasi).
+        Al primo errore le fasi ancora in corso vengono cancellate e l'errore
+        propagato.
+        """
+        stages = list(self._stages.values())
+        self._stages = {}
+        self._elapsed()
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def execute(stage: _Stage) -> Any:
+            pending = [tasks[d] for d in stage.deps if d in tasks]
+            if pending:
+                await asyncio.gather(*pending)
+            kwargs = {d: self._results[d] for d in stage.deps}
+            with self._measure(stage.name):
+                result = stage.func(**kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+            self._results[stage.name] = result
+            return result
+
+        for stage in stages:
+            tasks[stage.name] = asyncio.ensure_future(execute(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return dict(self._results)
+
+    @contextmanager
+    def _measure(self, name: str) -> Iterator[None]:
+        start = self._elapsed()
+        if self.on_stage:
+            self.on_stage(name)
+        try:
+            # Lo span della fase fa da padre alle operazioni avviate al suo interno
+            with start_span(f"pipeline.{name}", attributes={"pipeline.deps": ",".join(self._deps.get(name, ()))}):
+                yield
+        finally:
+            self.timings[name] = StageTiming(start, self._elapsed() - start)
+
+    @contextmanager
+    def timed(self, name: str, deps: Tuple[str, ...] = ()) -> Iterator[None]:
+        """
+        Fase eseguita fuori dal grafo (es. lo streaming del modello, che
+        produce eventi man mano): misurata e notificata come le altre, entra
+        nel percorso critico tramite deps.
+        """
+        if name in self._deps:
+            raise ValueError(f"Fase duplicata: {name}")
+        self._deps[name] = tuple(deps)
+        with self._measure(name):
+            yield
+
+    def critical_path(self) -> List[str]:
+        """Fasi che hanno determinato la latenza totale, dalla prima all'ultima"""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n].end)
+        path = [name]
+        while True:
+            deps = [d for d in self._deps.get(name, ()) if d in self.timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda d: self.timings[d].end)
+            path.append(name)
+        return path[::-1]
+
+    def report(self) -> Dict[str, Any]:
+        """Tempi per fase, percorso critico, durata totale e somma delle fasi"""
+        total = max((t.end for t in self.timings.values()), default=0.0)
+        return {
+            "stages": {
+                name: {"start_s": round(t.start, 3), "duration_s": round(t.duration, 3)}
+                for name, t in self.timings.items()
+            },
+            "critical_path": self.critical_path(),
+            "total_s": round(total, 3),
+            "sum_s": round(sum(t.duration for t in self.timings.values()), 3)
+        }
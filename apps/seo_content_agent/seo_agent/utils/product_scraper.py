@@ -6,13 +6,27 @@ Utilizza selettori multipli per adattarsi automaticamente a diversi e-commerce.
 
 import requests
 from bs4 import BeautifulSoup
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, List, Dict, Optional
 import re
 import logging
 
+if TYPE_CHECKING:
+    import httpx
+
+from .metrics import stage_timer
+from .tracing import CLIENT
+
 logger = logging.getLogger(__name__)
 
 
+# Header HTTP usati per tutte le richieste verso gli e-commerce
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
+}
+
+
 # Selettori per diversi CMS e-commerce
 CMS_SELECTORS = {
     "woocommerce": [
@@ -112,6 +126,69 @@ def clean_product_name(name: str) -> str:
     return name
 
 
+def extract_products(html: str, url: str, max_products: int = 50) -> Dict:
+    """
+    Estrae i nomi dei prodotti dall'HTML di una pagina categoria.
+    Operazione CPU-bound, separata dal download della pagina.
+    
+    Args:
+        html: HTML della pagina
+        url: URL della pagina (riportato nel risultato)
+        max_products: Numero massimo di prodotti da estrarre
+        
+    Returns:
+        Dict con lo stesso formato di scrape_products
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    
+    # Rileva CMS
+    cms = detect_cms(soup, html)
+    logger.info(f"📦 CMS rilevato: {cms}")
+    
+    # Costruisci lista selettori: prima quelli specifici del CMS, poi generici
+    selectors_to_try = CMS_SELECTORS.get(cms, []) + CMS_SELECTORS['generic']
+    
+    products = []
+    selector_used = None
+    
+    for selector in selectors_to_try:
+        try:
+            elements = soup.select(selector)
+            if elements:
+                for el in elements:
+                    name = clean_product_name(el.get_text())
+                    if name and len(name) > 3 and name not in products:
+                        products.append(name)
+                
+                if len(products) >= 3:  # Almeno 3 prodotti per considerarlo valido
+                    selector_used = selector
+                    logger.info(f"✅ Selettore funzionante: {selector} ({len(products)} prodotti)")
+                    break
+        except Exception as e:
+            continue
+    
+    # Limita al massimo
+    products = products[:max_products]
+    
+    return {
+        "success": True,
+        "products": products,
+        "cms_detected": cms,
+        "selector_used": selector_used,
+        "total_found": len(products),
+        "url": url
+    }
+
+
+def _error_result(url: str, error: str) -> Dict:
+    return {
+        "success": False,
+        "error": error,
+        "products": [],
+        "url": url
+    }
+
+
 def scrape_products(url: str, max_products: int = 50) -> Dict:
     """
     Scrapa i nomi dei prodotti da una pagina categoria e-commerce.
@@ -127,82 +204,77 @@ def scrape_products(url: str, max_products: int = 50) -> Dict:
         - total_found: totale prodotti trovati
         - url: URL originale
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
-    }
-    
     try:
         logger.info(f"🔍 Scraping prodotti da: {url}")
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'lxml')
-        html = response.text
-        
-        # Rileva CMS
-        cms = detect_cms(soup, html)
-        logger.info(f"📦 CMS rilevato: {cms}")
-        
-        # Costruisci lista selettori: prima quelli specifici del CMS, poi generici
-        selectors_to_try = CMS_SELECTORS.get(cms, []) + CMS_SELECTORS['generic']
-        
-        products = []
-        selector_used = None
-        
-        for selector in selectors_to_try:
-            try:
-                elements = soup.select(selector)
-                if elements:
-                    for el in elements:
-                        name = clean_product_name(el.get_text())
-                        if name and len(name) > 3 and name not in products:
-                            products.append(name)
-                    
-                    if len(products) >= 3:  # Almeno 3 prodotti per considerarlo valido
-                        selector_used = selector
-                        logger.info(f"✅ Selettore funzionante: {selector} ({len(products)} prodotti)")
-                        break
-            except Exception as e:
-                continue
-        
-        # Limita al massimo
-        products = products[:max_products]
-        
-        return {
-            "success": True,
-            "products": products,
-            "cms_detected": cms,
-            "selector_used": selector_used,
-            "total_found": len(products),
-            "url": url
-        }
+        with stage_timer("product_scrape", CLIENT, {"http.url": url}) as stage:
+            response = requests.get(url, headers=HEADERS, timeout=15)
+            response.raise_for_status()
+            
+            result = extract_products(response.text, url, max_products)
+            stage.bytes = len(response.content)
+            stage.rows = len(result["products"])
+        return result
         
     except requests.exceptions.Timeout:
         logger.error(f"⏱️ Timeout durante lo scraping di {url}")
-        return {
-            "success": False,
-            "error": "Timeout: la pagina non risponde",
-            "products": [],
-            "url": url
-        }
+        return _error_result(url, "Timeout: la pagina non risponde")
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Errore richiesta: {e}")
-        return {
-            "success": False,
-            "error": f"Errore di connessione: {str(e)}",
-            "products": [],
-            "url": url
-        }
+        return _error_result(url, f"Errore di connessione: {str(e)}")
+    except Exception as e:
+        logger.error(f"❌ Errore generico: {e}")
+        return _error_result(url, f"Errore: {str(e)}")
+
+
+async def scrape_products_async(
+    url: str,
+    max_products: int = 50,
+    client: "httpx.AsyncClient" = None
+) -> Dict:
+    """
+    Versione asincrona di scrape_products.
+    
+    Il download usa un client HTTP asincrono; il parsing HTML gira nel
+    pool di thread condiviso per non bloccare l'event loop. Download e
+    parsing occupano uno slot dello scheduler.
+    
+    Args:
+        url: URL della pagina categoria
+        max_products: Numero massimo di prodotti da estrarre
+        client: httpx.AsyncClient da riutilizzare (opzionale)
+    """
+    import httpx
+    from .concurrency import run_blocking
+    from .scheduler import scheduled
+    
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(headers=HEADERS, timeout=15, follow_redirects=True)
+    
+    try:
+        async with scheduled("products"):
+            logger.info(f"🔍 Scraping prodotti da: {url}")
+            with stage_timer("product_scrape", CLIENT, {"http.url": url}) as stage:
+                response = await client.get(url, headers=HEADERS)
+                response.raise_for_status()
+                
+                result = await run_blocking(extract_products, response.text, url, max_products)
+                stage.bytes = len(response.content)
+                stage.rows = len(result["products"])
+            return result
+        
+    except httpx.TimeoutException:
+        logger.error(f"⏱️ Timeout durante lo scraping di {url}")
+        return _error_result(url, "Timeout: la pagina non risponde")
+    except httpx.HTTPError as e:
+        logger.error(f"❌ Errore richiesta: {e}")
+        return _error_result(url, f"Errore di connessione: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Errore generico: {e}")
-        return {
-            "success": False,
-            "error": f"Errore: {str(e)}",
-            "products": [],
-            "url": url
-        }
+        return _error_result(url, f"Errore: {str(e)}")
+    finally:
+        if owns_client:
+            await client.aclose()
 
 
 def format_products_for_prompt(products: List[str]) -> str:
@@ -0,0 +1,194 @@
+"""
+Product summary - Riassunto compatto del catalogo prodotti per il prompt
+
+Con decine di nomi prodotto lo stesso lessico si ripete ("Costume Intero
+Donna ... Bicolore"): elencarli tutti occupa buona parte del prompt senza
+aggiungere informazione. Qui si estraggono localmente i pattern frequenti
+dei nomi (n-grammi di parole, classificati in colori, materiali e stili) e
+un piccolo insieme di nomi reali che li copre: il prompt resta ancorato ai
+prodotti della pagina con molti meno token.
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+# Sotto questa soglia i nomi restano elencati per intero
+SUMMARY_MIN_PRODUCTS = 12
+MIN_REPRESENTATIVES = 5
+MAX_REPRESENTATIVES = 8
+MAX_NGRAM = 3
+MIN_SUPPORT = 2  # occorrenze minime (una sola per colori e materiali di una parola)
+MAX_PATTERNS = 15
+COMMON_SHARE = 0.6  # pattern presenti in almeno il 60% dei nomi: base comune
+
+# Tipi di pattern
+BASE = "base"
+COLOR = "colore"
+MATERIAL = "materiale"
+STYLE = "stile"
+
+COLORS = {
+    "nero", "nera", "neri", "nere", "bianco", "bianca", "bianchi", "bianche",
+    "blu", "rosso", "rossa", "rossi", "rosse", "verde", "verdi", "giallo",
+    "gialla", "gialli", "gialle", "rosa", "grigio", "grigia", "grigi", "grigie",
+    "azzurro", "azzurra", "azzurri", "azzurre", "arancione", "arancio", "viola",
+    "marrone", "beige", "fucsia", "celeste", "turchese", "bordeaux", "oro",
+    "argento", "navy", "antracite", "corallo", "lilla", "multicolore",
+    "black", "white", "blue", "red", "green", "yellow", "pink", "grey", "gray"
+}
+
+MATERIALS = {
+    "cotone", "lana", "lino", "seta", "pelle", "ecopelle", "camoscio",
+    "poliestere", "poliammide", "nylon", "lycra", "elastan", "elastane",
+    "spandex", "neoprene", "silicone", "microfibra", "jeans", "denim",
+    "velluto", "cashmere", "pile", "acciaio", "inox", "alluminio", "ottone",
+    "legno", "bambù", "plastica", "vetro", "ceramica", "gomma", "carbonio",
+    "cotton", "leather", "wool", "steel"
+}
+
+# Parole che non formano un pattern da sole né ai bordi di un n-gramma
+STOPWORDS = {
+    "a", "al", "alla", "con", "da", "de", "del", "della", "di", "e", "ed",
+    "for", "il", "in", "la", "le", "lo", "per", "su", "the", "with", "x"
+}
+
+_WORD_PATTERN = re.compile(r"[\w'’]+")
+
+
+@dataclass
+class ProductPattern:
+    """Sequenza di parole ricorrente nei nomi prodotto"""
+    text: str
+    count: int  # nomi che la contengono
+    kind: str  # BASE, COLOR, MATERIAL, STYLE
+
+
+@dataclass
+class ProductSummary:
+    """Rappresentazione compatta di un elenco di prodotti"""
+    total: int
+    representatives: List[str] = field(default_factory=list)
+    patterns: List[ProductPattern] = field(default_factory=list)
+
+
+def _ngrams(words: List[str]) -> Set[Tuple[str, ...]]:
+    grams = set()
+    for n in range(1, MAX_NGRAM + 1):
+        for i in range(len(words) - n + 1):
+            gram = tuple(words[i:i + n])
+            if gram[0] in STOPWORDS or gram[-1] in STOPWORDS:
+                continue
+            if n == 1 and (len(gram[0]) < 2 or gram[0].isdigit()):
+                continue
+            grams.add(gram)
+    return grams
+
+
+def _contains(longer: Tuple[str, ...], shorter: Tuple[str, ...]) -> bool:
+    n = len(shorter)
+    return any(longer[i:i + n] == shorter for i in range(len(longer) - n + 1))
+
+
+def _kind(gram: Tuple[str, ...]) -> str:
+    if any(w in MATERIALS for w in gram):
+        return MATERIAL
+    if any(w in COLORS for w in gram):
+        return COLOR
+    return STYLE
+
+
+def _closed(grams: List[Tuple[str, ...]], support: Counter) -> List[Tuple[str, ...]]:
+    """Scarta i pattern contenuti in uno più lungo con le stesse occorrenze"""
+    closed: List[Tuple[str, ...]] = []
+    for gram in sorted(grams, key=lambda g: -len(g)):
+        if not any(
+            len(other) > len(gram) and support[other] == support[gram] and _contains(other, gram)
+            for other in closed
+        ):
+            closed.append(gram)
+    return closed
+
+
+def summarize_products(
+    products: List[str],
+    max_representatives: int = MAX_REPRESENTATIVES
+) -> ProductSummary:
+    """
+    Estrae i pattern frequenti dei nomi prodotto e sceglie i nomi
+    rappresentativi.
+
+    I pattern sono n-grammi di parole (fino a MAX_NGRAM) presenti in più
+    nomi; di un pattern contenuto in uno più lungo con le stesse occorrenze
+    si tiene solo il più lungo. I rappresentativi sono scelti in modo greedy
+    coprendo i pattern più frequenti, poi completati nell'ordine originale
+    fino a MIN_REPRESENTATIVES.
+
+    Args:
+        products: Nomi prodotto della pagina
+        max_representatives: Numero massimo di nomi da riportare per intero
+
+    Returns:
+        ProductSummary con totale, nomi rappresentativi e pattern
+    """
+    names = list(dict.fromkeys(p.strip() for p in products if p and p.strip()))
+    words = [_WORD_PATTERN.findall(name) for name in names]
+    grams = [_ngrams([w.lower() for w in ws]) for ws in words]
+
+    support: Counter = Counter()
+    surface: Dict[Tuple[str, ...], str] = {}
+    for ws, name_grams in zip(words, grams):
+        support.update(name_grams)
+        lowered = [w.lower() for w in ws]
+        for gram in name_grams:
+            if gram not in surface:
+                for i in range(len(lowered) - len(gram) + 1):
+                    if tuple(lowered[i:i + len(gram)]) == gram:
+                        surface[gram] = " ".join(ws[i:i + len(gram)])
+                        break
+
+    # Base comune: parole presenti in quasi tutti i nomi (es. "Costume Intero Donna")
+    common = len(names) * COMMON_SHARE
+    base = _closed([g for g, c in support.items() if c >= common and len(names) > 1], support)
+    base_words = {w for g in base for w in g}
+
+    # Attributi: pattern senza parole della base, così "Bicolore" non diventa "Donna Bicolore"
+    attributes = _closed([
+        g for g, c in support.items()
+        if not base_words.intersection(g) and (c >= MIN_SUPPORT or (len(g) == 1 and _kind(g) != STYLE))
+    ], support)
+    rank = lambda g: (-support[g], -len(g), surface[g])
+    base.sort(key=rank)
+    attributes = sorted(attributes, key=rank)[:MAX_PATTERNS]
+    patterns = [ProductPattern(surface[g], support[g], BASE) for g in base]
+    patterns += [ProductPattern(surface[g], support[g], _kind(g)) for g in attributes]
+
+    # Rappresentativi: ogni scelta copre il peso massimo di pattern non ancora coperti
+    uncovered = {g: support[g] for g in attributes}
+    chosen: List[int] = []
+    while uncovered and len(chosen) < max_representatives:
+        best, gain = None, 0
+        for i, name_grams in enumerate(grams):
+            if i in chosen:
+                continue
+            weight = sum(w for g, w in uncovered.items() if g in name_grams)
+            if weight > gain:
+                best, gain = i, weight
+        if best is None:
+            break
+        chosen.append(best)
+        for g in list(uncovered):
+            if g in grams[best]:
+                del uncovered[g]
+    for i in range(len(names)):
+        if len(chosen) >= min(MIN_REPRESENTATIVES, max_representatives):
+            break
+        if i not in chosen:
+            chosen.append(i)
+
+    return ProductSummary(
+        total=len(names),
+        representatives=[names[i] for i in sorted(chosen)],
+        patterns=patterns
+    )
@@ -0,0 +1,86 @@
+"""
+Prompt cache - Statistiche della cache del prompt lato provider
+
+I provider riusano il prefisso del prompt già elaborato di recente (token
+"cached" nell'usage, fatturati a prezzo ridotto e senza prefill). Qui si
+registrano, per ogni risposta, token del prompt, token in cache e latenza:
+il rapporto cached/prompt misura quanto il layout dei prompt (parti stabili
+in testa) funziona, il confronto tra chiamate con e senza cache stima la
+latenza risparmiata.
+"""
+
+import threading
+from typing import Any, Dict
+
+from .usage import TokenUsage
+
+# Tipi di misura: durata della chiamata completa o tempo al primo token
+CALL = "call"
+STREAM = "stream"
+
+
+class _Counters:
+    def __init__(self):
+        self.calls = 0
+        self.hit_calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.cold_seconds = 0.0
+        self.warm_seconds = 0.0
+
+
+class PromptCacheStats:
+    """
+    Contatori thread-safe della cache del prompt, separati per tipo di misura
+    (CALL: latenza totale, STREAM: tempo al primo token).
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, _Counters] = {CALL: _Counters(), STREAM: _Counters()}
+        self._lock = threading.Lock()
+
+    def record(self, usage: TokenUsage, seconds: float, kind: str = CALL) -> None:
+        """Registra una risposta; quelle senza usage (es. cache locale) sono ignorate"""
+        if not usage.prompt_tokens:
+            return
+        with self._lock:
+            c = self._counters[kind]
+            c.calls += 1
+            c.prompt_tokens += usage.prompt_tokens
+            c.cached_tokens += usage.cached_tokens
+            if usage.cached_tokens:
+                c.hit_calls += 1
+                c.warm_seconds += seconds
+            else:
+                c.cold_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit ratio (token in cache / token del prompt) e latenza risparmiata
+        stimata: (media senza cache - media con cache) x chiamate con cache.
+        """
+        with self._lock:
+            stats = {}
+            prompt_tokens = cached_tokens = 0
+            for kind, c in self._counters.items():
+                cold = c.calls - c.hit_calls
+                cold_mean = c.cold_seconds / cold if cold else None
+                warm_mean = c.warm_seconds / c.hit_calls if c.hit_calls else None
+                saved = 0.0
+                if cold_mean is not None and warm_mean is not None:
+                    saved = max(0.0, cold_mean - warm_mean) * c.hit_calls
+                stats[kind] = {
+                    "calls": c.calls,
+                    "hit_calls": c.hit_calls,
+                    "prompt_tokens": c.prompt_tokens,
+                    "cached_tokens": c.cached_tokens,
+                    "hit_ratio": round(c.cached_tokens / c.prompt_tokens, 3) if c.prompt_tokens else 0.0,
+                    "cold_mean_s": round(cold_mean, 3) if cold_mean is not None else None,
+                    "warm_mean_s": round(warm_mean, 3) if warm_mean is not None else None,
+                    "estimated_saved_s": round(saved, 2)
+                }
+                prompt_tokens += c.prompt_tokens
+                cached_tokens += c.cached_tokens
+        stats["hit_ratio"] = round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0
+        stats["estimated_saved_s"] = round(stats[CALL]["estimated_saved_s"] + stats[STREAM]["estimated_saved_s"], 2)
+        return stats
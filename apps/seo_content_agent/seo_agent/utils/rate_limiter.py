@@ -0,0 +1,254 @@
+"""
+Rate Limiter - Token bucket per i limiti di richieste e token al minuto
+
+I provider LLM limitano sia le richieste al minuto (RPM) sia i token al minuto
+(TPM). Ogni chiamata prenota una richiesta e una stima dei token prima di
+partire; a risposta ricevuta la stima viene corretta con l'usage reale.
+
+Con db_path lo stato dei bucket è su SQLite, quindi condiviso da tutti i
+worker e processi (uvicorn, Streamlit, batch) che usano lo stesso file: la
+quota del provider è una sola, anche il limite deve esserlo.
+"""
+
+import time
+import sqlite3
+import asyncio
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .concurrency import run_blocking
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    paused_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+@dataclass
+class _BucketState:
+    """Livello del bucket già ricaricato all'istante now"""
+    tokens: float
+    paused_until: float
+    now: float
+
+
+class TokenBucket:
+    """
+    Token bucket con ricarica continua.
+
+    Thread-safe: lo stato è protetto da un lock, l'attesa avviene fuori dal
+    lock (asyncio.sleep), quindi lo stesso bucket può essere condiviso da
+    più worker e più event loop dello stesso processo.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        if per_minute <= 0:
+            raise ValueError("per_minute deve essere positivo")
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self) -> Iterator[_BucketState]:
+        """Stato ricaricato, salvato all'uscita dal blocco"""
+        with self._lock:
+            now = time.monotonic()
+            state = _BucketState(
+                tokens=min(self.capacity, self._tokens + (now - self._updated) * self.rate),
+                paused_until=self._paused_until,
+                now=now
+            )
+            yield state
+            self._tokens = state.tokens
+            self._updated = now
+            self._paused_until = state.paused_until
+
+    def try_acquire(self, amount: float) -> float:
+        """
+        Preleva amount se disponibile.
+
+        Returns:
+            0 se il prelievo è riuscito, altrimenti i secondi da attendere
+        """
+        # Una richiesta più grande della capacità non verrebbe mai servita
+        amount = min(amount, self.capacity)
+        with self._state() as state:
+            if state.paused_until > state.now:
+                return state.paused_until - state.now
+            if state.tokens >= amount:
+                state.tokens -= amount
+                return 0.0
+            return (amount - state.tokens) / self.rate
+
+    async def _try_acquire_async(self, amount: float) -> float:
+        return self.try_acquire(amount)
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Attende finché amount non è disponibile e lo preleva"""
+        while True:
+            wait = await self._try_acquire_async(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, amount: float = 1) -> None:
+        """Come acquire, per il codice sincrono (app Streamlit, CLI)"""
+        while True:
+            wait = self.try_acquire(amount)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def adjust(self, delta: float) -> None:
+        """
+        Corregge il livello del bucket: delta positivo restituisce token,
+        negativo ne consuma altri (il livello può andare sotto zero).
+        """
+        with self._state() as state:
+            state.tokens = min(self.capacity, state.tokens + delta)
+
+    def pause(self, seconds: float) -> None:
+        """Sospende i prelievi per seconds (es. Retry-After di un 429)"""
+        with self._state() as state:
+            state.paused_until = max(state.paused_until, state.now + seconds)
+
+    @property
+    def available(self) -> float:
+        with self._state() as state:
+            return state.tokens
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket con stato su SQLite, condiviso tra processi.
+
+    Ogni operazione è una transazione BEGIN IMMEDIATE (pochi ms in WAL):
+    ricarica, prelievo e salvataggio sono atomici anche con più processi.
+    Si usa l'orologio di sistema, l'unico comune a tutti i processi.
+    Con il database bloccato da un altro processo la transazione può
+    attendere (timeout 30s): acquire la esegue nel pool di thread, e chi
+    chiama adjust/pause da codice asincrono deve fare lo stesso.
+    """
+
+    def __init__(self, db_path: Path, name: str, per_minute: float, capacity: Optional[float] = None):
+        super().__init__(per_minute, capacity)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (name, self.capacity, time.time())
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    async def _try_acquire_async(self, amount: float) -> float:
+        return await run_blocking(self.try_acquire, amount)
+
+    @contextmanager
+    def _state(self) -> Iterator[_BucketState]:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, updated_at, paused_until = conn.execute(
+                    "SELECT tokens, updated_at, paused_until FROM buckets WHERE name = ?",
+                    (self.name,)
+                ).fetchone()
+                now = time.time()
+                state = _BucketState(
+                    tokens=min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate),
+                    paused_until=paused_until,
+                    now=now
+                )
+                yield state
+                conn.execute(
+                    "UPDATE buckets SET tokens = ?, updated_at = ?, paused_until = ? WHERE name = ?",
+                    (state.tokens, now, state.paused_until, self.name)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+
+class RateLimiter:
+    """
+    Limiti combinati RPM e TPM per le chiamate al modello.
+
+    Un limite None o 0 significa nessun limite su quella dimensione.
+    Con db_path i bucket sono condivisi tra processi (SharedTokenBucket);
+    name distingue quote diverse nello stesso file (es. una per API key).
+
+        limiter = RateLimiter(rpm=500, tpm=200_000)
+        await limiter.acquire(estimated_tokens)
+        ...
+        limiter.reconcile(estimated_tokens, usage.total_tokens)
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        db_path: Optional[Path] = None,
+        name: str = "default"
+    ):
+        def bucket(kind: str, per_minute: Optional[float]) -> Optional[TokenBucket]:
+            if not per_minute:
+                return None
+            if db_path is None:
+                return TokenBucket(per_minute)
+            return SharedTokenBucket(db_path, f"{name}:{kind}", per_minute)
+
+        self.requests = bucket("rpm", rpm)
+        self.tokens = bucket("tpm", tpm)
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    async def acquire(self, estimated_tokens: int = 0, requests: int = 1) -> None:
+        """Prenota le richieste e la stima dei token che consumeranno"""
+        if self.requests is not None:
+            await self.requests.acquire(requests)
+        if self.tokens is not None and estimated_tokens:
+            await self.tokens.acquire(estimated_tokens)
+
+    def acquire_blocking(self, estimated_tokens: int = 0, requests: int = 1) -> None:
+        """Versione sincrona di acquire"""
+        if self.requests is not None:
+            self.requests.acquire_blocking(requests)
+        if self.tokens is not None and estimated_tokens:
+            self.tokens.acquire_blocking(estimated_tokens)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Sostituisce la stima con i token effettivamente consumati"""
+        if self.tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Sospende le prenotazioni per seconds: dopo un 429 tutti i worker
+        attendono il Retry-After invece di consumare altri tentativi.
+        """
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.pause(seconds)
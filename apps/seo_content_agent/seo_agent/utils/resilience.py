@@ -0,0 +1,585 @@
+"""
+Resilience - Retry, rate limit condiviso e circuit breaker per le chiamate LLM
+
+Ogni chiamata al modello passa da qui:
+1. il circuit breaker rifiuta subito la chiamata se il provider è degradato
+   (troppi errori 5xx/timeout consecutivi), invece di accodare richieste
+   destinate a fallire;
+2. il rate limiter RPM/TPM, condiviso tra worker e processi via SQLite,
+   prenota la richiesta e la stima dei token: si resta sotto la quota
+   invece di scoprirla a colpi di 429;
+3. gli errori transitori (429, 5xx, timeout, connessione) vengono ritentati
+   con backoff esponenziale e jitter, rispettando Retry-After. Un 429 mette
+   in pausa il limiter condiviso, così anche gli altri worker attendono.
+Per ogni risposta si registrano anche token in cache del prompt e latenza
+(PromptCacheStats) e, nel registro dei consumi (UsageLedger) e nelle
+metriche (metrics.py), token, latenza e modello. Ogni tentativo occupa
+uno slot dello scheduler equo tra utenti (scheduler.py) per la sua durata.
+
+Configurazione (variabili d'ambiente):
+    SEO_AGENT_LLM_RPM, SEO_AGENT_LLM_TPM   quota del provider (0 = nessun limite)
+    SEO_AGENT_RATE_DB                      file SQLite dei bucket condivisi
+    SEO_AGENT_LLM_RETRIES                  tentativi oltre il primo (default 4)
+    SEO_AGENT_BREAKER_THRESHOLD            errori consecutivi per aprire (default 5)
+    SEO_AGENT_BREAKER_RESET                secondi prima di riprovare (default 30)
+"""
+
+import os
+import time
+import random
+import asyncio
+import tempfile
+import threading
+import logging
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+from .concurrency import run_blocking
+from .metrics import MODEL_ERRORS, MODEL_TOKENS, Stage, record_stage
+from .tracing import CLIENT, open_span, start_span
+from .prompt_cache import CALL, STREAM, PromptCacheStats
+from .rate_limiter import RateLimiter
+from .scheduler import scheduled
+from .usage import usage_from_response
+from .usage_ledger import UsageLedger, default_ledger
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_RATE_DB = Path(
+    os.getenv("SEO_AGENT_RATE_DB", Path(tempfile.gettempdir()) / "seo_agent_ratelimit.sqlite3")
+)
+
+# Eccezioni di rete/timeout di openai e httpx, riconosciute per nome per non
+# dipendere dai pacchetti in questo modulo
+_TRANSIENT_ERRORS = {"APITimeoutError", "APIConnectionError", "TransportError", "TimeoutException"}
+
+# Stati del circuit breaker
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """
+    Il provider LLM non è disponibile ora: riprovare dopo retry_after secondi.
+    status_code è il codice HTTP da restituire al client (429 o 503).
+    """
+
+    def __init__(self, message: str, retry_after: float, status_code: int = 503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class CircuitOpenError(ProviderUnavailable):
+    """Circuit breaker aperto: la chiamata non è stata inviata"""
+
+
+class RetriesExhausted(ProviderUnavailable):
+    """Tentativi esauriti (o Retry-After oltre il massimo accettato)"""
+
+
+# ==================== CLASSIFICAZIONE ERRORI ====================
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_transient(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """429, 408/409, 5xx ed errori di rete/timeout"""
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return _is_transient(error)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Secondi indicati dal provider (retry-after-ms o Retry-After), se presenti"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value:
+            return max(0.0, float(value) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            # Formato data HTTP
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# ==================== CIRCUIT BREAKER ====================
+
+class CircuitBreaker:
+    """
+    Circuit breaker a tre stati.
+
+    closed: le chiamate passano; dopo failure_threshold errori consecutivi
+    del provider si apre. open: le chiamate falliscono subito per
+    reset_timeout secondi. half_open: passa una sola chiamata di prova,
+    che chiude il circuito se riesce e lo riapre se fallisce. Una prova
+    senza esito dopo probe_timeout secondi (es. persa per un bug) viene
+    considerata abbandonata e ne parte un'altra.
+
+    Contano solo gli errori di degrado (5xx, timeout, connessione): un 429
+    indica quota esaurita, non un provider guasto, ed è gestito dal limiter.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, probe_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        Raises:
+            CircuitOpenError: se il circuito è aperto o la prova è già in corso
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and (
+                not self._probing or now - self._probe_started >= self.probe_timeout
+            ):
+                self._probing = True
+                self._probe_started = now
+                return
+            wait = max(1.0, self.reset_timeout - (now - self._opened_at))
+        raise CircuitOpenError(
+            f"Provider LLM non disponibile, nuovo tentativo tra {wait:.0f}s", retry_after=wait
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("🟢 Circuit breaker chiuso: provider di nuovo disponibile")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(
+                        f"🔴 Circuit breaker aperto dopo {self._failures} errori, "
+                        f"pausa di {self.reset_timeout:.0f}s"
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release(self) -> None:
+        """Libera la chiamata di prova conclusa senza esito (es. errore 4xx o cancellazione)"""
+        with self._lock:
+            self._probing = False
+
+
+# ==================== RETRY ====================
+
+@dataclass
+class RetryPolicy:
+    """
+    Backoff esponenziale con full jitter: il tentativo n attende un tempo
+    casuale in [0, min(max_delay, base_delay * 2^n)], così i worker non
+    ritentano tutti nello stesso istante. Retry-After, se presente, è il
+    minimo; oltre max_retry_after si rinuncia e lo si restituisce al client.
+    """
+    max_retries: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    max_retry_after: float = 60.0
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class Resilience:
+    """
+    Punto unico per le chiamate al modello: rate limit, retry e circuit breaker.
+
+        response = await resilience.call(
+            lambda: client.a_invoke(prompt), estimated_tokens=3000
+        )
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        prompt_cache: Optional[PromptCacheStats] = None,
+        ledger: Optional[UsageLedger] = None
+    ):
+        self.limiter = limiter or RateLimiter()
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.prompt_cache = prompt_cache or PromptCacheStats()
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0, "rejected": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counts)
+        stats["breaker"] = self.breaker.state
+        if self.limiter.requests is not None:
+            stats["rpm_available"] = round(self.limiter.requests.available, 1)
+        if self.limiter.tokens is not None:
+            stats["tpm_available"] = round(self.limiter.tokens.available)
+        return stats
+
+    # ==================== ESITI ====================
+
+    def _admit(self) -> None:
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+
+    def _on_success(
+        self,
+        response: Any,
+        estimated_tokens: int,
+        tokens_of: Callable[[Any], int],
+        seconds: float,
+        kind: str = CALL,
+        model: str = "",
+        latency: Optional[float] = None
+    ) -> None:
+        self.breaker.record_success()
+        usage = usage_from_response(response)
+        latency = seconds if latency is None else latency
+        model = model or str(getattr(response, "model", "") or "")
+        self.prompt_cache.record(usage, seconds, kind)
+        if self.ledger is not None:
+            self.ledger.record(usage, latency, model, kind)
+        record_stage(Stage("model_call"), latency)
+        for token_type, tokens in (
+            ("prompt", usage.prompt_tokens),
+            ("completion", usage.completion_tokens),
+            ("cached", usage.cached_tokens)
+        ):
+            if tokens:
+                MODEL_TOKENS.inc(tokens, model=model or "unknown", type=token_type)
+        if estimated_tokens:
+            actual = tokens_of(response)
+            # Senza usage nella risposta si mantiene la stima
+            if actual:
+                self.limiter.reconcile(estimated_tokens, actual)
+
+    def _on_error(self, error: BaseException, attempt: int) -> float:
+        """
+        Registra l'errore e decide se ritentare.
+
+        Returns:
+            secondi da attendere prima del prossimo tentativo
+
+        Raises:
+            l'errore originale se non è transitorio, RetriesExhausted se i
+            tentativi sono finiti, CircuitOpenError se il circuito si è aperto
+        """
+        if not is_retryable(error):
+            self.breaker.release()
+            raise error
+
+        status = _status_code(error)
+        hint = retry_after(error)
+        MODEL_ERRORS.inc(status=str(status or type(error).__name__))
+        if status == 429:
+            self._count("rate_limited")
+            self.breaker.release()
+        else:
+            self._count("failures")
+            self.breaker.record_failure()
+
+        delay = max(hint or 0.0, self.retry.backoff(attempt))
+        if status == 429 and hint:
+            # Tutti i worker che condividono il limiter attendono il Retry-After
+            self.limiter.pause(hint)
+
+        if self.breaker.state == OPEN:
+            # Il circuito si è appena aperto: inutile attendere un tentativo che verrebbe rifiutato
+            raise CircuitOpenError(
+                f"Provider LLM non disponibile ({status or type(error).__name__}): {error}",
+                retry_after=self.breaker.reset_timeout
+            ) from error
+        if attempt >= self.retry.max_retries or delay > self.retry.max_retry_after:
+            raise RetriesExhausted(
+                f"Provider LLM non disponibile ({status or type(error).__name__}): {error}",
+                retry_after=max(1.0, hint or delay),
+                status_code=429 if status == 429 else 503
+            ) from error
+
+        self._count("retries")
+        logger.warning(
+            f"🔁 Errore LLM ({status or type(error).__name__}), "
+            f"tentativo {attempt + 2}/{self.retry.max_retries + 1} tra {delay:.1f}s"
+        )
+        return delay
+
+    # ==================== CHIAMATE ====================
+
+    async def call(
+        self,
+        func: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        tokens_of: Callable[[Any], int] = lambda r: usage_from_response(r).total_tokens,
+        model: str = ""
+    ) -> T:
+        """
+        Esegue func (che crea una nuova chiamata a ogni tentativo).
+        model è registrato nel registro dei consumi (default: quello della risposta).
+
+        Raises:
+            ProviderUnavailable: circuito aperto o tentativi esauriti
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            # Prima l'attesa del limiter, poi il breaker: la prova half_open
+            # presa da _admit è rilasciata in ogni caso dal try sottostante
+            await self.limiter.acquire(estimated_tokens)
+            self._admit()
+            started = time.monotonic()
+            try:
+                async with scheduled("llm"):
+                    with start_span("model_call", CLIENT, _span_attributes(model, attempt)) as span:
+                        response = await func()
+                        _annotate(span, response)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                # pause del limiter condiviso scrive su SQLite
+                delay = await run_blocking(self._on_error, e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            # Registro consumi e limiter condiviso sono su SQLite: fuori dall'event loop
+            await run_blocking(
+                self._on_success,
+                response, estimated_tokens, tokens_of, time.monotonic() - started, model=model
+            )
+            return response
+
+    def call_blocking(
+        self,
+        func: Callable[[], T],
+        estimated_tokens: int = 0,
+        tokens_of: Callable[[Any], int] = lambda r: usage_from_response(r).total_tokens,
+        model: str = ""
+    ) -> T:
+        """Versione sincrona di call (app Streamlit, CLI)"""
+        self._count("calls")
+        attempt = 0
+        while True:
+            self.limiter.acquire_blocking(estimated_tokens)
+            self._admit()
+            started = time.monotonic()
+            try:
+                with start_span("model_call", CLIENT, _span_attributes(model, attempt)) as span:
+                    response = func()
+                    _annotate(span, response)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._on_success(
+                response, estimated_tokens, tokens_of, time.monotonic() - started, model=model
+            )
+            return response
+
+    async def stream(
+        self,
+        func: Callable[[], AsyncIterator[T]],
+        estimated_tokens: int = 0,
+        tokens_of: Callable[[Any], int] = lambda r: usage_from_response(r).total_tokens,
+        model: str = ""
+    ) -> AsyncIterator[T]:
+        """
+        Stream con retry fino al primo frammento: dopo il primo token un
+        errore viene propagato (ritentare duplicherebbe il testo già inviato).
+        La stima dei token è corretta con l'usage dell'ultimo frammento; per
+        la cache del prompt si registra il tempo al primo frammento, nel
+        registro dei consumi la durata dell'intero stream.
+        Lo slot dello scheduler resta occupato fino alla fine dello stream.
+        """
+        async with scheduled("llm"):
+            chunks = self._stream(func, estimated_tokens, tokens_of, model)
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+
+    async def _stream(
+        self,
+        func: Callable[[], AsyncIterator[T]],
+        estimated_tokens: int,
+        tokens_of: Callable[[Any], int],
+        model: str
+    ) -> AsyncIterator[T]:
+        self._count("calls")
+        attempt = 0
+        while True:
+            await self.limiter.acquire(estimated_tokens)
+            self._admit()
+            started = time.monotonic()
+            # Lo stream è consumato a pezzi: lo span non diventa quello corrente
+            span = open_span("model_call", CLIENT, dict(_span_attributes(model, attempt), stream=True))
+            stream = None
+            try:
+                stream = func()
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                span.end()
+                self.breaker.record_success()
+                return
+            except asyncio.CancelledError as e:
+                span.record_exception(e)
+                span.end()
+                self.breaker.release()
+                if stream is not None:
+                    await stream.aclose()
+                raise
+            except Exception as e:
+                span.record_exception(e)
+                span.end()
+                if stream is not None:
+                    await stream.aclose()
+                # pause del limiter condiviso scrive su SQLite
+                delay = await run_blocking(self._on_error, e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            break
+
+        ttft = time.monotonic() - started
+        span.set_attribute("ttft_s", round(ttft, 3))
+        self.breaker.record_success()
+        last = first
+        try:
+            yield first
+            async for chunk in stream:
+                last = chunk
+                yield chunk
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            await stream.aclose()
+            _annotate(span, last)
+            span.end()
+        await run_blocking(
+            self._on_success,
+            last, estimated_tokens, tokens_of, ttft, STREAM,
+            model=model, latency=time.monotonic() - started
+        )
+
+
+def _span_attributes(model: str, attempt: int) -> Dict[str, Any]:
+    return {"peer.service": "openai", "gen_ai.request.model": model or "unknown", "attempt": attempt + 1}
+
+
+def _annotate(span: Any, response: Any) -> None:
+    """Modello e token della risposta sullo span della chiamata"""
+    usage = usage_from_response(response)
+    span.set_attribute("gen_ai.response.model", getattr(response, "model", None))
+    span.set_attribute("gen_ai.usage.input_tokens", usage.prompt_tokens)
+    span.set_attribute("gen_ai.usage.output_tokens", usage.completion_tokens)
+    span.set_attribute("gen_ai.usage.cached_tokens", usage.cached_tokens)
+
+
+def estimate_tokens(*texts: str, completion: int = 2000) -> int:
+    """Stima dei token di una chiamata (~4 caratteri per token) più la risposta massima"""
+    return sum(len(text) for text in texts) // 4 + completion
+
+
+_default_resilience: Optional[Resilience] = None
+_default_lock = threading.Lock()
+
+
+def _shared_limiter(rpm: float = 0, tpm: float = 0) -> RateLimiter:
+    """Limiter su DEFAULT_RATE_DB; un limite 0 ricade sulla variabile d'ambiente"""
+    return RateLimiter(
+        rpm=rpm or float(os.getenv("SEO_AGENT_LLM_RPM", "0")),
+        tpm=tpm or float(os.getenv("SEO_AGENT_LLM_TPM", "0")),
+        db_path=DEFAULT_RATE_DB
+    )
+
+
+def default_resilience() -> Resilience:
+    """
+    Istanza condivisa dal processo, configurata dalle variabili d'ambiente.
+    Retry e circuit breaker sono sempre attivi; il rate limiter solo se
+    SEO_AGENT_LLM_RPM o SEO_AGENT_LLM_TPM sono impostati.
+    """
+    global _default_resilience
+    with _default_lock:
+        if _default_resilience is None:
+            _default_resilience = Resilience(
+                limiter=_shared_limiter(),
+                retry=RetryPolicy(max_retries=int(os.getenv("SEO_AGENT_LLM_RETRIES", "4"))),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.getenv("SEO_AGENT_BREAKER_THRESHOLD", "5")),
+                    reset_timeout=float(os.getenv("SEO_AGENT_BREAKER_RESET", "30"))
+                ),
+                ledger=default_ledger()
+            )
+        return _default_resilience
+
+
+def configure_rate_limits(rpm: float = 0, tpm: float = 0) -> None:
+    """
+    Imposta i limiti RPM/TPM dell'istanza condivisa (es. --rpm/--tpm del batch).
+    Ogni chiamata al modello prenota già lì: un secondo limiter a monte
+    conterebbe due volte le stesse richieste.
+    """
+    if rpm or tpm:
+        default_resilience().limiter = _shared_limiter(rpm, tpm)
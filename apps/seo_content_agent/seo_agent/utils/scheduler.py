@@ -0,0 +1,306 @@
+"""
+Scheduler - Accesso equo al modello e allo scraping tra gli utenti
+
+Tutte le chiamate al modello e gli scraping (SERP, pagine prodotto) passano
+da un numero limitato di slot. Le richieste in attesa stanno in code per
+utente: le richieste interattive (generazioni e iterazioni dalla pagina)
+hanno la precedenza su quelle batch (job in coda), e a parità di priorità
+gli utenti sono serviti in modo equo secondo il loro peso (start-time fair
+queueing), con un tetto di slot contemporanei per utente. Così il batch di
+200 pagine di un collega non blocca le generazioni degli altri.
+
+L'utente e la priorità del lavoro corrente sono in una context variable,
+impostata all'inizio di ogni richiesta HTTP o job: i task creati da lì la
+ereditano, quindi le chiamate annidate non devono passarla esplicitamente.
+Il codice che gira in thread propri (scraping in blocco) usa
+scheduled_blocking passando l'utente catturato dalla richiesta.
+
+Configurazione: SEO_AGENT_SCHED_SLOTS (slot totali, default 8; 0 disattiva),
+SEO_AGENT_SCHED_USER_SLOTS (slot per utente, default 4),
+SEO_AGENT_SCHED_WEIGHTS (pesi per utente, es. "admin=2,mario=1").
+"""
+
+import os
+import time
+import asyncio
+import threading
+import logging
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Priorità, in ordine di servizio
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+ANONYMOUS = "anonymous"
+# Attese recenti per utente usate per il percentile
+WAIT_WINDOW = 200
+
+_owner: ContextVar[Tuple[str, str]] = ContextVar("seo_agent_work_owner", default=(ANONYMOUS, INTERACTIVE))
+
+
+def set_work_owner(user: Optional[str], priority: str = INTERACTIVE) -> None:
+    """
+    Utente e priorità del lavoro avviato dal contesto corrente.
+    Ogni richiesta HTTP e ogni job gira in un proprio contesto: non serve ripristinarlo.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Priorità sconosciuta: {priority}")
+    _owner.set((user or ANONYMOUS, priority))
+
+
+def current_owner() -> Tuple[str, str]:
+    return _owner.get()
+
+
+@dataclass
+class _Waiter:
+    user: str
+    priority: str
+    tag: float  # tempo virtuale di inizio (start-time fair queueing)
+    loop: Optional[asyncio.AbstractEventLoop]
+    future: Optional[asyncio.Future]
+    # Waiter di un thread (blocking_slot): svegliato dall'evento invece che dal loop
+    event: Optional[threading.Event] = None
+    enqueued: float = field(default_factory=time.monotonic)
+    granted: bool = False
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+@dataclass
+class _UserStats:
+    running: int = 0
+    served: int = 0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=WAIT_WINDOW))
+    max_wait: float = 0.0
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class FairScheduler:
+    """
+    Slot condivisi con code per utente, priorità e tetto per utente.
+
+    Thread-safe: lo stato è protetto da un lock e i waiter vengono svegliati
+    nel proprio event loop, quindi lo stesso scheduler serve anche più loop
+    dello stesso processo.
+    """
+
+    def __init__(self, capacity: int = 8, per_user: int = 4, weights: Dict[str, float] = None):
+        if capacity <= 0:
+            raise ValueError("capacity deve essere positiva")
+        self.capacity = capacity
+        self.per_user = max(1, min(per_user, capacity))
+        self.weights = dict(weights or {})
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues: Dict[str, Dict[str, Deque[_Waiter]]] = {p: {} for p in PRIORITIES}
+        self._finish: Dict[Tuple[str, str], float] = {}
+        self._virtual: Dict[str, float] = {p: 0.0 for p in PRIORITIES}
+        self._users: Dict[str, _UserStats] = {}
+        self._kinds: Counter = Counter()
+
+    def weight(self, user: str) -> float:
+        return max(0.01, self.weights.get(user, 1.0))
+
+    # ==================== CODE ====================
+
+    def _user(self, user: str) -> _UserStats:
+        return self._users.setdefault(user, _UserStats())
+
+    def _enqueue(self, user: str, priority: str, event: Optional[threading.Event] = None) -> _Waiter:
+        loop = asyncio.get_running_loop() if event is None else None
+        with self._lock:
+            # Un utente che torna dopo una pausa riparte dal tempo virtuale corrente
+            start = max(self._virtual[priority], self._finish.get((priority, user), 0.0))
+            self._finish[(priority, user)] = start + 1.0 / self.weight(user)
+            waiter = _Waiter(
+                user, priority, start, loop, loop.create_future() if loop else None, event
+            )
+            self._queues[priority].setdefault(user, deque()).append(waiter)
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self) -> None:
+        """Assegna gli slot liberi (chiamato con il lock)"""
+        while self._active < self.capacity:
+            waiter = self._next()
+            if waiter is None:
+                return
+            queue = self._queues[waiter.priority][waiter.user]
+            queue.popleft()
+            if not queue:
+                del self._queues[waiter.priority][waiter.user]
+            self._virtual[waiter.priority] = max(self._virtual[waiter.priority], waiter.tag)
+            self._active += 1
+            stats = self._user(waiter.user)
+            stats.running += 1
+            stats.served += 1
+            wait = time.monotonic() - waiter.enqueued
+            stats.waits.append(wait)
+            stats.max_wait = max(stats.max_wait, wait)
+            waiter.granted = True
+            waiter.wake()
+
+    def _next(self) -> Optional[_Waiter]:
+        """Prima richiesta della priorità più alta con il tempo virtuale minore, tra gli utenti sotto il tetto"""
+        for priority in PRIORITIES:
+            heads = [
+                queue[0] for user, queue in self._queues[priority].items()
+                if self._user(user).running < self.per_user
+            ]
+            if heads:
+                return min(heads, key=lambda w: (w.tag, w.enqueued))
+        return None
+
+    def _release(self, user: str) -> None:
+        with self._lock:
+            self._active -= 1
+            self._user(user).running -= 1
+            self._dispatch()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Richiesta cancellata mentre attendeva: esce dalla coda o restituisce lo slot appena ricevuto"""
+        with self._lock:
+            if not waiter.granted:
+                queue = self._queues[waiter.priority].get(waiter.user)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[waiter.priority][waiter.user]
+                return
+        self._release(waiter.user)
+
+    @asynccontextmanager
+    async def slot(self, kind: str = "llm") -> AsyncIterator[None]:
+        """Attende il turno dell'utente corrente e occupa uno slot per la durata del blocco"""
+        user, priority = current_owner()
+        waiter = self._enqueue(user, priority)
+        if not waiter.granted:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        with self._lock:
+            self._kinds[kind] += 1
+        try:
+            yield
+        finally:
+            self._release(user)
+
+    @contextmanager
+    def blocking_slot(self, kind: str, owner: Tuple[str, str]) -> Iterator[None]:
+        """
+        Come slot, per il codice che gira in thread propri: il thread attende
+        il turno bloccandosi. owner (utente, priorità) va catturato dal
+        contesto della richiesta, che i thread di un executor non ereditano.
+        """
+        user, priority = owner
+        waiter = self._enqueue(user, priority, threading.Event())
+        waiter.event.wait()
+        with self._lock:
+            self._kinds[kind] += 1
+        try:
+            yield
+        finally:
+            self._release(user)
+
+    # ==================== STATISTICHE ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Slot occupati e, per utente, profondità delle code, slot in uso e tempi di attesa"""
+        now = time.monotonic()
+        with self._lock:
+            users = {}
+            for user in set(self._users) | {u for q in self._queues.values() for u in q}:
+                stats = self._user(user)
+                waits = sorted(stats.waits)
+                queued = {p: len(self._queues[p].get(user, ())) for p in PRIORITIES}
+                oldest = [w.enqueued for p in PRIORITIES for w in self._queues[p].get(user, ())]
+                users[user] = {
+                    "weight": self.weight(user),
+                    "running": stats.running,
+                    "queued": queued,
+                    "served": stats.served,
+                    "avg_wait_s": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95_wait_s": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else 0.0,
+                    "max_wait_s": round(stats.max_wait, 3),
+                    "oldest_queued_s": round(now - min(oldest), 3) if oldest else 0.0
+                }
+            return {
+                "capacity": self.capacity,
+                "per_user": self.per_user,
+                "active": self._active,
+                "queued": sum(len(q) for queues in self._queues.values() for q in queues.values()),
+                "by_kind": dict(self._kinds),
+                "users": users
+            }
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        user, sep, value = item.partition("=")
+        if sep and user.strip():
+            try:
+                weights[user.strip()] = float(value)
+            except ValueError:
+                logger.warning(f"⚠️ Peso non valido per {user.strip()}: {value}")
+    return weights
+
+
+_default_scheduler: Optional[FairScheduler] = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler() -> Optional[FairScheduler]:
+    """Scheduler condiviso dal processo, o None se SEO_AGENT_SCHED_SLOTS=0"""
+    global _default_scheduler
+    capacity = int(os.getenv("SEO_AGENT_SCHED_SLOTS", "8"))
+    if capacity <= 0:
+        return None
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = FairScheduler(
+                capacity=capacity,
+                per_user=int(os.getenv("SEO_AGENT_SCHED_USER_SLOTS", "4")),
+                weights=_parse_weights(os.getenv("SEO_AGENT_SCHED_WEIGHTS", ""))
+            )
+        return _default_scheduler
+
+
+@asynccontextmanager
+async def scheduled(kind: str = "llm") -> AsyncIterator[None]:
+    """Slot dello scheduler di default per il lavoro nel blocco (nessuna attesa se disattivato)"""
+    scheduler = default_scheduler()
+    if scheduler is None:
+        yield
+        return
+    async with scheduler.slot(kind):
+        yield
+
+
+@contextmanager
+def scheduled_blocking(kind: str, owner: Tuple[str, str]) -> Iterator[None]:
+    """Come scheduled, per i thread: owner è l'utente e la priorità della richiesta"""
+    scheduler = default_scheduler()
+    if scheduler is None:
+        yield
+        return
+    with scheduler.blocking_slot(kind, owner):
+        yield
@@ -0,0 +1,211 @@
+"""
+Scoring - Valutazione locale di un contenuto generato rispetto alle regole del prompt
+
+Controlla i vincoli verificabili del SYSTEM_PROMPT (lunghezza di meta title e
+description, prodotti citati, struttura H2/FAQ, link alla categoria padre,
+frasi vietate) e la copertura delle query SEOZoom. Serve a scegliere il
+migliore tra più candidati generati per lo stesso prompt e a individuare i
+singoli campi da correggere, senza altre chiamate al modello.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from .markdown_parser import parse_markdown
+from .sections import section_text, split_sections
+
+# Limiti del SYSTEM_PROMPT
+META_TITLE_MAX = 60
+META_DESCRIPTION_MAX = 155
+MIN_PRODUCTS = 3
+H2_COUNT = 3
+FAQ_COUNT = 2
+FAQ_ANSWER_MAX_WORDS = 40
+
+# Frasi vietate dalle indicazioni di stile (confronto senza maiuscole, parole intere)
+FORBIDDEN_PHRASES = [
+    "siamo leader", "vasta gamma", "la nostra gamma", "varietà di", "lista di",
+    "selezione di", "benvenuto", "benvenuti", "ecco a voi", "esplora", "scopri",
+    "sconto", "sconti", "promo", "promozione", "promozioni"
+]
+_FORBIDDEN_PATTERN = re.compile(
+    r'\b(' + "|".join(re.escape(p) for p in FORBIDDEN_PHRASES) + r')\b', re.IGNORECASE
+)
+
+# Penalità per violazione, su un punteggio base di 90 (+10 dalla copertura keyword)
+PENALTIES = {
+    "missing": 30,
+    "too_long": 20,
+    "product": 10,
+    "parent_link": 10,
+    "structure": 5,
+    "forbidden": 5,
+    "title_start": 5,
+    "separator": 3,
+    "faq_answer": 2
+}
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+@dataclass
+class Violation:
+    """Regola non rispettata e campo del contenuto a cui si riferisce"""
+    field: str  # meta_title, meta_description, h1, intro, h2-N, faq, products, structure
+    rule: str  # chiave di PENALTIES
+    message: str
+
+
+@dataclass
+class ContentScore:
+    """Punteggio 0-100 di un contenuto e regole violate"""
+    score: float
+    violations: List[str] = field(default_factory=list)
+    products_cited: int = 0
+    keyword_coverage: float = 0.0
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _keyword_coverage(words: set, queries: List[str]) -> float:
+    """Quota delle query le cui parole significative compaiono tutte nel testo"""
+    covered = 0
+    considered = 0
+    for query in queries:
+        terms = [t for t in _WORD_PATTERN.findall(query.lower()) if len(t) > 2]
+        if not terms:
+            continue
+        considered += 1
+        covered += all(t in words for t in terms)
+    return covered / considered if considered else 1.0
+
+
+def _forbidden(text: str) -> List[str]:
+    return sorted({m.lower() for m in _FORBIDDEN_PATTERN.findall(text)})
+
+
+def cited_products(content: str, products: List[str]) -> int:
+    text = _normalize(content)
+    return sum(1 for p in products if p.strip() and _normalize(p) in text)
+
+
+def validate_content(
+    content: str,
+    keyword: str,
+    products: List[str],
+    parent_url: str = ""
+) -> List[Violation]:
+    """
+    Controlla il contenuto Markdown rispetto alle regole del SYSTEM_PROMPT.
+    Ogni violazione indica il campo da correggere (es. solo il meta title).
+
+    Args:
+        content: Markdown generato
+        keyword: Nome della categoria
+        products: Prodotti della "fonte di verità"
+        parent_url: URL della categoria padre, se deve essere linkata
+    """
+    parsed = parse_markdown(content)
+    violations = []
+
+    def violation(field_name: str, rule: str, message: str) -> None:
+        violations.append(Violation(field_name, rule, message))
+
+    # Meta title e description
+    if not parsed.meta_title:
+        violation("meta_title", "missing", "meta title mancante")
+    else:
+        if len(parsed.meta_title) > META_TITLE_MAX:
+            violation("meta_title", "too_long", f"meta title di {len(parsed.meta_title)} caratteri (max {META_TITLE_MAX})")
+        if not _normalize(parsed.meta_title).startswith(_normalize(keyword)):
+            violation("meta_title", "title_start", "il meta title non inizia con il nome della categoria")
+        if "|" in parsed.meta_title:
+            violation("meta_title", "separator", "separatore diverso dal trattino nel meta title")
+        for phrase in _forbidden(parsed.meta_title):
+            violation("meta_title", "forbidden", f'frase vietata: "{phrase}"')
+    if not parsed.meta_description:
+        violation("meta_description", "missing", "meta description mancante")
+    else:
+        if len(parsed.meta_description) > META_DESCRIPTION_MAX:
+            violation(
+                "meta_description", "too_long",
+                f"meta description di {len(parsed.meta_description)} caratteri (max {META_DESCRIPTION_MAX})"
+            )
+        for phrase in _forbidden(parsed.meta_description):
+            violation("meta_description", "forbidden", f'frase vietata: "{phrase}"')
+    if not parsed.h1:
+        violation("h1", "missing", "H1 mancante")
+
+    # Prodotti citati
+    cited = cited_products(content, products)
+    required = min(MIN_PRODUCTS, len(products))
+    for _ in range(required - cited):
+        violation("products", "product", f"{cited} prodotti citati (minimo {required})")
+
+    # Struttura
+    if len(parsed.sections) != H2_COUNT:
+        violation("structure", "structure", f"{len(parsed.sections)} sezioni H2 (richieste {H2_COUNT})")
+    if len(parsed.faq) != FAQ_COUNT:
+        violation("structure", "structure", f"{len(parsed.faq)} FAQ (richieste {FAQ_COUNT})")
+    for item in parsed.faq:
+        words = len(item["answer"].split())
+        if words > FAQ_ANSWER_MAX_WORDS:
+            violation("faq", "faq_answer", f"risposta FAQ di {words} parole (max {FAQ_ANSWER_MAX_WORDS})")
+
+    # Link alla categoria padre (richiesto nell'introduzione) e frasi vietate per sezione
+    sections = {s.key: section_text(content, s.start, s.end) for s in split_sections(content)}
+    if parent_url and parent_url not in sections.get("intro", ""):
+        violation("intro", "parent_link", "link alla categoria padre mancante nell'introduzione")
+    for key, text in sections.items():
+        if key in ("meta", "summary"):
+            continue
+        for phrase in _forbidden(text):
+            violation(key, "forbidden", f'frase vietata: "{phrase}"')
+
+    return violations
+
+
+def score_content(
+    content: str,
+    keyword: str,
+    products: List[str],
+    queries: List[str] = None,
+    parent_url: str = ""
+) -> ContentScore:
+    """
+    Punteggio del contenuto: 90 meno le penalità delle violazioni, più fino
+    a 10 punti per la copertura delle query SEOZoom.
+    """
+    violations = validate_content(content, keyword, products, parent_url)
+    penalty = sum(PENALTIES[v.rule] for v in violations)
+    messages = list(dict.fromkeys(v.message for v in violations))
+    words = set(_WORD_PATTERN.findall(_normalize(content)))
+    coverage = _keyword_coverage(words, queries or [])
+    return ContentScore(
+        score=round(max(0.0, 90 - penalty) + 10 * coverage, 1),
+        violations=messages,
+        products_cited=cited_products(content, products),
+        keyword_coverage=round(coverage, 2)
+    )
+
+
+def rank_candidates(
+    candidates: List[str],
+    keyword: str,
+    products: List[str],
+    queries: List[str] = None,
+    parent_url: str = ""
+) -> Tuple[int, List[ContentScore]]:
+    """
+    Valuta tutti i candidati.
+
+    Returns:
+        (indice del migliore, punteggi nell'ordine dei candidati); a parità
+        vince il primo
+    """
+    scores = [score_content(c, keyword, products, queries, parent_url) for c in candidates]
+    best = max(range(len(scores)), key=lambda i: (scores[i].score, -i))
+    return best, scores
@@ -0,0 +1,252 @@
+"""
+Sections - Suddivisione del contenuto Markdown generato in sezioni modificabili
+
+Usato dall'iterazione mirata: si individua la sezione a cui si riferisce
+l'istruzione (meta, H1, intro, un H2, FAQ, riepilogo keyword), si invia al
+modello solo quella e la risposta viene reinserita nel documento. Con
+field_text e patch_field lo stesso vale per i campi di una riga (meta title,
+meta description, H1), usati dalla correzione dei singoli campi.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Oltre questa frazione del documento conviene la riscrittura completa
+MAX_TARGET_FRACTION = 0.6
+
+# Istruzioni che riguardano tutto il testo
+GLOBAL_PATTERN = re.compile(
+    r"\b(tutto il|tutta la|in tutto|intero|intera|ovunque|ogni sezione|"
+    r"tutte le sezioni|tutti i paragrafi|l'intero|whole|entire)\b"
+)
+
+SECTION_PATTERNS = [
+    ("meta", re.compile(r"\bmeta\b|title tag|\bsnippet\b")),
+    ("h1", re.compile(r"\bh1\b|titolo principale")),
+    ("intro", re.compile(r"\bintro|primo paragrafo|paragrafo iniziale|apertura")),
+    ("faq", re.compile(r"\bfaq\b|domand[ae]|\brispost[ae]\b")),
+    ("summary", re.compile(r"seo keywords?|keyword seo|riepilogo")),
+]
+
+ORDINALS = {"prim": 1, "second": 2, "terz": 3, "quart": 4, "quint": 5, "sest": 6}
+H2_NUMBER_PATTERN = re.compile(r"\b(?:h2|sezione|paragrafo)\s*(?:n\.?\s*)?(\d+)")
+H2_ORDINAL_PATTERN = re.compile(r"\b(prim|second|terz|quart|quint|sest)[oa]\s+(?:h2|sezione)")
+QUOTED_PATTERN = re.compile(r"[\"'«“‘]([^\"'»”’]{3,})[\"'»”’]")
+
+STOPWORDS = {
+    "della", "delle", "dello", "degli", "dalla", "dalle", "nella", "nelle",
+    "sulla", "sulle", "come", "quali", "quale", "sono", "perché", "sezione",
+    "paragrafo", "testo", "rendi", "aggiungi", "modifica", "riscrivi", "migliora"
+}
+
+
+# Etichette delle righe meta nel formato del system prompt
+META_LABELS = {"meta_title": "Meta Title:", "meta_description": "Meta Description:"}
+
+
+@dataclass
+class Section:
+    """Sezione del documento: righe [start, end), righe vuote e separatori ai bordi esclusi"""
+    key: str  # meta, h1, intro, h2-1, h2-2, ..., faq, summary
+    title: str
+    start: int
+    end: int
+
+
+def split_sections(content: str) -> List[Section]:
+    """
+    Divide il contenuto nel formato del system prompt in sezioni contigue.
+
+    Le righe vuote iniziali e finali e i separatori "---" in coda a una
+    sezione non ne fanno parte, così restano al loro posto quando la sezione
+    viene sostituita.
+    """
+    lines = content.split("\n")
+    boundaries: List[Tuple[int, str, str]] = [(0, "meta", "Meta Title e Meta Description")]
+    h1_seen = False
+    h2_count = 0
+
+    for i, line in enumerate(lines):
+        if line.startswith("# ") and not h1_seen:
+            h1_seen = True
+            boundaries.append((i, "h1", line[2:].strip()))
+            boundaries.append((i + 1, "intro", "Introduzione"))
+        elif line.startswith("## "):
+            title = line[3:].strip()
+            if "Domande Frequenti" in title or "FAQ" in title:
+                boundaries.append((i, "faq", title))
+            else:
+                h2_count += 1
+                boundaries.append((i, f"h2-{h2_count}", title))
+        elif "SEO Keywords:" in line:
+            boundaries.append((i, "summary", "SEO Keywords"))
+
+    sections = []
+    for n, (start, key, title) in enumerate(boundaries):
+        end = boundaries[n + 1][0] if n + 1 < len(boundaries) else len(lines)
+        while end > start and lines[end - 1].strip() in ("", "---"):
+            end -= 1
+        while start < end and not lines[start].strip():
+            start += 1
+        if end > start:
+            sections.append(Section(key=key, title=title, start=start, end=end))
+    return sections
+
+
+def section_text(content: str, start: int, end: int) -> str:
+    return "\n".join(content.split("\n")[start:end])
+
+
+def replace_lines(content: str, start: int, end: int, new_text: str) -> str:
+    """Sostituisce le righe [start, end) con new_text, lasciando intatto il resto"""
+    lines = content.split("\n")
+    new_lines = new_text.strip("\n").split("\n")
+    # Il modello a volte chiude la sezione con un separatore: è già nel documento
+    while new_lines and new_lines[-1].strip() in ("", "---"):
+        new_lines.pop()
+    return "\n".join(lines[:start] + new_lines + lines[end:])
+
+
+def _significant_words(text: str) -> set:
+    return {
+        w for w in re.findall(r"[a-zàèéìòù0-9]+", text.lower())
+        if len(w) > 3 and w not in STOPWORDS
+    }
+
+
+def _match_h2(sections: List[Section], instruction: str) -> List[Section]:
+    h2s = [s for s in sections if s.key.startswith("h2-")]
+    if not h2s:
+        return []
+
+    numbers = [int(n) for n in H2_NUMBER_PATTERN.findall(instruction)]
+    numbers += [ORDINALS[o] for o in H2_ORDINAL_PATTERN.findall(instruction)]
+    by_number = [s for s in h2s if int(s.key[3:]) in numbers]
+    if by_number:
+        return by_number
+
+    quoted = [q.lower().strip() for q in QUOTED_PATTERN.findall(instruction)]
+    by_quote = [s for s in h2s if any(q in s.title.lower() for q in quoted)]
+    if by_quote:
+        return by_quote
+
+    words = _significant_words(instruction)
+    matched = []
+    for s in h2s:
+        title_words = _significant_words(s.title)
+        overlap = title_words & words
+        if title_words and len(overlap) >= min(2, len(title_words)) \
+                and len(overlap) / len(title_words) >= 0.5:
+            matched.append(s)
+    return matched
+
+
+def find_target(
+    content: str,
+    instruction: str,
+    section: str = ""
+) -> Optional[Tuple[int, int, str]]:
+    """
+    Individua le righe da modificare per un'istruzione.
+
+    Args:
+        content: Documento Markdown corrente
+        instruction: Istruzione dell'utente
+        section: Chiave esplicita (es. "meta", "h2-2", "faq"); "full" forza
+            la riscrittura completa, vuoto = rilevamento automatico
+
+    Returns:
+        (riga iniziale, riga finale esclusa, chiavi delle sezioni) oppure
+        None se l'istruzione riguarda tutto il documento o non è localizzabile
+    """
+    if section == "full":
+        return None
+    sections = split_sections(content)
+    if not sections:
+        return None
+
+    if section:
+        targets = [s for s in sections if s.key == section]
+    else:
+        text = instruction.lower()
+        if GLOBAL_PATTERN.search(text):
+            return None
+        keys = {key for key, pattern in SECTION_PATTERNS if pattern.search(text)}
+        targets = [s for s in sections if s.key in keys]
+        targets += _match_h2(sections, text)
+
+    if not targets:
+        return None
+
+    start = min(s.start for s in targets)
+    end = max(s.end for s in targets)
+    if not section and end - start > MAX_TARGET_FRACTION * len(content.split("\n")):
+        return None
+    keys = ",".join(s.key for s in sections if s.start >= start and s.end <= end)
+    return start, end, keys
+
+
+def outline(content: str) -> str:
+    """Struttura sintetica del documento, come contesto minimo per il modello"""
+    return "\n".join(
+        f"- {s.key}: {s.title}" for s in split_sections(content)
+        if s.key not in ("meta", "intro", "summary")
+    )
+
+
+def _field_line(lines: List[str], field: str) -> Optional[int]:
+    """Indice della riga di un campo a riga singola (meta_title, meta_description, h1)"""
+    for i, line in enumerate(lines):
+        if field == "h1" and line.startswith("# "):
+            return i
+        if field in META_LABELS and META_LABELS[field] in line:
+            return i
+    return None
+
+
+def field_text(content: str, field: str) -> str:
+    """
+    Testo corrente di un campo: valore di meta_title, meta_description e h1,
+    testo completo per le chiavi di split_sections (intro, h2-N, faq, ...).
+    """
+    lines = content.split("\n")
+    if field in META_LABELS or field == "h1":
+        i = _field_line(lines, field)
+        if i is None:
+            return ""
+        if field == "h1":
+            return lines[i][2:].strip()
+        label = META_LABELS[field]
+        return lines[i].replace(f"**{label}**", "").replace(label, "").strip()
+    for section in split_sections(content):
+        if section.key == field:
+            return section_text(content, section.start, section.end)
+    return ""
+
+
+def patch_field(content: str, field: str, value: str) -> Optional[str]:
+    """
+    Sostituisce un campo (vedi field_text) lasciando intatto il resto.
+    Una meta mancante viene inserita accanto all'altra.
+
+    Returns:
+        Il documento aggiornato, o None se il campo non è nel documento
+    """
+    lines = content.split("\n")
+    if field in META_LABELS or field == "h1":
+        new_line = f"# {value}" if field == "h1" else f"**{META_LABELS[field]}** {value}"
+        i = _field_line(lines, field)
+        if i is not None:
+            return replace_lines(content, i, i + 1, new_line)
+        if field == "meta_description":
+            i = _field_line(lines, "meta_title")
+            return None if i is None else replace_lines(content, i, i + 1, f"{lines[i]}\n{new_line}")
+        if field == "meta_title":
+            i = _field_line(lines, "meta_description")
+            return None if i is None else replace_lines(content, i, i + 1, f"{new_line}\n{lines[i]}")
+        return None
+    for section in split_sections(content):
+        if section.key == field:
+            return replace_lines(content, section.start, section.end, value)
+    return None
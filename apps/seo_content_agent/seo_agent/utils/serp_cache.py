@@ -0,0 +1,107 @@
+"""
+SERP Cache - Risultati di ricerca salvati su disco per keyword
+
+Ogni ricerca riuscita viene salvata. Entro il TTL (SEO_AGENT_SERP_CACHE_TTL_H,
+default 0: sempre una ricerca nuova) i risultati vengono riusati senza
+interrogare il motore; oltre il TTL e fino a max_age restano disponibili come
+dati "scaduti", usati solo quando la ricerca non risponde in tempo.
+Si disabilita con SEO_AGENT_SERP_CACHE=0.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .metrics import record_cache
+from .serp_scraper import SerpResult
+
+DEFAULT_SERP_CACHE_DIR = Path(
+    os.getenv("SEO_AGENT_SERP_CACHE_DIR", Path(tempfile.gettempdir()) / "seo_agent_serp_cache")
+)
+
+
+class SerpCache:
+    """Cache su disco (un file JSON per keyword, scrittura atomica) dei risultati SERP"""
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_SERP_CACHE_DIR,
+        ttl: float = 0,
+        max_age: float = 7 * 24 * 3600
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_age = max_age
+
+    def _path(self, keyword: str, num_results: int, region: str) -> Path:
+        key = f"{keyword.strip().lower()}|{num_results}|{region}"
+        return self.directory / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def get(
+        self,
+        keyword: str,
+        num_results: int = 10,
+        region: str = "it-it",
+        stale: bool = False
+    ) -> Optional[Tuple[List[SerpResult], float]]:
+        """
+        Risultati in cache e loro età in secondi, o None.
+        Con stale=True accetta anche le voci oltre il TTL (fino a max_age):
+        è il ripiego dopo una lettura normale già contata, nelle metriche
+        conta solo come "stale" se trovata.
+        """
+        path = self._path(keyword, num_results, region)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            data = None
+        age = time.time() - data.get("created_at", 0.0) if data else 0.0
+        if data and age > self.max_age:
+            path.unlink(missing_ok=True)
+            data = None
+        if data is None or (age > self.ttl and not stale):
+            if not stale:
+                record_cache("serp", "miss" if data is None else "expired")
+            return None
+        record_cache("serp", "stale" if stale else "hit")
+        return [SerpResult(**r) for r in data["results"]], age
+
+    def put(self, keyword: str, results: List[SerpResult], num_results: int = 10, region: str = "it-it") -> None:
+        """Salva i risultati di una ricerca riuscita (le ricerche vuote non sono salvate)"""
+        if not results:
+            return
+        path = self._path(keyword, num_results, region)
+        data = {"results": [asdict(r) for r in results], "created_at": time.time()}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+
+_default_cache: Optional[SerpCache] = None
+_default_lock = threading.Lock()
+
+
+def default_serp_cache() -> Optional[SerpCache]:
+    """Cache SERP condivisa dal processo, o None se disabilitata (SEO_AGENT_SERP_CACHE=0)"""
+    global _default_cache
+    if os.getenv("SEO_AGENT_SERP_CACHE", "1") not in ("1", "true", "yes"):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SerpCache(
+                ttl=float(os.getenv("SEO_AGENT_SERP_CACHE_TTL_H", "0")) * 3600,
+                max_age=float(os.getenv("SEO_AGENT_SERP_CACHE_MAX_AGE_H", "168")) * 3600
+            )
+        return _default_cache
@@ -4,9 +4,15 @@ Utilizza DuckDuckGo Search come alternativa a Google (no API key richiesta)
 """
 
 import re
+import logging
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 
+from .metrics import ERROR, stage_timer
+from .tracing import CLIENT
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class SerpResult:
@@ -20,7 +26,8 @@ class SerpResult:
 def scrape_serp(
     keyword: str,
     num_results: int = 10,
-    region: str = "it-it"
+    region: str = "it-it",
+    timeout: Optional[float] = None
 ) -> List[SerpResult]:
     """
     Esegue scraping dei risultati di ricerca per una keyword.
@@ -30,6 +37,7 @@ def scrape_serp(
         keyword: La keyword da cercare
         num_results: Numero di risultati da ottenere (default 10)
         region: Regione per i risultati (default it-it per Italia)
+        timeout: Timeout in secondi delle richieste del client (default del client)
     
     Returns:
         Lista di SerpResult con i dati dei primi risultati
@@ -40,33 +48,59 @@ def scrape_serp(
         try:
             from duckduckgo_search import DDGS
         except ImportError:
-            print("⚠️ ddgs non installato. Installalo con: pip install ddgs")
+            logger.warning("⚠️ ddgs non installato. Installalo con: pip install ddgs")
             return []
     
     results = []
     
-    try:
-        with DDGS() as ddgs:
-            search_results = list(ddgs.text(
-                keyword,
-                region=region,
-                max_results=num_results
-            ))
-            
-            for i, item in enumerate(search_results, 1):
-                results.append(SerpResult(
-                    position=i,
-                    title=item.get('title', ''),
-                    url=item.get('href', ''),
-                    description=item.get('body', '')
+    with stage_timer("serp_fetch", CLIENT, {"peer.service": "duckduckgo", "serp.keyword": keyword}) as stage:
+        try:
+            client_args = {"timeout": max(1, int(timeout))} if timeout else {}
+            with DDGS(**client_args) as ddgs:
+                search_results = list(ddgs.text(
+                    keyword,
+                    region=region,
+                    max_results=num_results
                 ))
-    
-    except Exception as e:
-        print(f"⚠️ Errore durante lo scraping SERP: {e}")
+                
+                for i, item in enumerate(search_results, 1):
+                    results.append(SerpResult(
+                        position=i,
+                        title=item.get('title', ''),
+                        url=item.get('href', ''),
+                        description=item.get('body', '')
+                    ))
+        
+        except Exception as e:
+            stage.outcome = ERROR
+            logger.warning(f"⚠️ Errore durante lo scraping SERP: {e}", extra={"keyword": keyword})
+        
+        stage.rows = len(results)
+        stage.bytes = sum(len(f"{r.title}{r.url}{r.description}".encode("utf-8")) for r in results)
     
     return results
 
 
+async def scrape_serp_async(
+    keyword: str,
+    num_results: int = 10,
+    region: str = "it-it",
+    timeout: Optional[float] = None
+) -> List[SerpResult]:
+    """
+    Versione asincrona di scrape_serp.
+    Il client DuckDuckGo è sincrono: la ricerca gira nel pool di thread
+    dedicato alla rete, così più keyword possono essere cercate in parallelo
+    senza bloccare l'event loop né occupare i thread del pool condiviso;
+    ogni ricerca occupa uno slot dello scheduler.
+    """
+    from .concurrency import run_network
+    from .scheduler import scheduled
+    
+    async with scheduled("serp"):
+        return await run_network(scrape_serp, keyword, num_results, region, timeout)
+
+
 def analyze_serp_titles(results: List[SerpResult]) -> Dict:
     """
     Analizza i titoli SERP per identificare pattern.
@@ -0,0 +1,423 @@
+"""
+Tracing - Tracce distribuite tra app Login, app SEO e servizi esterni
+
+Una generazione attraversa l'app Login (porta 8000), l'app SEO nell'iframe
+(porta 8001), DuckDuckGo, i siti degli e-commerce e il provider del modello.
+Ogni route, fase della pipeline e chiamata in uscita è uno span in stile
+OpenTelemetry (trace ID, span ID, padre, tipo, attributi, esito): gli span
+di una stessa azione condividono il trace ID e formano un albero che
+scompone i tempi di una generazione lenta.
+
+Il contesto passa tra i processi con l'header W3C traceparent: l'app Login
+lo aggiunge all'URL dell'iframe, la pagina dell'app SEO lo rimanda nelle
+chiamate API e i job in coda lo salvano tra i parametri. Dentro un processo
+lo span corrente è in una context variable, ereditata dai task e dal pool
+di thread (run_blocking).
+
+Gli span conclusi sono esportati in batch da un thread dedicato, nel formato
+JSON di OTLP: su file (SEO_AGENT_TRACE_FILE, una riga per batch, leggibile
+dal receiver otlpjsonfile del Collector) e/o verso un collector
+(SEO_AGENT_TRACE_ENDPOINT, es. http://localhost:4318/v1/traces). Senza
+nessuno dei due il tracing è disattivato e non crea span.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import asyncio
+import logging
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Tipi di span (valori di SpanKind in OTLP)
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+# Esiti (StatusCode in OTLP)
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 2.0
+_STOP = object()
+
+
+def _random_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class SpanContext:
+    """Identità di uno span, propagata tra processi con traceparent"""
+
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Contesto da un header traceparent, o None se assente o non valido"""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if match is None or not int(match.group(1), 16) or not int(match.group(2), 16):
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+class Span:
+    """Operazione misurata: si conclude una sola volta con end()"""
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        kind: int,
+        parent: Optional[SpanContext],
+        attributes: Optional[Dict[str, Any]] = None
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.context = SpanContext(parent.trace_id if parent else _random_id(16), _random_id(8))
+        self.parent_id = parent.span_id if parent else ""
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = STATUS_OK
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        """Esito dello span da un'eccezione: la cancellazione non è un errore"""
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            self.attributes["cancelled"] = True
+            return
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+
+    def end(self) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        self.tracer.processor.on_end(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """Span del tracing disattivato: le chiamate non hanno effetto"""
+
+    context = None
+    recording = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+# ==================== EXPORT ====================
+
+class FileExporter:
+    """Aggiunge ogni batch a un file, una richiesta OTLP JSON per riga"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+
+class OTLPHttpExporter:
+    """Invia ogni batch a un collector OTLP/HTTP (JSON)"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchProcessor:
+    """
+    Raccoglie gli span conclusi e li esporta da un thread dedicato, ogni
+    FLUSH_INTERVAL secondi o ogni BATCH_SIZE span: chi chiude uno span non
+    attende mai l'export. Un export fallito perde il batch e viene loggato.
+    """
+
+    def __init__(self, service: str, exporters: List[Any]):
+        self.service = service
+        self.exporters = exporters
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="seo-agent-tracing", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def on_end(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            item = None
+            timeout = deadline - time.monotonic()
+            if timeout > 0:
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    pass
+            if item is _STOP:
+                self._export(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            # Intervallo scaduto o batch pieno
+            if item is None or len(batch) >= BATCH_SIZE:
+                self._export(batch)
+                batch = []
+                deadline = time.monotonic() + FLUSH_INTERVAL
+
+    def _export(self, spans: List[Span]) -> None:
+        if not spans:
+            return
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service)]},
+            "scopeSpans": [{
+                "scope": {"name": "seo_agent.tracing"},
+                "spans": [span.to_otlp() for span in spans]
+            }]
+        }]}
+        for exporter in self.exporters:
+            try:
+                exporter.export(payload)
+            except Exception as e:
+                logger.warning(f"⚠️ Export di {len(spans)} span fallito ({type(exporter).__name__}): {e}")
+
+    def shutdown(self) -> None:
+        """Esporta gli span ancora in coda e ferma il thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=5)
+
+
+# ==================== TRACER ====================
+
+class Tracer:
+    """Crea gli span di un servizio e li passa al processore di export"""
+
+    def __init__(self, service: str, processor: BatchProcessor):
+        self.service = service
+        self.processor = processor
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("seo_agent_current_span", default=None)
+
+_tracer: Optional[Tracer] = None
+_configured = False
+_tracer_lock = threading.Lock()
+
+
+def configure_tracing(service: str) -> Optional[Tracer]:
+    """
+    Tracer del processo per il servizio indicato (es. "seo_agent", "login"),
+    con gli exporter configurati dalle variabili d'ambiente; None se nessun
+    exporter è configurato. Le chiamate successive alla prima non hanno effetto.
+    """
+    global _tracer, _configured
+    with _tracer_lock:
+        if _configured:
+            return _tracer
+        _configured = True
+        exporters = []
+        if os.getenv("SEO_AGENT_TRACE_FILE"):
+            exporters.append(FileExporter(os.environ["SEO_AGENT_TRACE_FILE"]))
+        if os.getenv("SEO_AGENT_TRACE_ENDPOINT"):
+            exporters.append(OTLPHttpExporter(os.environ["SEO_AGENT_TRACE_ENDPOINT"]))
+        if exporters:
+            _tracer = Tracer(service, BatchProcessor(service, exporters))
+            logger.info(f"🧭 Tracing attivo per {service}: {', '.join(type(e).__name__ for e in exporters)}")
+        return _tracer
+
+
+def default_tracer() -> Optional[Tracer]:
+    """Tracer del processo (configurato come "seo_agent" se nessuno l'ha fatto prima)"""
+    return _tracer if _configured else configure_tracing("seo_agent")
+
+
+def current_span_context() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_traceparent() -> str:
+    """traceparent dello span corrente, da propagare a un altro servizio ("" se nessuno)"""
+    context = _current.get()
+    return context.traceparent if context else ""
+
+
+def open_span(
+    name: str,
+    kind: int = INTERNAL,
+    attributes: Optional[Dict[str, Any]] = None,
+    parent: Optional[SpanContext] = None
+):
+    """
+    Span figlio di parent (default: lo span corrente) che non diventa lo
+    span corrente: va concluso con end(). Serve per operazioni che non
+    stanno in un blocco with (es. uno stream consumato a pezzi).
+    """
+    tracer = default_tracer()
+    if tracer is None:
+        return NOOP_SPAN
+    return Span(tracer, name, kind, parent or _current.get(), attributes)
+
+
+@contextmanager
+def start_span(
+    name: str,
+    kind: int = INTERNAL,
+    attributes: Optional[Dict[str, Any]] = None,
+    parent: Optional[SpanContext] = None
+) -> Iterator[Any]:
+    """
+    Span corrente per la durata del blocco: gli span aperti nel blocco (anche
+    in task e thread avviati da qui) ne sono figli. Un'eccezione ne segna
+    l'esito e viene propagata.
+    """
+    span = open_span(name, kind, attributes, parent)
+    if not span.recording:
+        yield span
+        return
+    token = _current.set(span.context)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        span.end()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Blocco aperto in un generatore ripreso da un altro contesto
+            pass
+
+
+def tracing_middleware():
+    """
+    Middleware HTTP (app.middleware("http")) che apre uno span SERVER per
+    ogni richiesta, figlio del traceparent ricevuto (header o parametro
+    della query, per le pagine caricate in un iframe). Lo span si chiude
+    quando il corpo della risposta è stato inviato, anche per gli stream.
+    """
+    async def middleware(request, call_next):
+        if default_tracer() is None:
+            return await call_next(request)
+        parent = parse_traceparent(
+            request.headers.get("traceparent") or request.query_params.get("traceparent")
+        )
+        span = open_span(
+            f"{request.method} {request.url.path}",
+            SERVER,
+            {"http.method": request.method, "http.target": request.url.path},
+            parent=parent
+        )
+        token = _current.set(span.context)
+        try:
+            response = await call_next(request)
+        except BaseException as e:
+            span.record_exception(e)
+            span.end()
+            raise
+        finally:
+            _current.reset(token)
+
+        route = getattr(request.scope.get("route"), "path", None)
+        if route:
+            span.name = f"{request.method} {route}"
+            span.set_attribute("http.route", route)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.status = STATUS_ERROR
+        body = response.body_iterator
+
+        async def traced_body():
+            try:
+                async for chunk in body:
+                    yield chunk
+            except BaseException as e:
+                span.record_exception(e)
+                raise
+            finally:
+                span.end()
+
+        response.body_iterator = traced_body()
+        return response
+    return middleware
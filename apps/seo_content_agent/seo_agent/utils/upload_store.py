@@ -0,0 +1,181 @@
+"""
+Upload Store - Archivio dei CSV caricati, separato per upload
+
+Ogni upload riceve un ID. Le keyword già parsate restano in memoria (LRU con
+TTL) e vengono salvate su disco in formato compatto (JSON gzip), così
+qualsiasi worker uvicorn che condivide la directory può servirle.
+I file scaduti vengono eliminati automaticamente.
+"""
+
+import os
+import gzip
+import json
+import time
+import uuid
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import astuple, fields
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .csv_loader import KeywordData
+
+logger = logging.getLogger(__name__)
+
+# Ordine dei campi nel formato compatto su disco
+_FIELDS = [f.name for f in fields(KeywordData)]
+
+DEFAULT_UPLOAD_DIR = Path(
+    os.getenv("SEO_AGENT_UPLOAD_DIR", Path(tempfile.gettempdir()) / "seo_agent_uploads")
+)
+
+
+class UploadStore:
+    """
+    Archivio thread-safe e multi-processo delle keyword caricate.
+
+    La memoria è solo una cache: la copia su disco è la fonte di verità,
+    scritta in modo atomico (file temporaneo + rename) e condivisibile tra
+    più worker. Ogni accesso rinnova il TTL dell'upload.
+    """
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_UPLOAD_DIR,
+        max_items: int = 32,
+        ttl: float = 6 * 3600,
+        cleanup_interval: float = 300
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_items = max_items
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._cache: "OrderedDict[str, Tuple[float, List[KeywordData]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+    def _path(self, upload_id: str) -> Optional[Path]:
+        # Accetta solo ID generati da put(): evita path traversal
+        try:
+            return self.directory / f"{uuid.UUID(hex=upload_id).hex}.json.gz"
+        except (ValueError, TypeError):
+            return None
+
+    def _remember(self, upload_id: str, keywords: List[KeywordData]) -> None:
+        with self._lock:
+            self._cache[upload_id] = (time.time() + self.ttl, keywords)
+            self._cache.move_to_end(upload_id)
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+
+    def put(self, keywords: List[KeywordData], filename: str = "") -> str:
+        """
+        Salva le keyword di un upload e restituisce il nuovo upload ID.
+        """
+        upload_id = uuid.uuid4().hex
+        payload = {
+            "filename": filename,
+            "fields": _FIELDS,
+            "rows": [list(astuple(kw)) for kw in keywords]
+        }
+
+        path = self._path(upload_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        self._remember(upload_id, keywords)
+        self.cleanup()
+        return upload_id
+
+    def get(self, upload_id: str) -> Optional[List[KeywordData]]:
+        """
+        Restituisce le keyword di un upload, o None se l'ID non esiste o è scaduto.
+        """
+        path = self._path(upload_id)
+        if path is None:
+            return None
+
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(upload_id)
+            if cached and cached[0] > now:
+                self._cache.move_to_end(upload_id)
+                self._cache[upload_id] = (now + self.ttl, cached[1])
+                keywords = cached[1]
+            else:
+                self._cache.pop(upload_id, None)
+                keywords = None
+
+        if keywords is None:
+            keywords = self._load(path, now)
+            if keywords is None:
+                return None
+            self._remember(upload_id, keywords)
+
+        # Rinnova il TTL anche per gli altri worker
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        self.cleanup()
+        return keywords
+
+    def _load(self, path: Path, now: float) -> Optional[List[KeywordData]]:
+        try:
+            if path.stat().st_mtime + self.ttl < now:
+                path.unlink(missing_ok=True)
+                return None
+            with gzip.open(path, 'rb') as f:
+                payload = json.loads(f.read().decode('utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Upload illeggibile {path.name}: {e}")
+            return None
+
+        names = payload.get("fields", _FIELDS)
+        return [KeywordData(**dict(zip(names, row))) for row in payload.get("rows", [])]
+
+    def delete(self, upload_id: str) -> None:
+        """Elimina un upload dalla memoria e dal disco"""
+        with self._lock:
+            self._cache.pop(upload_id, None)
+        path = self._path(upload_id)
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+    def cleanup(self, force: bool = False) -> int:
+        """
+        Elimina i file scaduti dalla directory condivisa.
+        Eseguita al massimo una volta ogni cleanup_interval secondi.
+
+        Returns:
+            Numero di file eliminati
+        """
+        now = time.time()
+        if not force and now - self._last_cleanup < self.cleanup_interval:
+            return 0
+        self._last_cleanup = now
+
+        removed = 0
+        for path in self.directory.iterdir():
+            try:
+                # I .tmp rimasti sono scritture interrotte
+                if path.stat().st_mtime + self.ttl < now:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            logger.info(f"🧹 Rimossi {removed} upload scaduti")
+        return removed
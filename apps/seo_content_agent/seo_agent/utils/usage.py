@@ -0,0 +1,65 @@
+"""
+Token usage - Estrazione uniforme dei token consumati da una risposta LLM
+
+Gestisce sia le risposte OpenAI (usage.prompt_tokens, prompt_tokens_details)
+sia quelle dei client/agenti datapizza.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass
+class TokenUsage:
+    """Token consumati da una singola chiamata al modello"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def __add__(self, other: "TokenUsage") -> "TokenUsage":
+        return TokenUsage(
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            completion_tokens=self.completion_tokens + other.completion_tokens,
+            cached_tokens=self.cached_tokens + other.cached_tokens
+        )
+
+
+def _int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def usage_from_response(response) -> TokenUsage:
+    """
+    Estrae i token da una risposta del modello.
+    Restituisce zeri se la risposta non riporta l'usage.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return TokenUsage()
+
+    prompt = getattr(usage, "prompt_tokens", None)
+    if prompt is None:
+        prompt = getattr(usage, "input_tokens", 0)
+    completion = getattr(usage, "completion_tokens", None)
+    if completion is None:
+        completion = getattr(usage, "output_tokens", 0)
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None:
+        details = getattr(usage, "input_tokens_details", None)
+    if details is not None:
+        cached = getattr(details, "cached_tokens", 0)
+    else:
+        cached = getattr(usage, "cached_tokens", 0)
+
+    return TokenUsage(
+        prompt_tokens=_int(prompt),
+        completion_tokens=_int(completion),
+        cached_tokens=_int(cached)
+    )
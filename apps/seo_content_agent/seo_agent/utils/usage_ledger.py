@@ -0,0 +1,377 @@
+"""
+Usage ledger - Registro dei token consumati da ogni chiamata al modello
+
+Ogni risposta del modello (generazioni, iterazioni, batch) aggiunge una riga
+con utente, app, categoria, modello, token (prompt, risposta, in cache) e
+latenza a un registro SQLite in sola aggiunta. Un trigger mantiene nella
+stessa transazione i totali per giorno, utente, app e modello, così i
+riepiloghi e il controllo dei budget non scorrono il registro.
+
+L'utente è quello dello scheduler (scheduler.current_owner), app e categoria
+si impostano con set_usage_context all'inizio di ogni richiesta o job.
+
+Budget giornalieri in token (prompt + risposta, giorno UTC; 0 = nessun limite):
+    SEO_AGENT_BUDGET_USER_DAILY   per ciascun utente
+    SEO_AGENT_BUDGET_APP_DAILY    per app, es. "generate=2000000,iterate=500000"
+    SEO_AGENT_BUDGET_DAILY        totale
+Superato un budget la richiesta viene rifiutata (SEO_AGENT_BUDGET_ACTION=reject,
+default) o passa al modello economico SEO_AGENT_BUDGET_CHEAP_MODEL (downgrade).
+Il registro si configura con SEO_AGENT_USAGE_DB (SEO_AGENT_USAGE_LEDGER=0 lo disattiva).
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .scheduler import current_owner
+from .usage import TokenUsage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USAGE_DB = Path(
+    os.getenv("SEO_AGENT_USAGE_DB", Path(tempfile.gettempdir()) / "seo_agent_usage.sqlite3")
+)
+
+DEFAULT_APP = "seo_agent"
+
+# Azioni a budget superato
+REJECT = "reject"
+DOWNGRADE = "downgrade"
+
+# Dimensioni dei riepiloghi
+ROLLUP_KEYS = ("day", "user", "app", "model")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    app TEXT NOT NULL,
+    category TEXT NOT NULL,
+    model TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    latency_s REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_calls_day_category ON usage_calls (day, category);
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    app TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    latency_s REAL NOT NULL,
+    PRIMARY KEY (day, user, app, model)
+);
+CREATE TRIGGER IF NOT EXISTS usage_calls_rollup AFTER INSERT ON usage_calls
+BEGIN
+    INSERT INTO usage_daily VALUES (
+        NEW.day, NEW.user, NEW.app, NEW.model, 1,
+        NEW.prompt_tokens, NEW.completion_tokens, NEW.cached_tokens, NEW.latency_s
+    )
+    ON CONFLICT (day, user, app, model) DO UPDATE SET
+        calls = calls + 1,
+        prompt_tokens = prompt_tokens + NEW.prompt_tokens,
+        completion_tokens = completion_tokens + NEW.completion_tokens,
+        cached_tokens = cached_tokens + NEW.cached_tokens,
+        latency_s = latency_s + NEW.latency_s;
+END;
+CREATE TRIGGER IF NOT EXISTS usage_calls_append_only BEFORE UPDATE ON usage_calls
+BEGIN
+    SELECT RAISE(ABORT, 'usage_calls è in sola aggiunta');
+END;
+CREATE TRIGGER IF NOT EXISTS usage_calls_no_delete BEFORE DELETE ON usage_calls
+BEGIN
+    SELECT RAISE(ABORT, 'usage_calls è in sola aggiunta');
+END;
+"""
+
+_context: ContextVar[Tuple[str, str]] = ContextVar("seo_agent_usage_context", default=(DEFAULT_APP, ""))
+
+
+def set_usage_context(app: Optional[str] = None, category: Optional[str] = None) -> None:
+    """App e/o categoria (keyword) delle chiamate avviate dal contesto corrente"""
+    current_app, current_category = _context.get()
+    _context.set((app or current_app, current_category if category is None else category))
+
+
+def usage_context() -> Tuple[str, str]:
+    return _context.get()
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _seconds_to_midnight() -> float:
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+class BudgetExceeded(Exception):
+    """Budget giornaliero di token superato (e nessun modello economico su cui ripiegare)"""
+
+    status_code = 429
+
+    def __init__(self, scope: str, limit: int, spent: int):
+        super().__init__(
+            f"Budget giornaliero di token superato ({scope}: {spent}/{limit}), riprova domani"
+        )
+        self.scope = scope
+        self.limit = limit
+        self.spent = spent
+        self.retry_after = _seconds_to_midnight()
+
+
+@dataclass
+class UsageBudget:
+    """Limiti giornalieri in token (0 = nessun limite) e azione a limite superato"""
+    user_daily: int = 0
+    app_daily: Dict[str, int] = field(default_factory=dict)
+    daily: int = 0
+    action: str = REJECT
+    cheap_model: str = ""
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.user_daily or self.daily or any(self.app_daily.values()))
+
+
+class UsageLedger:
+    """
+    Registro SQLite dei consumi, condiviso da tutti i processi che usano lo
+    stesso file. I metodi sono sincroni (SQLite locale, pochi ms).
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_USAGE_DB, budget: Optional[UsageBudget] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.budget = budget or UsageBudget()
+        self._lock = threading.Lock()
+        self._errors = 0
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    # ==================== REGISTRAZIONE ====================
+
+    def record(self, usage: TokenUsage, latency: float, model: str, kind: str = "call") -> None:
+        """
+        Aggiunge una chiamata al registro. Le risposte senza usage (es. cache
+        locale) sono ignorate; un errore del registro non fa fallire la chiamata.
+        """
+        if not usage.total_tokens:
+            return
+        user, _ = current_owner()
+        app, category = usage_context()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO usage_calls (ts, day, user, app, category, model, kind, "
+                    "prompt_tokens, completion_tokens, cached_tokens, latency_s) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        time.time(), _today(), user, app, category, model or "unknown", kind,
+                        usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens,
+                        round(latency, 3)
+                    )
+                )
+        except sqlite3.Error as e:
+            with self._lock:
+                self._errors += 1
+            logger.warning(f"⚠️ Registro consumi non aggiornato: {e}")
+
+    # ==================== RIEPILOGHI ====================
+
+    def rollup(
+        self,
+        group_by: Sequence[str] = ("day", "user"),
+        days: int = 7,
+        user: Optional[str] = None,
+        app: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Totali degli ultimi days giorni raggruppati per day, user, app e/o model"""
+        keys = [k for k in group_by if k in ROLLUP_KEYS]
+        since = (datetime.now(timezone.utc) - timedelta(days=max(1, days) - 1)).strftime("%Y-%m-%d")
+        where, args = ["day >= ?"], [since]
+        if user:
+            where.append("user = ?")
+            args.append(user)
+        if app:
+            where.append("app = ?")
+            args.append(app)
+        columns = ", ".join(keys)
+        query = (
+            f"SELECT {columns + ', ' if keys else ''}SUM(calls) AS calls, "
+            "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, "
+            "SUM(cached_tokens) AS cached_tokens, SUM(latency_s) AS latency_s "
+            f"FROM usage_daily WHERE {' AND '.join(where)}"
+            f"{' GROUP BY ' + columns + ' ORDER BY ' + columns if keys else ''}"
+        )
+        with self._connect() as conn:
+            rows = conn.execute(query, args).fetchall()
+        return [self._totals(row, keys) for row in rows if row["calls"]]
+
+    def top_categories(self, days: int = 7, limit: int = 20) -> List[Dict[str, Any]]:
+        """Categorie (keyword) con più token negli ultimi days giorni"""
+        since = (datetime.now(timezone.utc) - timedelta(days=max(1, days) - 1)).strftime("%Y-%m-%d")
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT category, COUNT(*) AS calls, SUM(prompt_tokens) AS prompt_tokens, "
+                "SUM(completion_tokens) AS completion_tokens, SUM(cached_tokens) AS cached_tokens, "
+                "SUM(latency_s) AS latency_s FROM usage_calls "
+                "WHERE day >= ? AND category != '' GROUP BY category "
+                "ORDER BY SUM(prompt_tokens + completion_tokens) DESC LIMIT ?",
+                (since, limit)
+            ).fetchall()
+        return [self._totals(row, ["category"]) for row in rows]
+
+    @staticmethod
+    def _totals(row: sqlite3.Row, keys: List[str]) -> Dict[str, Any]:
+        totals = {key: row[key] for key in keys}
+        totals.update({
+            "calls": row["calls"],
+            "prompt_tokens": row["prompt_tokens"],
+            "completion_tokens": row["completion_tokens"],
+            "cached_tokens": row["cached_tokens"],
+            "total_tokens": row["prompt_tokens"] + row["completion_tokens"],
+            "avg_latency_s": round(row["latency_s"] / row["calls"], 3) if row["calls"] else 0.0
+        })
+        return totals
+
+    # ==================== BUDGET ====================
+
+    def spent_today(self, user: Optional[str] = None, app: Optional[str] = None) -> int:
+        """Token (prompt + risposta) di oggi, per utente e/o app o in totale"""
+        where, args = ["day = ?"], [_today()]
+        if user is not None:
+            where.append("user = ?")
+            args.append(user)
+        if app is not None:
+            where.append("app = ?")
+            args.append(app)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) AS tokens "
+                f"FROM usage_daily WHERE {' AND '.join(where)}",
+                args
+            ).fetchone()
+        return row["tokens"]
+
+    def _exceeded(self, user: str, app: str) -> Optional[BudgetExceeded]:
+        budget = self.budget
+        checks = [
+            (f"utente {user}", budget.user_daily, {"user": user}),
+            (f"app {app}", budget.app_daily.get(app, 0), {"app": app}),
+            ("totale", budget.daily, {})
+        ]
+        for scope, limit, filters in checks:
+            if limit:
+                spent = self.spent_today(**filters)
+                if spent >= limit:
+                    return BudgetExceeded(scope, limit, spent)
+        return None
+
+    def enforce(self, model: str) -> str:
+        """
+        Controlla i budget per l'utente e l'app del contesto corrente prima di
+        avviare un lavoro.
+
+        Returns:
+            Il modello da usare: model, o il modello economico se un budget è
+            superato e l'azione è downgrade
+
+        Raises:
+            BudgetExceeded: budget superato e azione reject (o nessun modello economico)
+        """
+        if not self.budget.enabled:
+            return model
+        user, _ = current_owner()
+        app, _ = usage_context()
+        exceeded = self._exceeded(user, app)
+        if exceeded is None:
+            return model
+        if self.budget.action == DOWNGRADE and self.budget.cheap_model:
+            if model != self.budget.cheap_model:
+                logger.warning(f"💸 {exceeded}: uso {self.budget.cheap_model} invece di {model}")
+            return self.budget.cheap_model
+        logger.warning(f"💸 Richiesta rifiutata: {exceeded}")
+        raise exceeded
+
+    def budget_status(self, user: str, app: Optional[str] = None) -> Dict[str, Any]:
+        """Consumi di oggi rispetto ai budget configurati"""
+        budget = self.budget
+        status = {
+            "action": budget.action,
+            "cheap_model": budget.cheap_model or None,
+            "user": {"user": user, "spent": self.spent_today(user=user), "limit": budget.user_daily or None},
+            "total": {"spent": self.spent_today(), "limit": budget.daily or None}
+        }
+        if app is not None:
+            status["app"] = {"app": app, "spent": self.spent_today(app=app), "limit": budget.app_daily.get(app) or None}
+        with self._lock:
+            status["record_errors"] = self._errors
+        return status
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip():
+            try:
+                limits[name.strip()] = int(float(value))
+            except ValueError:
+                logger.warning(f"⚠️ Budget non valido per {name.strip()}: {value}")
+    return limits
+
+
+_default_ledger: Optional[UsageLedger] = None
+_default_lock = threading.Lock()
+
+
+def default_ledger() -> Optional[UsageLedger]:
+    """
+    Registro condiviso dal processo, configurato dalle variabili d'ambiente,
+    o None se SEO_AGENT_USAGE_LEDGER=0.
+    """
+    global _default_ledger
+    if os.getenv("SEO_AGENT_USAGE_LEDGER", "1") in ("0", "false", "no"):
+        return None
+    with _default_lock:
+        if _default_ledger is None:
+            _default_ledger = UsageLedger(
+                budget=UsageBudget(
+                    user_daily=int(float(os.getenv("SEO_AGENT_BUDGET_USER_DAILY", "0"))),
+                    app_daily=_parse_limits(os.getenv("SEO_AGENT_BUDGET_APP_DAILY", "")),
+                    daily=int(float(os.getenv("SEO_AGENT_BUDGET_DAILY", "0"))),
+                    action=os.getenv("SEO_AGENT_BUDGET_ACTION", REJECT),
+                    cheap_model=os.getenv("SEO_AGENT_BUDGET_CHEAP_MODEL", "")
+                )
+            )
+        return _default_ledger
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark generazione a chiamata singola vs sezioni in parallelo
+
+Genera le stesse categorie nelle due modalità (una alla volta, senza cache
+e senza SERP) e confronta tempo di generazione e token consumati.
+
+Uso con il server stub (offline):
+    python tools/openai_stub.py --latency 0.5 --ms-per-token 15 &
+    OPENAI_BASE_URL=http://localhost:8999/v1 OPENAI_API_KEY=stub \\
+        python tools/bench_parallel.py --runs 3
+
+Con la vera API basta omettere OPENAI_BASE_URL (attenzione ai costi).
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from statistics import mean, median
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from seo_agent.agent import CategoryInput, SEOContentAgent
+from seo_agent.utils.csv_loader import load_seozoom_csv
+
+DEFAULT_CSV = Path(__file__).parent.parent / "data" / "esempio_seozoom.csv"
+DEFAULT_KEYWORDS = ["Costumi da bagno donna", "Costumi nuoto uomo", "Occhialini piscina"]
+PRODUCTS = [
+    "Costume Intero Donna Bicolore",
+    "Costume Intero Donna Annodato",
+    "Costume Nuoto Allenamento Bordato",
+    "Slip Nuoto Uomo Logo"
+]
+
+
+async def _measure(agent: SEOContentAgent, keyword: str, keywords: list, parallel: bool) -> Dict:
+    start = time.perf_counter()
+    output = await agent.agenerate_category_content(
+        csv_path=None,
+        category_input=CategoryInput(
+            keyword=keyword,
+            site_products=PRODUCTS,
+            parent_url="/sport/nuoto/",
+            parent_name="Nuoto"
+        ),
+        scrape_serp_results=False,
+        keywords=keywords,
+        use_cache=False,
+        parallel=parallel
+    )
+    return {
+        "seconds": time.perf_counter() - start,
+        "prompt_tokens": output.usage.prompt_tokens,
+        "completion_tokens": output.usage.completion_tokens,
+        "sections": len(output.sections),
+        "faq": len(output.faq)
+    }
+
+
+def _summary(samples: List[Dict]) -> Dict:
+    seconds = [s["seconds"] for s in samples]
+    return {
+        "runs": len(samples),
+        "mean_s": round(mean(seconds), 2),
+        "p50_s": round(median(seconds), 2),
+        "max_s": round(max(seconds), 2),
+        "prompt_tokens": round(mean(s["prompt_tokens"] for s in samples)),
+        "completion_tokens": round(mean(s["completion_tokens"] for s in samples)),
+        "sections": round(mean(s["sections"] for s in samples), 1),
+        "faq": round(mean(s["faq"] for s in samples), 1)
+    }
+
+
+async def run(args) -> Dict:
+    agent = SEOContentAgent(model=args.model)
+    keywords = load_seozoom_csv(args.csv) if args.csv else []
+    results = {"single": [], "parallel": []}
+    for _ in range(args.runs):
+        for keyword in args.keywords:
+            # Modalità alternate, così eventuali variazioni del provider pesano su entrambe
+            for mode in ("single", "parallel"):
+                results[mode].append(await _measure(agent, keyword, keywords, mode == "parallel"))
+
+    single, parallel = _summary(results["single"]), _summary(results["parallel"])
+    single_tokens = single["prompt_tokens"] + single["completion_tokens"]
+    parallel_tokens = parallel["prompt_tokens"] + parallel["completion_tokens"]
+    return {
+        "single": single,
+        "parallel": parallel,
+        "speedup": round(single["mean_s"] / parallel["mean_s"], 2) if parallel["mean_s"] else None,
+        "token_ratio": round(parallel_tokens / single_tokens, 2) if single_tokens else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generazione singola vs parallela")
+    parser.add_argument("--keywords", nargs="+", default=DEFAULT_KEYWORDS)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--csv", default=str(DEFAULT_CSV), help="CSV SEOZoom ('' per nessuno)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Load test del backend web SEO Content Agent
+
+Avvia alcune generazioni in parallelo e, mentre sono in corso, misura la
+latenza di /api/health e /api/upload-csv. Con il lavoro bloccante fuori
+dall'event loop le due sonde devono restare veloci.
+
+Uso (con il server avviato sulla porta 8001):
+    python tools/loadtest.py --base-url http://localhost:8001 --generations 4
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+DEFAULT_CSV = Path(__file__).parent.parent / "data" / "esempio_seozoom.csv"
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+    return {
+        "n": len(ordered),
+        "p50_ms": round(pick(50), 1),
+        "p95_ms": round(pick(95), 1),
+        "max_ms": round(ordered[-1], 1)
+    }
+
+
+async def _upload(client: httpx.AsyncClient, csv_bytes: bytes) -> httpx.Response:
+    return await client.post(
+        "/api/upload-csv",
+        files={"file": ("loadtest.csv", csv_bytes, "text/csv")}
+    )
+
+
+async def _generate(client: httpx.AsyncClient, keyword: str, upload_id: str) -> float:
+    start = time.perf_counter()
+    await client.post("/api/generate", data={
+        "upload_id": upload_id,
+        "keyword": keyword,
+        "site_products": "Costume Intero Donna Bicolore\nCostume Intero Donna Annodato",
+        "selected_keywords": "[]"
+    })
+    return (time.perf_counter() - start) * 1000
+
+
+async def _probe(
+    client: httpx.AsyncClient,
+    csv_bytes: bytes,
+    stop: asyncio.Event,
+    interval: float,
+    samples: Dict[str, List[float]]
+) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/api/health")
+        samples["health"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await _upload(client, csv_bytes)
+        samples["upload"].append((time.perf_counter() - start) * 1000)
+
+        await asyncio.sleep(interval)
+
+
+async def run(base_url: str, csv_path: Path, generations: int, interval: float) -> int:
+    csv_bytes = csv_path.read_bytes()
+    samples: Dict[str, List[float]] = {"health": [], "upload": []}
+
+    timeout = httpx.Timeout(300.0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        response = await _upload(client, csv_bytes)
+        response.raise_for_status()
+        data = response.json()
+        keyword = data["analysis"]["main_keyword"]
+        upload_id = data["upload_id"]
+
+        # Latenza a riposo come riferimento
+        idle: Dict[str, List[float]] = {"health": [], "upload": []}
+        idle_stop = asyncio.Event()
+        idle_task = asyncio.create_task(_probe(client, csv_bytes, idle_stop, interval, idle))
+        await asyncio.sleep(2)
+        idle_stop.set()
+        await idle_task
+
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(_probe(client, csv_bytes, stop, interval, samples))
+        gen_times = await asyncio.gather(*(_generate(client, keyword, upload_id) for _ in range(generations)))
+        stop.set()
+        await probe_task
+
+    print(f"Generazioni parallele: {generations}")
+    print(f"  durata generazioni: {_summary(list(gen_times))}")
+    for name in ("health", "upload"):
+        print(f"/api/{name} a riposo:          {_summary(idle[name])}")
+        print(f"/api/{name} sotto carico:      {_summary(samples[name])}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test backend SEO Content Agent")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--csv", type=Path, default=DEFAULT_CSV)
+    parser.add_argument("--generations", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.2, help="Secondi tra due sonde")
+    args = parser.parse_args()
+    return asyncio.run(run(args.base_url, args.csv, args.generations, args.interval))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Server stub compatibile con le API OpenAI, per misurare il throughput offline
+
+Risponde a /v1/chat/completions e /v1/responses (entrambi anche in streaming)
+con un contenuto Markdown nel formato atteso dall'agente, dopo una latenza simulata
+(fissa più un costo per token generato). Riconosce i prompt della generazione
+parallela e restituisce schema o singola sezione invece della pagina completa.
+Può imporre un limite di richieste al minuto rispondendo 429 con Retry-After,
+come fa il provider reale, e simulare un provider degradato con una quota di
+risposte 503 (--error-rate). Simula anche la cache del prompt del provider:
+i prefissi già visti (blocchi da ~128 token, minimo 1024) sono riportati in
+cached_tokens e non pagano il costo di prefill (--ms-per-prompt-token).
+GET /stats restituisce i contatori.
+
+Uso:
+    python tools/openai_stub.py --port 8999 --latency 0.5 --ms-per-token 15 --rpm 120
+    OPENAI_BASE_URL=http://localhost:8999/v1 OPENAI_API_KEY=stub \\
+        python -m seo_agent.batch manifest.csv --no-serp --concurrency 8
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import itertools
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_CONTENT = """**Meta Title:** {keyword} | Offerte e Nuovi Arrivi
+**Meta Description:** Scopri la selezione di {keyword}: modelli per ogni esigenza, spedizione rapida e reso gratuito.
+
+---
+
+# {keyword}
+
+Introduzione alla categoria {keyword} con i criteri principali di scelta.
+
+## Come scegliere {keyword}
+
+Materiali, vestibilità e utilizzo: cosa valutare prima dell'acquisto.
+
+## I modelli più richiesti
+
+Una panoramica dei prodotti più venduti della categoria.
+
+## Domande Frequenti
+
+**Quale taglia scegliere?**
+Consulta la guida alle taglie presente in ogni scheda prodotto.
+
+**Quanto costa la spedizione?**
+La spedizione è gratuita sopra i 49 euro.
+
+---
+
+**SEO Keywords:** {keyword}, {keyword} online, {keyword} offerte
+"""
+
+
+CANNED_OUTLINE = """Meta Title: {keyword} - Modelli e Taglie
+Meta Description: Modelli di {keyword} per ogni esigenza, spedizione rapida e reso gratuito.
+H1: {keyword}
+H2: Come scegliere {keyword}
+H2: I modelli più richiesti
+H2: Materiali e vestibilità
+FAQ: Quale taglia scegliere?
+FAQ: Quanto costa la spedizione?
+SEO Keywords: {keyword}, {keyword} online, {keyword} offerte
+"""
+
+CANNED_SECTION = """Testo della sezione dedicata a {keyword}: criteri di scelta, modelli
+più richiesti e indicazioni pratiche sulla vestibilità, con riferimenti ai
+prodotti presenti in pagina e ai loro dettagli distintivi.
+"""
+
+CANNED_FAQ = """**Quale taglia scegliere?**
+Consulta la guida alle taglie presente in ogni scheda prodotto.
+
+**Quanto costa la spedizione?**
+La spedizione è gratuita sopra i 49 euro.
+"""
+
+KEYWORD_PATTERN = re.compile(r'categoria: \*\*(.+?)\*\*', re.IGNORECASE)
+
+# Cache del prompt come quella del provider: blocchi da 128 token (~512
+# caratteri), attiva solo da 1024 token di prefisso comune
+PREFIX_BLOCK_CHARS = 512
+PREFIX_MIN_CHARS = 4096
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _canned_content(prompt: str) -> str:
+    """Risposta adatta al tipo di prompt (schema, sezione, FAQ o pagina intera)"""
+    keyword = _keyword_from(prompt)
+    if "Prepara lo SCHEMA" in prompt:
+        return CANNED_OUTLINE.format(keyword=keyword)
+    if "## SCHEMA DELLA PAGINA" in prompt:
+        if "Rispondi a queste domande" in prompt:
+            return CANNED_FAQ
+        return CANNED_SECTION.format(keyword=keyword)
+    return CANNED_CONTENT.format(keyword=keyword)
+
+
+def _keyword_from(prompt: str) -> str:
+    """Keyword della richiesta, come la scrive build_user_prompt"""
+    match = KEYWORD_PATTERN.search(prompt)
+    return match.group(1).strip()[:60] if match else "Categoria"
+
+
+class StubState:
+    """Contatori e finestra delle richieste per il limite RPM"""
+
+    def __init__(
+        self,
+        latency: float,
+        jitter: float,
+        rpm: int,
+        ms_per_token: float = 0.0,
+        error_rate: float = 0.0,
+        ms_per_prompt_token: float = 0.0
+    ):
+        self.latency = latency
+        self.ms_per_prompt_token = ms_per_prompt_token
+        self.cached_tokens = 0
+        self._prefixes = set()
+        self.error_rate = error_rate
+        self.ms_per_token = ms_per_token
+        self.jitter = jitter
+        self.rpm = rpm
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started_at = time.time()
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def admit(self) -> float:
+        """0 se la richiesta è ammessa, altrimenti i secondi di Retry-After"""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if self.rpm:
+                while self._window and now - self._window[0] > 60:
+                    self._window.popleft()
+                if len(self._window) >= self.rpm:
+                    self.rate_limited += 1
+                    return 60 - (now - self._window[0])
+                self._window.append(now)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return 0.0
+
+    def cached_prefix(self, prompt: str) -> int:
+        """Token del prefisso già visto (0 sotto la soglia minima); registra i nuovi prefissi"""
+        ends = range(PREFIX_BLOCK_CHARS, len(prompt) + 1, PREFIX_BLOCK_CHARS)
+        digests = [(end, hash(prompt[:end])) for end in ends]
+        with self._lock:
+            cached = 0
+            for end, digest in digests:
+                if digest not in self._prefixes:
+                    break
+                cached = end
+            self._prefixes.update(digest for _, digest in digests)
+        return _estimate_tokens(prompt[:cached]) if cached >= PREFIX_MIN_CHARS else 0
+
+    def release(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "uptime_s": round(elapsed, 1)
+            }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.state.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        elif path.endswith("/responses"):
+            prompt = body.get("input") if isinstance(body.get("input"), str) \
+                else json.dumps(body.get("input"), ensure_ascii=False)
+            prompt = f"{body.get('instructions') or ''}\n{prompt}"
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        retry_after = self.state.admit()
+        if retry_after:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                {"Retry-After": f"{retry_after:.1f}"}
+            )
+            return
+        if random.random() < self.state.error_rate:
+            with self.state._lock:
+                self.state.in_flight -= 1
+                self.state.errors += 1
+            self._send_json(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+            return
+
+        content = _canned_content(prompt)
+        prompt_tokens = _estimate_tokens(prompt)
+        cached = self.state.cached_prefix(prompt)
+        usage = (prompt_tokens, _estimate_tokens(content), cached)
+        try:
+            delay = max(0.0, self.state.latency + random.uniform(-self.state.jitter, self.state.jitter))
+            delay += usage[1] * self.state.ms_per_token / 1000
+            prefill = (prompt_tokens - cached) * self.state.ms_per_prompt_token / 1000
+            if body.get("stream"):
+                if path.endswith("/chat/completions"):
+                    self._stream_chat(body, content, usage, delay, prefill)
+                else:
+                    self._stream_responses(body, content, usage, delay, prefill)
+                return
+            time.sleep(prefill + delay)
+            if path.endswith("/chat/completions"):
+                self._send_json(200, self._chat_body(body, content, usage))
+            else:
+                self._send_json(200, self._responses_body(body, content, usage))
+        finally:
+            self.state.release(*usage)
+
+    @staticmethod
+    def _usage(usage: tuple) -> dict:
+        return {
+            "prompt_tokens": usage[0],
+            "completion_tokens": usage[1],
+            "total_tokens": usage[0] + usage[1],
+            "prompt_tokens_details": {"cached_tokens": usage[2]}
+        }
+
+    def _chat_body(self, body: dict, content: str, usage: tuple) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": self._usage(usage)
+        }
+
+    def _responses_body(self, body: dict, content: str, usage: tuple) -> dict:
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", "stub"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": content, "annotations": []}]
+            }],
+            "usage": {
+                "input_tokens": usage[0],
+                "output_tokens": usage[1],
+                "total_tokens": usage[0] + usage[1],
+                "input_tokens_details": {"cached_tokens": usage[2]},
+                "output_tokens_details": {"reasoning_tokens": 0}
+            }
+        }
+
+    def _start_stream(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _stream_chat(self, body: dict, content: str, usage: tuple, delay: float, prefill: float = 0.0) -> None:
+        """
+        Risposta SSE: primo token dopo metà latenza più il prefill, il resto
+        distribuito sul tempo restante
+        """
+        self._start_stream()
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        time.sleep(prefill + delay / 2)
+
+        def send(payload: dict) -> None:
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for piece in pieces:
+            send({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            })
+            time.sleep(delay / 2 / len(pieces))
+        send({
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [],
+                "usage": self._usage(usage)
+            })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _stream_responses(self, body: dict, content: str, usage: tuple, delay: float, prefill: float = 0.0) -> None:
+        """
+        Come _stream_chat, con gli eventi della Responses API: il testo arriva
+        in response.output_text.delta, l'usage in response.completed
+        """
+        self._start_stream()
+
+        final = self._responses_body(body, content, usage)
+        item = final["output"][0]
+        part = {"item_id": item["id"], "output_index": 0, "content_index": 0}
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        sequence = itertools.count()
+        time.sleep(prefill + delay / 2)
+
+        def send(event: str, **payload) -> None:
+            payload = {"type": event, "sequence_number": next(sequence), **payload}
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send("response.created", response=dict(final, status="in_progress", output=[], usage=None))
+        send("response.output_item.added", output_index=0, item=dict(item, status="in_progress", content=[]))
+        send("response.content_part.added", **part, part={"type": "output_text", "text": "", "annotations": []})
+        for piece in pieces:
+            send("response.output_text.delta", **part, delta=piece, logprobs=[])
+            time.sleep(delay / 2 / len(pieces))
+        send("response.output_text.done", **part, text=content, logprobs=[])
+        send("response.content_part.done", **part, part=item["content"][0])
+        send("response.output_item.done", output_index=0, item=item)
+        send("response.completed", response=final)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server stub compatibile OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latency", type=float, default=1.0, help="Latenza media per risposta (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variazione casuale della latenza (s)")
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="Millisecondi per token generato")
+    parser.add_argument("--rpm", type=int, default=0, help="Richieste al minuto prima del 429 (0 = nessun limite)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Frazione di risposte 503 (0-1)")
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.0,
+                        help="Millisecondi di prefill per token del prompt non in cache")
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(
+        latency=args.latency, jitter=args.jitter, rpm=args.rpm, ms_per_token=args.ms_per_token,
+        error_rate=args.error_rate,
+        ms_per_prompt_token=args.ms_per_prompt_token
+    )
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"🧪 Stub OpenAI su http://{args.host}:{args.port}/v1 (latenza {args.latency}s, rpm {args.rpm or '∞'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(StubHandler.state.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,28 +5,66 @@ FastAPI backend with modern enterprise UI
 
 import os
 import sys
-import tempfile
+import json
+import math
+import logging
+import base64
+import asyncio
+from dataclasses import asdict
 from pathlib import Path
-from typing import Optional
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from itsdangerous import BadSignature, TimestampSigner
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 load_dotenv()
 
-from seo_agent.agent import SEOContentAgent, CategoryInput
+from seo_agent.agent import CategoryInput
+from seo_agent.registry import registry
+from seo_agent.utils.llm_cache import LLMCache, default_cache
+from seo_agent.utils.hedging import default_hedge_policy
+from seo_agent.utils.resilience import ProviderUnavailable, default_resilience, estimate_tokens
+from seo_agent.utils.deadline import DeadlineExceeded, new_deadline
+from seo_agent.utils.cancellation import (
+    DISCONNECT, JOB, GenerationProgress, default_cancellation_stats
+)
+from seo_agent.utils.idempotency import IdempotencyConflict, default_idempotency_store, request_key
+from seo_agent.utils.scheduler import (
+    ANONYMOUS, BATCH, INTERACTIVE, current_owner, default_scheduler, set_work_owner
+)
+from seo_agent.utils.usage_ledger import BudgetExceeded, default_ledger, set_usage_context
+from seo_agent.utils.markdown_parser import MarkdownOutputParser
+from seo_agent.utils.sections import find_target, outline, replace_lines, section_text
+from seo_agent.utils.scoring import score_content, validate_content
+from seo_agent.utils.usage import TokenUsage, usage_from_response
 from seo_agent.utils.csv_loader import (
-    load_seozoom_csv,
+    parse_seozoom_csv,
     get_top_keywords,
     get_keyword_clusters
 )
-from seo_agent.utils.product_scraper import scrape_products
+from seo_agent.utils.product_scraper import scrape_products_async
+from seo_agent.utils.concurrency import run_blocking, shutdown_executor
+from seo_agent.utils.upload_store import UploadStore
+from seo_agent.utils.job_queue import JobQueue, QUEUED, RUNNING
+from seo_agent.utils.bulk_scraper import BulkScraper, DomainPolicy, parse_url_list
+from seo_agent.utils.metrics import CONTENT_TYPE, REGISTRY, http_metrics_middleware
+from seo_agent.utils.logs import configure_logging
+from seo_agent.utils.tracing import (
+    configure_tracing, current_traceparent, parse_traceparent, start_span, tracing_middleware
+)
+
+configure_logging("seo_agent")
+configure_tracing("seo_agent")
+logger = logging.getLogger("seo_agent.web")
 
 app = FastAPI(title="SEO Content Agent", version="1.0.0")
+app.middleware("http")(http_metrics_middleware())
+# Registrato per ultimo: è il più esterno, lo span copre anche gli altri middleware
+app.middleware("http")(tracing_middleware())
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,58 +78,109 @@ static_path = Path(__file__).parent / "static"
 static_path.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
 
-uploaded_csv_path: Optional[str] = None
+# Upload per sessione, condivisi tra i worker tramite la directory su disco
+upload_store = UploadStore()
+
+# Generazioni in background, stato persistente su SQLite
+job_queue = JobQueue(concurrency=int(os.getenv("SEO_AGENT_JOB_WORKERS", "2")))
+
+
+# Sessione dell'app Login: gira sullo stesso host (porta diversa), quindi il
+# suo cookie firmato arriva anche qui e identifica l'utente per lo scheduler
+SESSION_SECRET = os.getenv("STRATEGO_SESSION_SECRET", "stratego-swiss-knife-secret-2024")
+SESSION_COOKIE = "session"
+SESSION_MAX_AGE = 14 * 24 * 3600
+
+
+def _session_user(request: Request) -> str:
+    """Utente autenticato nell'app Login, o anonymous se manca una sessione valida"""
+    cookie = request.cookies.get(SESSION_COOKIE)
+    if not cookie:
+        return ANONYMOUS
+    try:
+        data = TimestampSigner(SESSION_SECRET).unsign(cookie.encode("utf-8"), max_age=SESSION_MAX_AGE)
+        return json.loads(base64.b64decode(data)).get("user") or ANONYMOUS
+    except (BadSignature, ValueError):
+        return ANONYMOUS
+
+
+@app.on_event("startup")
+async def startup():
+    await run_blocking(upload_store.cleanup, force=True)
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    await registry.aclose_loop_clients()
+    registry.clear()
+    shutdown_executor()
 
 
 @app.get("/", response_class=HTMLResponse)
 async def home():
     html_path = Path(__file__).parent / "templates" / "index.html"
-    return HTMLResponse(content=html_path.read_text(encoding="utf-8"))
+    html = html_path.read_text(encoding="utf-8")
+    traceparent = current_traceparent()
+    if traceparent:
+        # La pagina rimanda il traceparent nelle chiamate API: stessa traccia dal Login alla generazione
+        html = html.replace("<head>", f'<head>\n    <meta name="traceparent" content="{traceparent}">', 1)
+    return HTMLResponse(content=html)
+
+
+def _parse_upload(content: bytes) -> list:
+    # utf-8-sig rimuove automaticamente il BOM
+    return parse_seozoom_csv(content.decode('utf-8-sig', errors='replace'))
+
+
+def _analyze_keywords(keywords: list) -> dict:
+    """Analisi delle keyword caricate (CPU-bound, eseguita nel pool di thread)"""
+    top_kws = get_top_keywords(keywords, limit=10)
+    clusters = get_keyword_clusters(keywords)
+    main_kw = max(keywords, key=lambda k: k.volume)
+    total_vol = sum(k.volume for k in keywords)
+    
+    return {
+        "total_keywords": len(keywords),
+        "main_keyword": main_kw.keyword,
+        "total_volume": total_vol,
+        "top_keywords": [
+            {
+                "keyword": k.keyword,
+                "volume": k.volume,
+                "difficulty": k.keyword_difficulty,
+                "opportunity": k.keyword_opportunity
+            }
+            for k in top_kws
+        ],
+        "clusters": {
+            name: [{"keyword": k.keyword, "volume": k.volume} for k in kws[:5]]
+            for name, kws in clusters.items()
+        }
+    }
 
 
 @app.post("/api/upload-csv")
 async def upload_csv(file: UploadFile = File(...)):
-    global uploaded_csv_path
-    
     if not file.filename.endswith('.csv'):
         raise HTTPException(400, "File must be a CSV")
     
-    with tempfile.NamedTemporaryFile(mode='wb', suffix='.csv', delete=False) as f:
-        content = await file.read()
-        f.write(content)
-        uploaded_csv_path = f.name
+    content = await file.read()
     
     try:
-        keywords = load_seozoom_csv(uploaded_csv_path)
+        keywords = await run_blocking(_parse_upload, content)
         if not keywords:
             raise HTTPException(400, "No keywords found")
         
-        top_kws = get_top_keywords(keywords, limit=10)
-        clusters = get_keyword_clusters(keywords)
-        main_kw = max(keywords, key=lambda k: k.volume)
-        total_vol = sum(k.volume for k in keywords)
+        upload_id = await run_blocking(upload_store.put, keywords, file.filename)
+        analysis = await run_blocking(_analyze_keywords, keywords)
         
         return {
             "success": True,
+            "upload_id": upload_id,
             "filename": file.filename,
-            "analysis": {
-                "total_keywords": len(keywords),
-                "main_keyword": main_kw.keyword,
-                "total_volume": total_vol,
-                "top_keywords": [
-                    {
-                        "keyword": k.keyword,
-                        "volume": k.volume,
-                        "difficulty": k.keyword_difficulty,
-                        "opportunity": k.keyword_opportunity
-                    }
-                    for k in top_kws
-                ],
-                "clusters": {
-                    name: [{"keyword": k.keyword, "volume": k.volume} for k in kws[:5]]
-                    for name, kws in clusters.items()
-                }
-            }
+            "analysis": analysis
         }
     except HTTPException:
         raise
@@ -99,111 +188,584 @@ async def upload_csv(file: UploadFile = File(...)):
         raise HTTPException(500, str(e))
 
 
+def _sse(event: str, data) -> str:
+    """Formatta un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Intervallo dei commenti keep-alive SSE e del controllo disconnessione delle risposte non in stream
+SSE_KEEPALIVE_S = 15
+DISCONNECT_POLL_S = 1.0
+
+
+async def _cancellable_sse(events):
+    """
+    Inoltra uno stream SSE prodotto in un task separato. Se il client si
+    disconnette lo stream viene chiuso e il task cancellato subito: ricerche
+    SERP, scraping dei prodotti e stream del modello si interrompono invece
+    di completare una risposta che nessuno leggerà (se nessun duplicato è
+    agganciato alla stessa esecuzione). Nelle pause invia un commento
+    keep-alive, così anche i proxy non chiudono la connessione.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def produce():
+        try:
+            async for chunk in events:
+                queue.put_nowait(chunk)
+        finally:
+            queue.put_nowait(None)
+    
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if chunk is None:
+                break
+            yield chunk
+        await task
+    finally:
+        task.cancel()
+
+
+async def _cancel_on_disconnect(request: Request, coro):
+    """Attende coro cancellandola se il client si disconnette prima della risposta"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                # 499: convenzione nginx per "client closed request", la risposta non verrà letta
+                raise HTTPException(499, "Client disconnected")
+    finally:
+        task.cancel()
+
+
+def _idempotency_key(scope: str, payload: dict, explicit: str) -> tuple:
+    """
+    Chiave di idempotenza della richiesta e finestra in cui il risultato
+    resta disponibile. Con la chiave inviata dal client (la pagina ne crea
+    una a ogni clic) vale la finestra dello store; la chiave derivata dal
+    contenuto aggancia solo le esecuzioni in corso (finestra 0), così una
+    richiesta identica fatta di proposito produce una nuova variante.
+    Con use_cache=false il client chiede una nuova generazione: senza
+    chiave esplicita non si deduplica.
+    """
+    explicit = explicit.strip()
+    window = None if explicit else 0
+    if not explicit and not payload.get("use_cache", True):
+        explicit = os.urandom(16).hex()
+    try:
+        key, fingerprint = request_key(scope, payload, explicit)
+        return key, fingerprint, default_idempotency_store().role(key, fingerprint), window
+    except IdempotencyConflict as e:
+        raise HTTPException(422, str(e))
+
+
+def _is_error_event(chunk: str) -> bool:
+    return chunk.startswith("event: error")
+
+
+def _parse_products(site_products: str) -> list:
+    # Parse products (uno per riga o separati da virgola)
+    products = [
+        p.strip() 
+        for p in site_products.replace(',', '\n').split('\n') 
+        if p.strip()
+    ]
+    
+    # Log dei prodotti ricevuti
+    logger.info(f"📦 Prodotti ricevuti: {len(products)}", extra={"products": [p[:50] for p in products[:5]]})
+    return products
+
+
+def _parse_serp_keywords(selected_keywords: str) -> list:
+    # Parse selected keywords for SERP scraping
+    try:
+        return json.loads(selected_keywords)
+    except:
+        return []
+
+
+def _output_to_response(result) -> dict:
+    return {
+        "success": True,
+        "content": result.content,
+        "meta_title": result.meta_title,
+        "meta_description": result.meta_description,
+        "h1": result.h1,
+        "sections": result.sections,
+        "faq": result.faq,
+        "seo_keywords": result.seo_keywords,
+        "serp_analyzed": len(result.serp_data) if result.serp_data else 0,
+        "serp_results": result.serp_data if result.serp_data else [],
+        "cache_hit": result.cache_hit,
+        "usage": asdict(result.usage),
+        "quality": result.quality,
+        "timings": result.timings,
+        "degradations": result.degradations
+    }
+
+
+# Candidati massimi per richiesta in modalità multi-candidato
+MAX_CANDIDATES = 5
+# Budget di latenza massimo richiedibile (0 = default SEO_AGENT_REQUEST_BUDGET)
+MAX_BUDGET_S = 600
+
+
+async def _generation_params(
+    keyword: str,
+    site_products: str,
+    parent_url: str,
+    parent_name: str,
+    selected_keywords: str,
+    upload_id: str,
+    use_cache: bool = True,
+    parallel: bool = False,
+    candidates: int = 1,
+    repair: bool = False,
+    products_url: str = "",
+    budget_s: float = 0
+) -> dict:
+    """Valida la richiesta di generazione e la converte in parametri serializzabili"""
+    if not upload_id or not await run_blocking(upload_store.get, upload_id):
+        raise HTTPException(400, "Upload a CSV file first")
+    
+    products_url = products_url.strip()
+    if products_url and not products_url.startswith(('http://', 'https://')):
+        raise HTTPException(400, "URL pagina prodotti non valido")
+    
+    if not os.getenv("OPENAI_API_KEY"):
+        raise HTTPException(500, "OpenAI API key not configured")
+    
+    return {
+        "keyword": keyword,
+        "products": _parse_products(site_products),
+        "parent_url": parent_url.strip(),
+        "parent_name": parent_name.strip(),
+        "serp_keywords": _parse_serp_keywords(selected_keywords),
+        "upload_id": upload_id,
+        "use_cache": use_cache,
+        "parallel": parallel,
+        "candidates": max(1, min(MAX_CANDIDATES, candidates)),
+        "repair": repair,
+        "products_url": products_url,
+        "budget_s": max(0.0, min(MAX_BUDGET_S, budget_s))
+    }
+
+
+GENERATE_MODEL = "gpt-4o-mini"
+
+
+async def _budget_model(model: str) -> str:
+    """
+    Modello da usare per l'utente e l'app correnti secondo i budget giornalieri
+    (il modello economico se superati e l'azione è downgrade).
+
+    Raises:
+        BudgetExceeded: budget superato e azione reject
+    """
+    ledger = default_ledger()
+    if ledger is None:
+        return model
+    return await run_blocking(ledger.enforce, model)
+
+
+async def _generation_inputs(params: dict) -> tuple:
+    """Agente, input categoria e keyword caricate per una richiesta di generazione"""
+    keywords = await run_blocking(upload_store.get, params["upload_id"])
+    if not keywords:
+        raise ValueError("Upload scaduto: ricarica il file CSV")
+    
+    agent = registry.get_agent(
+        api_key=os.getenv("OPENAI_API_KEY"), model=await _budget_model(GENERATE_MODEL)
+    )
+    
+    category_input = CategoryInput(
+        keyword=params["keyword"],
+        site_products=params["products"],
+        parent_url=params["parent_url"],
+        parent_name=params["parent_name"],
+        products_url=params.get("products_url", "")
+    )
+    return agent, category_input, keywords
+
+
+async def _run_generation(params: dict, on_stage=None) -> dict:
+    """Esegue la pipeline di generazione e restituisce la risposta API"""
+    agent, category_input, keywords = await _generation_inputs(params)
+    
+    # Genera contenuto con scraping SERP per le keyword selezionate
+    with registry.track(agent):
+        result = await agent.agenerate_category_content(
+            csv_path=None,
+            category_input=category_input,
+            scrape_serp_results=True,
+            serp_keywords=params["serp_keywords"] or None,
+            keywords=keywords,
+            on_stage=on_stage,
+            use_cache=params.get("use_cache", True),
+            parallel=params.get("parallel", False),
+            candidates=params.get("candidates", 1),
+            repair=params.get("repair", False),
+            deadline=new_deadline(params.get("budget_s"))
+        )
+    
+    return _output_to_response(result)
+
+
+def _generation_progress(params: dict, stage: str = "") -> GenerationProgress:
+    return GenerationProgress(stage=stage or "", calls=params.get("candidates", 1))
+
+
+async def _generate_for_client(params: dict) -> dict:
+    """Generazione di una richiesta HTTP: se viene cancellata il client se n'è andato"""
+    progress = _generation_progress(params)
+    try:
+        return await _run_generation(params, progress.enter)
+    except asyncio.CancelledError:
+        default_cancellation_stats().record(DISCONNECT, progress)
+        raise
+
+
+async def _stream_generation(params: dict):
+    """Pipeline di generazione come stream SSE (token e campi completati)"""
+    progress = _generation_progress(params)
+    try:
+        agent, category_input, keywords = await _generation_inputs(params)
+        with registry.track(agent):
+            async for event in agent.astream_category_content(
+                csv_path=None,
+                category_input=category_input,
+                scrape_serp_results=True,
+                serp_keywords=params["serp_keywords"] or None,
+                keywords=keywords,
+                use_cache=params.get("use_cache", True),
+                parallel=params.get("parallel", False),
+                candidates=params.get("candidates", 1),
+                repair=params.get("repair", False),
+                deadline=new_deadline(params.get("budget_s"))
+            ):
+                name = event.pop("event")
+                progress.update(name, event)
+                if name == "done":
+                    yield _sse("done", _output_to_response(event["output"]))
+                else:
+                    yield _sse(name, event)
+    except asyncio.CancelledError:
+        default_cancellation_stats().record(DISCONNECT, progress)
+        raise
+    except (ProviderUnavailable, BudgetExceeded) as e:
+        yield _sse("error", _unavailable_event(e))
+    except DeadlineExceeded as e:
+        yield _sse("error", {"error": str(e), "status": 504})
+    except Exception as e:
+        logger.exception(f"❌ Errore generazione: {e}")
+        yield _sse("error", {"error": str(e)})
+
+
+def _job_cancelled(params: dict, stage: str) -> None:
+    default_cancellation_stats().record(JOB, _generation_progress(params, stage))
+
+
+async def _run_generation_job(params: dict, on_stage) -> dict:
+    """Job di generazione: lavoro batch dell'utente che l'ha inviato"""
+    set_work_owner(params.get("user"), BATCH)
+    set_usage_context("jobs")
+    with start_span("job generate", parent=parse_traceparent(params.get("traceparent"))):
+        return await _run_generation(params, on_stage)
+
+
+job_queue.register("generate", _run_generation_job)
+job_queue.on_cancel = _job_cancelled
+
+
+def _unavailable(e) -> HTTPException:
+    """
+    Quota esaurita (429), provider degradato (503) o budget giornaliero
+    superato (429), con Retry-After invece di un 500
+    """
+    return HTTPException(
+        e.status_code, str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+
+def _unavailable_event(e) -> dict:
+    return {"error": str(e), "status": e.status_code, "retry_after": math.ceil(e.retry_after)}
+
+
 @app.post("/api/generate")
 async def generate_content(
+    request: Request,
+    response: Response,
     keyword: str = Form(...),
     site_products: str = Form(""),
     parent_url: str = Form(""),
     parent_name: str = Form(""),
-    selected_keywords: str = Form("[]")
+    selected_keywords: str = Form("[]"),
+    upload_id: str = Form(""),
+    stream: bool = Form(False),
+    use_cache: bool = Form(True),
+    parallel: bool = Form(False),
+    candidates: int = Form(1),
+    repair: bool = Form(False),
+    products_url: str = Form(""),
+    budget_s: float = Form(0),
+    idempotency_key: str = Header("")
 ):
-    global uploaded_csv_path
-    
-    import json
-    
-    if not uploaded_csv_path or not Path(uploaded_csv_path).exists():
-        raise HTTPException(400, "Upload a CSV file first")
+    """
+    Genera il contenuto di una categoria. Le richieste con la stessa
+    Idempotency-Key si agganciano alla generazione in corso o ricevono il
+    risultato salvato; senza chiave, quelle con lo stesso contenuto si
+    agganciano solo a una generazione in corso. L'header di risposta
+    Idempotency-Status indica original, attached o replayed.
+    """
+    set_work_owner(_session_user(request), INTERACTIVE)
+    set_usage_context("generate")
+    params = await _generation_params(
+        keyword, site_products, parent_url, parent_name, selected_keywords, upload_id,
+        use_cache, parallel, candidates, repair, products_url, budget_s
+    )
+    store = default_idempotency_store()
+    key, fingerprint, role, window = _idempotency_key(
+        "generate:stream" if stream else "generate", params, idempotency_key
+    )
     
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise HTTPException(500, "OpenAI API key not configured")
+    if stream:
+        return StreamingResponse(
+            _cancellable_sse(store.stream(
+                key, fingerprint, lambda: _stream_generation(params), failed=_is_error_event, window=window
+            )),
+            media_type="text/event-stream",
+            headers={**SSE_HEADERS, "Idempotency-Status": role}
+        )
     
+    response.headers["Idempotency-Status"] = role
     try:
-        # Parse products (uno per riga o separati da virgola)
-        products = [
-            p.strip() 
-            for p in site_products.replace(',', '\n').split('\n') 
-            if p.strip()
-        ]
-        
-        # Log dei prodotti ricevuti
-        print(f"📦 Prodotti ricevuti: {len(products)}")
-        for i, p in enumerate(products[:5], 1):
-            print(f"   {i}. {p[:50]}...")
-        if len(products) > 5:
-            print(f"   ... e altri {len(products) - 5} prodotti")
-        
-        # Parse selected keywords for SERP scraping
-        try:
-            serp_keywords = json.loads(selected_keywords)
-        except:
-            serp_keywords = []
-        
-        agent = SEOContentAgent(api_key=api_key)
-        
-        category_input = CategoryInput(
-            keyword=keyword,
-            site_products=products,
-            parent_url=parent_url.strip(),
-            parent_name=parent_name.strip()
+        return await _cancel_on_disconnect(
+            request, store.call(key, fingerprint, lambda: _generate_for_client(params), window=window)
         )
-        
-        # Genera contenuto con scraping SERP per le keyword selezionate
-        result = agent.generate_category_content(
-            csv_path=uploaded_csv_path,
-            category_input=category_input,
-            scrape_serp_results=True,
-            serp_keywords=serp_keywords if serp_keywords else None
-        )
-        
-        return {
-            "success": True,
-            "content": result.content,
-            "meta_title": result.meta_title,
-            "meta_description": result.meta_description,
-            "h1": result.h1,
-            "sections": result.sections,
-            "faq": result.faq,
-            "seo_keywords": result.seo_keywords,
-            "serp_analyzed": len(result.serp_data) if result.serp_data else 0,
-            "serp_results": result.serp_data if result.serp_data else []
-        }
+    except HTTPException:
+        raise
+    except (ProviderUnavailable, BudgetExceeded) as e:
+        raise _unavailable(e)
+    except DeadlineExceeded as e:
+        raise HTTPException(504, str(e))
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Errore generazione: {e}")
         raise HTTPException(500, str(e))
 
 
+@app.post("/api/jobs", status_code=202)
+async def submit_generation_job(
+    request: Request,
+    keyword: str = Form(...),
+    site_products: str = Form(""),
+    parent_url: str = Form(""),
+    parent_name: str = Form(""),
+    selected_keywords: str = Form("[]"),
+    upload_id: str = Form(""),
+    use_cache: bool = Form(True),
+    parallel: bool = Form(False),
+    candidates: int = Form(1),
+    repair: bool = Form(False),
+    products_url: str = Form(""),
+    budget_s: float = Form(0)
+):
+    """
+    Mette in coda una generazione e restituisce subito il job ID.
+    Il progresso è consultabile su /api/jobs/{job_id} o in SSE su /api/jobs/{job_id}/events.
+    Il job gira con priorità batch a nome dell'utente della sessione.
+    """
+    params = await _generation_params(
+        keyword, site_products, parent_url, parent_name, selected_keywords, upload_id,
+        use_cache, parallel, candidates, repair, products_url, budget_s
+    )
+    params["user"] = _session_user(request)
+    # Il job gira più tardi in un worker: resta nella traccia della richiesta che l'ha inviato
+    params["traceparent"] = current_traceparent()
+    job_id = await run_blocking(job_queue.submit, "generate", params)
+    return {"success": True, "job_id": job_id, "status": "queued"}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Stato, fasi completate e (se concluso) risultato di un job"""
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(404, "Job non trovato")
+    return job
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Annulla un job in coda o in esecuzione. Un job in esecuzione viene
+    fermato dal suo worker al polling successivo (anche in un altro processo).
+    """
+    previous = await run_blocking(job_queue.cancel, job_id)
+    if previous is None:
+        raise HTTPException(404, "Job non trovato")
+    if previous not in (QUEUED, RUNNING):
+        raise HTTPException(409, f"Job già concluso ({previous})")
+    if previous == QUEUED:
+        # Mai avviato: nessun worker lo vedrà, si conta qui
+        default_cancellation_stats().record(JOB, GenerationProgress())
+    return {"success": True, "job_id": job_id, "status": "cancelled"}
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream SSE del progresso di un job: un evento "stage" per ogni fase
+    (csv, serp, llm, parse) e un evento finale "done", "error" o "cancelled".
+    """
+    if await run_blocking(job_queue.get, job_id) is None:
+        raise HTTPException(404, "Job non trovato")
+    
+    async def event_stream():
+        last_stage = None
+        while True:
+            job = await run_blocking(job_queue.get, job_id)
+            if job is None:
+                # Eliminato nel frattempo (retention)
+                yield _sse("error", {"error": "Job non trovato"})
+                return
+            if job["stage"] != last_stage:
+                last_stage = job["stage"]
+                yield _sse("stage", {"stage": last_stage, "stages": job["stages"]})
+            if job["status"] == "done":
+                yield _sse("done", {"job_id": job_id})
+                return
+            if job["status"] == "failed":
+                yield _sse("error", {"error": job["error"]})
+                return
+            if job["status"] == "cancelled":
+                yield _sse("cancelled", {"job_id": job_id})
+                return
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/api/validate")
+async def validate_endpoint(
+    content: str = Form(...),
+    keyword: str = Form(...),
+    site_products: str = Form(""),
+    parent_url: str = Form("")
+):
+    """
+    Controllo locale (nessuna chiamata al modello) del contenuto rispetto
+    alle regole del system prompt: punteggio e violazioni per campo.
+    """
+    products = _parse_products(site_products)
+    violations, score = await asyncio.gather(
+        run_blocking(validate_content, content, keyword, products, parent_url.strip()),
+        run_blocking(score_content, content, keyword, products, None, parent_url.strip())
+    )
+    return {
+        "success": True,
+        "score": score.score,
+        "products_cited": score.products_cited,
+        "violations": [asdict(v) for v in violations]
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metriche per fase, cache e richieste HTTP nel formato di Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/api/health")
 async def health():
     return {"status": "ok", "api_key": bool(os.getenv("OPENAI_API_KEY"))}
 
 
-@app.post("/api/iterate")
-async def iterate_content(
-    current_content: str = Form(...),
-    instruction: str = Form(...)
-):
+@app.get("/api/hedge/stats")
+async def hedge_stats():
+    """Richieste di riserva lanciate e vinte e secondi risparmiati stimati"""
+    policy = default_hedge_policy()
+    if policy is None:
+        return {"enabled": False}
+    return {"enabled": True, "hedge_model": policy.hedge_model, **policy.stats()}
+
+
+@app.get("/api/resilience/stats")
+async def resilience_stats():
+    """Retry, 429 ricevuti, chiamate rifiutate e stato del circuit breaker"""
+    return await run_blocking(default_resilience().stats)
+
+
+@app.get("/api/prompt-cache/stats")
+async def prompt_cache_stats():
     """
-    Itera sul contenuto esistente applicando le modifiche richieste.
-    Prende il contenuto attuale e un'istruzione, restituisce il contenuto modificato.
+    Cache del prompt lato provider: quota dei token del prompt serviti dalla
+    cache e latenza risparmiata stimata (chiamate complete e tempo al primo token)
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise HTTPException(500, "OpenAI API key not configured")
-    
-    if not current_content.strip():
-        raise HTTPException(400, "Contenuto vuoto")
-    
-    if not instruction.strip():
-        raise HTTPException(400, "Istruzione vuota")
-    
-    try:
-        from openai import OpenAI
-        
-        client = OpenAI(api_key=api_key)
-        
-        system_prompt = """Sei un esperto SEO copywriter. 
+    return default_resilience().prompt_cache.stats()
+
+
+@app.get("/api/cancellations/stats")
+async def cancellations_stats():
+    """Generazioni annullate (client disconnesso o job annullato) e token risparmiati stimati"""
+    return default_cancellation_stats().stats()
+
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    """Slot occupati e, per utente, code in attesa (interattive/batch) e tempi di attesa"""
+    scheduler = default_scheduler()
+    if scheduler is None:
+        return {"enabled": False}
+    return {"enabled": True, **scheduler.stats()}
+
+
+@app.get("/api/idempotency/stats")
+async def idempotency_stats():
+    """Richieste di generazione/iterazione deduplicate (agganciate o servite dal risultato salvato)"""
+    return default_idempotency_store().stats()
+
+
+@app.get("/api/usage/stats")
+async def usage_stats(request: Request, group_by: str = "day,user", days: int = 7):
+    """
+    Consumi di token dal registro: totali degli ultimi giorni raggruppati
+    (day, user, app, model), categorie più costose e budget di oggi
+    dell'utente della sessione
+    """
+    ledger = default_ledger()
+    if ledger is None:
+        return {"enabled": False}
+    keys = [key.strip() for key in group_by.split(",") if key.strip()]
+    return {
+        "enabled": True,
+        "rollup": await run_blocking(ledger.rollup, keys, days),
+        "top_categories": await run_blocking(ledger.top_categories, days),
+        "budget": await run_blocking(ledger.budget_status, _session_user(request) or ANONYMOUS)
+    }
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit rate e token risparmiati dalla cache LLM di questo processo"""
+    llm_cache = default_cache()
+    if llm_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_cache.stats()}
+
+
+ITERATE_SYSTEM_PROMPT = """Sei un esperto SEO copywriter. 
 Il tuo compito è modificare il contenuto SEO esistente seguendo le istruzioni dell'utente.
 
 REGOLE:
@@ -213,7 +775,26 @@ REGOLE:
 - Non aggiungere o rimuovere sezioni a meno che non sia esplicitamente richiesto
 - Restituisci il contenuto completo modificato in formato Markdown"""
 
-        user_prompt = f"""## CONTENUTO ATTUALE:
+
+ITERATE_SECTION_SYSTEM_PROMPT = """Sei un esperto SEO copywriter.
+Il tuo compito è modificare UNA sezione di un contenuto SEO esistente seguendo le istruzioni dell'utente.
+
+REGOLE:
+- Ricevi solo la sezione da modificare, con la struttura della pagina come contesto
+- Mantieni la formattazione Markdown della sezione (intestazione, grassetti, link)
+- Applica SOLO le modifiche richieste
+- Mantieni il tono professionale e SEO-oriented
+- Restituisci SOLO la sezione modificata, senza commenti e senza il resto della pagina"""
+
+
+ITERATE_MODEL = "gpt-4o-mini"
+ITERATE_PARAMS = {"temperature": 0.7, "max_tokens": 2000}
+# Token minimi per la risposta di una singola sezione
+ITERATE_SECTION_MIN_TOKENS = 512
+
+
+def _iteration_messages(current_content: str, instruction: str) -> list:
+    user_prompt = f"""## CONTENUTO ATTUALE:
 {current_content}
 
 ## ISTRUZIONE DI MODIFICA:
@@ -221,46 +802,304 @@ REGOLE:
 
 ---
 Applica la modifica richiesta e restituisci il contenuto completo aggiornato."""
+    
+    return [
+        {"role": "system", "content": ITERATE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _section_messages(current_content: str, target_text: str, keys: str, instruction: str) -> list:
+    user_prompt = f"""## STRUTTURA DELLA PAGINA:
+{outline(current_content)}
+
+## SEZIONE DA MODIFICARE ({keys}):
+{target_text}
+
+## ISTRUZIONE DI MODIFICA:
+{instruction}
+
+---
+Applica la modifica richiesta e restituisci solo la sezione aggiornata."""
+    
+    return [
+        {"role": "system", "content": ITERATE_SECTION_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
 
-        print(f"🔄 Iterazione richiesta: {instruction[:50]}...")
+
+def _iteration_plan(current_content: str, instruction: str, section: str = "") -> dict:
+    """
+    Decide cosa inviare al modello: solo la sezione interessata dall'istruzione
+    (con max_tokens proporzionato) oppure, se non localizzabile, tutto il documento.
+    """
+    target = find_target(current_content, instruction, section)
+    if target is None:
+        return {
+            "section": "full",
+            "messages": _iteration_messages(current_content, instruction),
+            "params": ITERATE_PARAMS
+        }
+    
+    start, end, keys = target
+    target_text = section_text(current_content, start, end)
+    # ~4 caratteri per token; margine per le modifiche che allungano il testo
+    max_tokens = max(ITERATE_SECTION_MIN_TOKENS, len(target_text) // 2 + 200)
+    return {
+        "section": keys,
+        "start": start,
+        "end": end,
+        "messages": _section_messages(current_content, target_text, keys, instruction),
+        "params": dict(ITERATE_PARAMS, max_tokens=min(ITERATE_PARAMS["max_tokens"], max_tokens))
+    }
+
+
+def _apply_iteration(plan: dict, current_content: str, raw_content: str) -> str:
+    """Reinserisce la sezione modificata nel documento (o restituisce il documento intero)"""
+    new_content = _strip_code_fences(raw_content)
+    if plan["section"] == "full":
+        return new_content
+    return replace_lines(current_content, plan["start"], plan["end"], new_content)
+
+
+def _strip_code_fences(content: str) -> str:
+    # Pulisci eventuali code blocks markdown
+    content = content.strip()
+    if content.startswith("```"):
+        lines = content.split("\n")
+        if lines[0].startswith("```"):
+            lines = lines[1:]
+        if lines[-1].strip() == "```":
+            lines = lines[:-1]
+        content = "\n".join(lines)
+    return content
+
+
+def _iteration_estimate(plan: dict) -> int:
+    """Token stimati della chiamata, prenotati sul rate limiter"""
+    return estimate_tokens(
+        *(message["content"] for message in plan["messages"]),
+        completion=plan["params"]["max_tokens"]
+    )
+
+
+def _iteration_cache_key(plan: dict):
+    llm_cache = default_cache()
+    if llm_cache is None:
+        return None, None
+    messages = plan["messages"]
+    return llm_cache, LLMCache.make_key(
+        plan["model"], messages[0]["content"], messages[1]["content"], **plan["params"]
+    )
+
+
+async def _stream_iteration(client, plan: dict, current_content: str, instruction: str, use_cache: bool):
+    """
+    Iterazione come stream SSE: token e campi completati, poi il contenuto finale.
+    Per una modifica mirata l'evento "target" invia prima il testo che precede
+    e segue la sezione, così il client può mostrare la pagina completa.
+    """
+    progress = GenerationProgress(stage="llm", completion_tokens=plan["params"]["max_tokens"])
+    try:
+        tracker = MarkdownOutputParser()
+        chunks = []
+        if plan["section"] != "full":
+            lines = current_content.split("\n")
+            yield _sse("target", {
+                "section": plan["section"],
+                "before": "\n".join(lines[:plan["start"]]),
+                "after": "\n".join(lines[plan["end"]:])
+            })
+        llm_cache, cache_key = _iteration_cache_key(plan)
+        cached = await run_blocking(llm_cache.get, cache_key) if cache_key and use_cache else None
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
+        if cached:
+            progress.enter("cache")
+            chunks.append(cached.text)
+            yield _sse("token", {"text": cached.text})
+            for field_name, value in tracker.feed(cached.text):
+                yield _sse(field_name, {"value": value})
+        else:
+            usage = TokenUsage()
+            
+            async def open_stream():
+                stream_response = await client.chat.completions.create(
+                    model=plan["model"],
+                    messages=plan["messages"],
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **plan["params"]
+                )
+                try:
+                    async for chunk in stream_response:
+                        yield chunk
+                finally:
+                    # Chiude la connessione: su annullamento il provider smette di generare
+                    await stream_response.close()
+            
+            with registry.track(client):
+                async for chunk in default_resilience().stream(
+                    open_stream, _iteration_estimate(plan), model=plan["model"]
+                ):
+                    if chunk.usage:
+                        usage = usage_from_response(chunk)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    chunks.append(delta)
+                    progress.completion_chars += len(delta)
+                    yield _sse("token", {"text": delta})
+                    for field_name, value in tracker.feed(delta):
+                        yield _sse(field_name, {"value": value})
+            if cache_key:
+                await run_blocking(llm_cache.put, cache_key, "".join(chunks), usage)
+        for field_name, value in tracker.close():
+            yield _sse(field_name, {"value": value})
         
-        new_content = response.choices[0].message.content
+        logger.info("✅ Contenuto iterato con successo", extra={"section": plan["section"]})
+        yield _sse("done", {
+            "success": True,
+            "content": _apply_iteration(plan, current_content, "".join(chunks)),
+            "instruction": instruction,
+            "section": plan["section"],
+            "cache_hit": cached is not None
+        })
+    except asyncio.CancelledError:
+        default_cancellation_stats().record(DISCONNECT, progress)
+        raise
+    except ProviderUnavailable as e:
+        yield _sse("error", _unavailable_event(e))
+    except Exception as e:
+        logger.exception(f"❌ Errore iterazione: {e}")
+        yield _sse("error", {"error": f"Errore iterazione: {str(e)}"})
+
+
+async def _run_iteration(client, plan: dict, current_content: str, instruction: str, use_cache: bool) -> dict:
+    """Iterazione in una sola risposta: se viene cancellata il client se n'è andato"""
+    progress = GenerationProgress(stage="llm", completion_tokens=plan["params"]["max_tokens"])
+    try:
+        llm_cache, cache_key = _iteration_cache_key(plan)
+        cached = await run_blocking(llm_cache.get, cache_key) if cache_key and use_cache else None
         
-        # Pulisci eventuali code blocks markdown
-        if new_content.startswith("```"):
-            lines = new_content.split("\n")
-            if lines[0].startswith("```"):
-                lines = lines[1:]
-            if lines[-1].strip() == "```":
-                lines = lines[:-1]
-            new_content = "\n".join(lines)
+        if cached:
+            progress.enter("cache")
+            raw_content = cached.text
+        else:
+            with registry.track(client):
+                response = await default_resilience().call(
+                    lambda: client.chat.completions.create(
+                        model=plan["model"],
+                        messages=plan["messages"],
+                        **plan["params"]
+                    ),
+                    _iteration_estimate(plan),
+                    model=plan["model"]
+                )
+            progress.enter("parse")
+            raw_content = response.choices[0].message.content
+            if cache_key:
+                await run_blocking(
+                    llm_cache.put, cache_key, raw_content, usage_from_response(response)
+                )
+    except asyncio.CancelledError:
+        default_cancellation_stats().record(DISCONNECT, progress)
+        raise
+    
+    new_content = _apply_iteration(plan, current_content, raw_content)
+    
+    logger.info("✅ Contenuto iterato con successo", extra={"section": plan["section"]})
+    
+    return {
+        "success": True,
+        "content": new_content,
+        "instruction": instruction,
+        "section": plan["section"],
+        "cache_hit": cached is not None
+    }
+
+
+@app.post("/api/iterate")
+async def iterate_content(
+    request: Request,
+    response: Response,
+    current_content: str = Form(...),
+    instruction: str = Form(...),
+    stream: bool = Form(False),
+    use_cache: bool = Form(True),
+    section: str = Form(""),
+    idempotency_key: str = Header("")
+):
+    """
+    Itera sul contenuto esistente applicando le modifiche richieste.
+    Prende il contenuto attuale e un'istruzione, restituisce il contenuto modificato.
+    
+    Se l'istruzione riguarda una sola sezione (meta, H1, intro, un H2, FAQ,
+    SEO Keywords) viene inviata al modello solo quella e reinserita nel
+    documento; section forza una sezione ("h2-2") o la riscrittura completa ("full").
+    Con stream=true la risposta è uno stream SSE dei token generati.
+    Le richieste duplicate vengono deduplicate come su /api/generate.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise HTTPException(500, "OpenAI API key not configured")
+    
+    if not current_content.strip():
+        raise HTTPException(400, "Contenuto vuoto")
+    
+    if not instruction.strip():
+        raise HTTPException(400, "Istruzione vuota")
+    
+    set_work_owner(_session_user(request), INTERACTIVE)
+    set_usage_context("iterate")
+    store = default_idempotency_store()
+    key, fingerprint, role, window = _idempotency_key(
+        "iterate:stream" if stream else "iterate",
+        {
+            "current_content": current_content,
+            "instruction": instruction,
+            "section": section.strip(),
+            "use_cache": use_cache
+        },
+        idempotency_key
+    )
+    
+    try:
+        client = registry.get_async_openai(api_key)
+        plan = _iteration_plan(current_content, instruction, section.strip())
+        plan["model"] = await _budget_model(ITERATE_MODEL)
+
+        logger.info(f"🔄 Iterazione richiesta ({plan['section']}): {instruction[:50]}...")
         
-        print(f"✅ Contenuto iterato con successo")
+        if stream:
+            return StreamingResponse(
+                _cancellable_sse(store.stream(
+                    key, fingerprint,
+                    lambda: _stream_iteration(client, plan, current_content, instruction, use_cache),
+                    failed=_is_error_event,
+                    window=window
+                )),
+                media_type="text/event-stream",
+                headers={**SSE_HEADERS, "Idempotency-Status": role}
+            )
         
-        return {
-            "success": True,
-            "content": new_content,
-            "instruction": instruction
-        }
+        response.headers["Idempotency-Status"] = role
+        return await _cancel_on_disconnect(request, store.call(
+            key, fingerprint,
+            lambda: _run_iteration(client, plan, current_content, instruction, use_cache),
+            window=window
+        ))
         
+    except HTTPException:
+        raise
+    except (ProviderUnavailable, BudgetExceeded) as e:
+        raise _unavailable(e)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Errore iterazione: {e}")
         raise HTTPException(500, f"Errore iterazione: {str(e)}")
 
 
 @app.post("/api/scrape-products")
-async def scrape_products_endpoint(url: str = Form(...)):
+async def scrape_products_endpoint(request: Request, url: str = Form(...)):
     """
     Scrapa i nomi dei prodotti da una pagina categoria e-commerce.
     Supporta WooCommerce, Shopify, Magento, PrestaShop e CMS custom.
@@ -268,8 +1107,10 @@ async def scrape_products_endpoint(url: str = Form(...)):
     if not url.startswith(('http://', 'https://')):
         raise HTTPException(400, "URL non valido")
     
+    set_work_owner(_session_user(request), INTERACTIVE)
+    
     try:
-        result = scrape_products(url)
+        result = await scrape_products_async(url)
         
         if not result.get("success"):
             raise HTTPException(400, result.get("error", "Errore sconosciuto"))
@@ -287,6 +1128,46 @@ async def scrape_products_endpoint(url: str = Form(...)):
         raise HTTPException(500, f"Errore scraping: {str(e)}")
 
 
+MAX_BULK_URLS = 1000
+
+
+@app.post("/api/scrape-products/bulk")
+async def scrape_products_bulk_endpoint(
+    request: Request,
+    urls: str = Form(...),
+    per_domain_concurrency: int = Form(2),
+    delay: float = Form(1.0),
+    respect_robots: bool = Form(True)
+):
+    """
+    Scrapa i prodotti da una lista di URL categoria (uno per riga).
+    Restituisce NDJSON: una riga per URL appena completato, poi le statistiche.
+    Ogni pagina occupa uno slot dello scheduler con priorità batch, a nome
+    dell'utente della sessione.
+    """
+    set_work_owner(_session_user(request), BATCH)
+    url_list = parse_url_list(urls)
+    if not url_list:
+        raise HTTPException(400, "Nessun URL valido")
+    if len(url_list) > MAX_BULK_URLS:
+        raise HTTPException(400, f"Massimo {MAX_BULK_URLS} URL per richiesta")
+    
+    scraper = BulkScraper(
+        policy=DomainPolicy(
+            max_concurrency=max(1, per_domain_concurrency),
+            delay=max(0.0, delay)
+        ),
+        respect_robots=respect_robots,
+        owner=current_owner()
+    )
+    
+    def ndjson_lines():
+        for event in scraper.run(url_list):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)